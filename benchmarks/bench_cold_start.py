@@ -0,0 +1,70 @@
+"""
+Холодный старт: сколько времени проходит до готовности детектора.
+
+    python -m benchmarks.bench_cold_start --runs 5
+
+Каждый сценарий запускается в отдельном интерпретаторе (время включает
+импорты), печатается медиана:
+  pickle   - загрузка sklearn Pipeline из .pkl и первое предсказание (как раньше)
+  compact  - загрузка .npz и первое предсказание без импорта sklearn
+  startup_eager - импорт детектора с синхронной загрузкой модели из .pkl
+  startup_lazy  - импорт детектора с ленивой загрузкой (до start_polling)
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+SCENARIOS = {
+    "pickle": (
+        "from utils.ml_classifier import MLClassifier\n"
+        "c = MLClassifier('{model}')\n"
+        "assert c.load(prefer_compact=False)\n"
+        "c.predict('Забери подарок по ссылке')\n"
+    ),
+    "compact": (
+        "import sys\n"
+        "from utils.ml_classifier import MLClassifier\n"
+        "c = MLClassifier('{model}')\n"
+        "assert c.load()\n"
+        "c.predict('Забери подарок по ссылке')\n"
+        "assert 'sklearn' not in sys.modules, 'sklearn imported on the hot path'\n"
+    ),
+    "startup_eager": (
+        "from utils.detector import BotDetector\n"
+        "BotDetector(ml_model_path='{model}', lazy_ml=True).ml_classifier.load(prefer_compact=False)\n"
+    ),
+    "startup_lazy": (
+        "from utils.detector import BotDetector\n"
+        "BotDetector(ml_model_path='{model}', lazy_ml=True)\n"
+    ),
+}
+
+
+def run_once(code: str) -> float:
+    started = time.perf_counter()
+    subprocess.run([sys.executable, "-c", code], check=True)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="models/bot_detector.pkl")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    # Подготовка: при первой загрузке создаётся компактный .npz
+    subprocess.run(
+        [sys.executable, "-c", f"from utils.ml_classifier import MLClassifier; MLClassifier('{args.model}').load()"],
+        check=True,
+    )
+
+    for name, template in SCENARIOS.items():
+        code = template.format(model=args.model)
+        samples = [run_once(code) for _ in range(args.runs)]
+        print(f"{name:>14}: median={statistics.median(samples) * 1000:7.1f} ms  min={min(samples) * 1000:7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
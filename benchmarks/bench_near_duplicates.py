@@ -0,0 +1,77 @@
+"""
+Рейд шаблонным спамом: сколько проверок (правила + ML) экономит индекс
+почти-дубликатов и во что обходится сам индекс.
+
+    python -m benchmarks.bench_near_duplicates --raid 2000 --templates 5
+
+Поток - обычные сообщения из training_examples.csv вперемешку с --raid
+вариациями --templates шаблонов (другие ссылки, числа, эмодзи, хвосты).
+Отдельно считается, сколько разных обычных сообщений индекс ошибочно
+склеил с чужим кластером.
+"""
+import argparse
+import csv
+import random
+import time
+
+from utils.near_duplicates import NearDuplicateIndex
+from utils.text_preprocessor import preprocessor
+
+TEMPLATES = [
+    "🎁 Раздаю подарки всем подписчикам! Переходи по ссылке {link} и получи приз {n} прямо сейчас",
+    "Заработок от {n} рублей в день без вложений, пиши в личку {user} {tail}",
+    "Бесплатные звёзды телеграм {n} штук каждому, жми {link} пока не закончились{tail}",
+    "Ищу людей в команду, удалённая работа, {n}$ в неделю. Подробности: {user}",
+    "Розыгрыш iPhone {n}! Условия простые: подпишись на {link} и поставь реакцию{tail}",
+]
+TAILS = ["", "!", "!!", " 🔥", " 💰💰", " срочно", " ⚡️ успей"]
+
+
+def variant(template: str, rng: random.Random) -> str:
+    return template.format(
+        link=f"https://t.me/{rng.choice(['gift', 'promo', 'free'])}{rng.randint(0, 9999)}",
+        user=f"@user{rng.randint(0, 99999)}",
+        n=rng.randint(1, 50000),
+        tail=rng.choice(TAILS),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data", default="training_examples.csv")
+    parser.add_argument("--raid", type=int, default=2000)
+    parser.add_argument("--templates", type=int, default=len(TEMPLATES))
+    parser.add_argument("--window", type=int, default=5000)
+    parser.add_argument("--threshold", type=float, default=0.6)
+    parser.add_argument("--min-length", type=int, default=30)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    with open(args.data, encoding="utf-8") as f:
+        chat = list(dict.fromkeys(row[0] for row in csv.reader(f) if row and len(row[0]) >= args.min_length))
+    raid = [("raid", variant(TEMPLATES[i % args.templates], rng)) for i in range(args.raid)]
+    stream = raid + [("chat", text) for text in chat]
+    rng.shuffle(stream)
+
+    index = NearDuplicateIndex(threshold=args.threshold, window=args.window)
+    evaluated = 0
+    chat_clusters = {}
+    started = time.perf_counter()
+    for kind, text in stream:
+        cluster = index.observe(preprocessor.normalize(text))
+        if cluster.verdict is None:
+            evaluated += 1  # полная проверка; её вердикт дальше берут похожие
+            cluster.set_verdict(kind == "raid", None)
+        if kind == "chat":
+            chat_clusters.setdefault(cluster.id, []).append(text)
+    elapsed = time.perf_counter() - started
+
+    merged = sum(len(texts) for texts in chat_clusters.values() if len(texts) > 1)
+    print(f"messages={len(stream)} (raid {len(raid)}, chat {len(chat)})")
+    print(f"  full checks:   {evaluated} ({evaluated / len(stream) * 100:.1f}%)")
+    print(f"  index:         {elapsed / len(stream) * 1e6:.1f} us/msg, {index.summary()}")
+    print(f"  chat merged:   {merged} of {len(chat)} distinct chat messages share a cluster")
+
+
+if __name__ == "__main__":
+    main()
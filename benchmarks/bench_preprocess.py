@@ -0,0 +1,60 @@
+"""
+Предобработка текста для ML: прежние четыре re.sub на текст против
+TextPreprocessor (одна подстановка + кэш коротких текстов).
+
+    python -m benchmarks.bench_preprocess --repeat 50
+
+Тексты - training_examples.csv, повторённые --repeat раз (как поток чата,
+где короткие реплики повторяются). Результаты обоих вариантов сверяются.
+"""
+import argparse
+import csv
+import re
+import time
+
+from utils.text_preprocessor import TextPreprocessor
+
+
+def legacy_preprocess(texts):
+    """Прежняя реализация MLClassifier._preprocess_text"""
+    processed = []
+    for text in texts:
+        if not text:
+            processed.append("")
+            continue
+        text = text.lower()
+        text = re.sub(r'https?://\S+|t\.me/\S+|telegram\.me/\S+', ' [URL] ', text)
+        text = re.sub(r'@\w+', ' [USER] ', text)
+        text = re.sub(r'\d+', ' [NUM] ', text)
+        text = re.sub(r'\s+', ' ', text).strip()
+        processed.append(text)
+    return processed
+
+
+def per_text_us(fn, texts) -> float:
+    started = time.perf_counter()
+    fn(texts)
+    return (time.perf_counter() - started) / len(texts) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data", default="training_examples.csv")
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    with open(args.data, encoding="utf-8") as f:
+        texts = [row[0] for row in csv.reader(f) if row] * args.repeat
+
+    preprocessor = TextPreprocessor()
+    mismatches = sum(a != b for a, b in zip(legacy_preprocess(texts), preprocessor.normalize_batch(texts)))
+
+    no_memo = TextPreprocessor(memo_max_length=-1)
+    print(f"texts={len(texts)} mismatches={mismatches}")
+    print(f"  legacy:  {per_text_us(legacy_preprocess, texts):6.2f} us/text")
+    print(f"  no memo: {per_text_us(no_memo.normalize_batch, texts):6.2f} us/text")
+    print(f"  memo:    {per_text_us(TextPreprocessor().normalize_batch, texts):6.2f} us/text")
+
+
+if __name__ == "__main__":
+    main()
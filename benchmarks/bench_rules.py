@@ -0,0 +1,73 @@
+"""
+Микробенчмарк rule-based детекции по training_examples.csv.
+
+    python -m benchmarks.bench_rules --repeat 50
+
+Сравнивает последовательную проверку (исключения -> regex -> функции-паттерны)
+со скомпилированным RuleEngine, проверяет совпадение вердиктов и печатает
+задержку на сообщение.
+"""
+import argparse
+import asyncio
+import csv
+import statistics
+import time
+from typing import List
+
+from utils.detector import BotDetector
+
+
+def load_texts(path: str) -> List[str]:
+    with open(path, encoding="utf-8") as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        return [row[0] for row in reader if row and row[0]]
+
+
+def report(name: str, samples: List[float]):
+    samples = sorted(samples)
+    p99 = samples[int(len(samples) * 0.99) - 1]
+    print(
+        f"{name:>8}: mean={statistics.fmean(samples) * 1e6:7.2f}us "
+        f"p50={statistics.median(samples) * 1e6:7.2f}us p99={p99 * 1e6:7.2f}us"
+    )
+
+
+async def run(texts: List[str], repeat: int):
+    detector = BotDetector(use_ml=False, use_rule_engine=True)
+    engine = detector.rule_engine
+
+    mismatches = 0
+    for text in texts:
+        legacy = await detector._check_rules_legacy(text, {})
+        excluded, rule = engine.evaluate(text)
+        if legacy != (excluded, rule is not None):
+            mismatches += 1
+            print(f"MISMATCH: {text!r} legacy={legacy} engine={(excluded, rule)}")
+    print(f"messages={len(texts)} mismatches={mismatches}")
+
+    legacy_samples, engine_samples = [], []
+    for _ in range(repeat):
+        for text in texts:
+            start = time.perf_counter()
+            await detector._check_rules_legacy(text, {})
+            legacy_samples.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            engine.evaluate(text)
+            engine_samples.append(time.perf_counter() - start)
+
+    report("legacy", legacy_samples)
+    report("engine", engine_samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--csv", default="training_examples.csv")
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(run(load_texts(args.csv), args.repeat))
+
+
+if __name__ == "__main__":
+    main()
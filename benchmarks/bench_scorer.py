@@ -0,0 +1,63 @@
+"""
+Скорость ML-инференса на пачку: sklearn Pipeline, CompactScorer (словарь)
+и HashedScorer (хэшированные n-граммы).
+
+    python -m benchmarks.bench_scorer --batch 64 --rounds 200
+
+Обе модели обучаются во временной директории на training_examples.csv.
+Проверяется, что скореры совпадают со своими пайплайнами, и печатается
+время на сообщение и размер .npz.
+"""
+import argparse
+import csv
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from utils.ml_classifier import MLClassifier
+
+
+def load_examples(path: str):
+    texts, labels = [], []
+    with open(path, encoding="utf-8") as f:
+        for row in csv.reader(f):
+            if len(row) == 2 and row[1].strip() in ("0", "1"):
+                texts.append(row[0])
+                labels.append(int(row[1]))
+    return texts, labels
+
+
+def per_message_us(fn, batch, rounds: int) -> float:
+    fn(batch)
+    started = time.perf_counter()
+    for _ in range(rounds):
+        fn(batch)
+    return (time.perf_counter() - started) / rounds / len(batch) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data", default="training_examples.csv")
+    parser.add_argument("--batch", type=int, default=64)
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    texts, labels = load_examples(args.data)
+    workdir = tempfile.mkdtemp()
+    for features in MLClassifier.FEATURES:
+        classifier = MLClassifier(os.path.join(workdir, features, "model.pkl"), features=features)
+        classifier.train(texts, labels)
+        processed = classifier._preprocess_text(texts)
+        diff = np.abs(classifier.pipeline.decision_function(processed)
+                      - classifier.scorer.decision_function(processed)).max()
+        batch = (processed * (args.batch // len(processed) + 1))[:args.batch]
+        size_kb = os.path.getsize(classifier.store.compact_path) / 1024
+        print(f"{features:>7}: sklearn={per_message_us(classifier.pipeline.predict_proba, batch, args.rounds):6.1f} us/msg  "
+              f"{type(classifier.scorer).__name__}={per_message_us(classifier.scorer.predict_batch, batch, args.rounds):6.1f} us/msg  "
+              f"npz={size_kb:7.1f} KB  max|diff|={diff:.1e}")
+
+
+if __name__ == "__main__":
+    main()
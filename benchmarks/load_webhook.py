@@ -0,0 +1,92 @@
+"""
+Нагрузочный тест вебхука: синтетические апдейты-сообщения POST-запросами,
+как их доставляет Telegram (до --connections одновременно).
+
+    BOT_MODE=webhook python main.py          # без RENDER_EXTERNAL_URL вебхук не регистрируется
+    python -m benchmarks.load_webhook --updates 5000 --connections 40
+
+Тексты - training_examples.csv. Считаются ответы по кодам (503 - очередь
+полна, Telegram повторил бы доставку) и время ответа сервера; скорость
+обработки видна в /mm_status и на GET / ("Входящие апдейты").
+"""
+import argparse
+import asyncio
+import csv
+import itertools
+import os
+import time
+
+import aiohttp
+
+
+def make_update(update_id: int, chat_id: int, text: str) -> dict:
+    user_id = 10_000_000 + update_id % 5000
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "supergroup", "title": "Load test"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "Load", "username": f"load{user_id}"},
+            "text": text,
+        },
+    }
+
+
+def percentile(values, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))] if ordered else 0.0
+
+
+async def run(args, texts):
+    statuses = {}
+    latencies = []
+    ids = itertools.count(args.first_id)
+    headers = {"X-Telegram-Bot-Api-Secret-Token": args.secret} if args.secret else {}
+
+    async def sender(session: aiohttp.ClientSession):
+        while True:
+            update_id = next(ids)
+            if update_id >= args.first_id + args.updates:
+                return
+            payload = make_update(update_id, args.chat_id, texts[update_id % len(texts)])
+            started = time.perf_counter()
+            try:
+                async with session.post(args.url, json=payload, headers=headers) as response:
+                    await response.read()
+                    status = response.status
+            except aiohttp.ClientError as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - started)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    started = time.perf_counter()
+    async with aiohttp.ClientSession() as session:
+        await asyncio.gather(*(sender(session) for _ in range(args.connections)))
+    elapsed = time.perf_counter() - started
+
+    print(f"updates={args.updates} connections={args.connections} in {elapsed:.2f} s "
+          f"({args.updates / elapsed:.0f} updates/s)")
+    print(f"  statuses: {statuses}")
+    print(f"  response: p50 {percentile(latencies, 0.5) * 1000:.1f} ms, "
+          f"p99 {percentile(latencies, 0.99) * 1000:.1f} ms, max {max(latencies) * 1000:.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=f"http://127.0.0.1:{os.getenv('PORT', '8080')}{os.getenv('WEBHOOK_PATH', '/webhook')}")
+    parser.add_argument("--secret", default=os.getenv("WEBHOOK_SECRET"))
+    parser.add_argument("--chat-id", type=int, default=int(os.getenv("CHANNEL_ID", "-100123")))
+    parser.add_argument("--data", default="training_examples.csv")
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--connections", type=int, default=40)
+    parser.add_argument("--first-id", type=int, default=int(time.time()))
+    args = parser.parse_args()
+
+    with open(args.data, encoding="utf-8") as f:
+        texts = [row[0] for row in csv.reader(f) if row]
+    asyncio.run(run(args, texts))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,20 @@
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
-from config import BOT_TOKEN
+from config import (
+    BOT_TOKEN, TG_GLOBAL_RATE, TG_CHAT_RATE, TG_CHAT_BURST, UPDATE_WORKERS, UPDATE_QUEUE_SIZE, UPDATE_PUT_TIMEOUT,
+    UPDATE_PER_CHAT,
+)
+from utils.telegram_scheduler import TelegramScheduler
+from utils.update_queue import UpdateQueue
 
 bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
-dp = Dispatcher()
\ No newline at end of file
+dp = Dispatcher()
+
+# Все исходящие действия модерации идут через общую очередь с лимитами Telegram
+api = TelegramScheduler(global_rate=TG_GLOBAL_RATE, global_burst=TG_GLOBAL_RATE,
+                        chat_rate=TG_CHAT_RATE, chat_burst=TG_CHAT_BURST)
+
+# Входящие апдейты (вебхук и polling): ограниченная очередь по чатам и пул обработчиков
+updates = UpdateQueue(dp, bot, workers=UPDATE_WORKERS, maxsize=UPDATE_QUEUE_SIZE, put_timeout=UPDATE_PUT_TIMEOUT,
+                      per_chat=UPDATE_PER_CHAT or None)
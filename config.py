@@ -6,6 +6,66 @@ load_dotenv()
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
+SUPABASE_MAX_CONCURRENCY = int(os.getenv("SUPABASE_MAX_CONCURRENCY", "20"))  # одновременных запросов к Supabase
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "supabase")  # supabase | sqlite
+SQLITE_PATH = os.getenv("SQLITE_PATH", "data/bot.sqlite3")  # файл базы для STORAGE_BACKEND=sqlite
+TRUSTED_NEGATIVE_TTL = float(os.getenv("TRUSTED_NEGATIVE_TTL", "600"))  # сек. кэширования "не доверенный"
+SUSPECT_REGISTRY_SIZE = int(os.getenv("SUSPECT_REGISTRY_SIZE", "20000"))  # подозреваемых в памяти для кнопок модерации
+WRITE_FLUSH_INTERVAL_MS = float(os.getenv("WRITE_FLUSH_INTERVAL_MS", "500"))  # макс. задержка отложенной записи в БД
+WRITE_FLUSH_ROWS = int(os.getenv("WRITE_FLUSH_ROWS", "200"))  # записей, после которых пачка уходит сразу
+WRITE_SPOOL_PATH = os.getenv("WRITE_SPOOL_PATH", "data/spool/db_writes.jsonl")  # записи, не дошедшие до БД; переигрываются при старте
+WRITE_DEAD_LETTER_PATH = os.getenv("WRITE_DEAD_LETTER_PATH", "data/spool/db_writes.dead.jsonl")  # записи, отклонённые БД (ошибка данных/схемы) - для разбора вручную
+TRAINING_STATS_REFRESH = float(os.getenv("TRAINING_STATS_REFRESH", "300"))  # сек. между сверками счётчиков обучающих примеров с БД
+TRAINING_INSERT_BATCH = int(os.getenv("TRAINING_INSERT_BATCH", "500"))  # строк в одном INSERT при загрузке CSV
+TRAINING_INSERT_CONCURRENCY = int(os.getenv("TRAINING_INSERT_CONCURRENCY", "4"))  # одновременных INSERT при загрузке CSV
+TRAINING_INGEST_DIR = os.getenv("TRAINING_INGEST_DIR", "data/ingest")  # загруженные CSV и чекпоинты для продолжения
+TRAINING_CHUNK_SIZE = int(os.getenv("TRAINING_CHUNK_SIZE", "1000"))  # примеров в одной порции дообучения
+TRAINING_AUTO_THRESHOLD = int(os.getenv("TRAINING_AUTO_THRESHOLD", "50"))  # новых размеченных примеров до фонового дообучения (0 - выкл.)
+TRAINING_AUTO_INTERVAL = float(os.getenv("TRAINING_AUTO_INTERVAL", "3600"))  # сек. между плановыми запусками дообучения
+TG_GLOBAL_RATE = float(os.getenv("TG_GLOBAL_RATE", "25"))  # исходящих запросов к Telegram в секунду на бота
+TG_CHAT_RATE = float(os.getenv("TG_CHAT_RATE", "1"))  # новых сообщений в секунду в один чат (баны и удаления не ограничены)
+TG_CHAT_BURST = float(os.getenv("TG_CHAT_BURST", "3"))  # запас сообщений в чат для коротких всплесков
+DIGEST_BURST_THRESHOLD = int(os.getenv("DIGEST_BURST_THRESHOLD", "5"))  # подозрительных за окно, после которых включается дайджест (0 - выкл.)
+DIGEST_WINDOW = float(os.getenv("DIGEST_WINDOW", "10"))  # окно подсчёта всплеска, сек.
+DIGEST_MAX_ITEMS = int(os.getenv("DIGEST_MAX_ITEMS", "20"))  # подозреваемых в одном дайджесте
+DIGEST_FLUSH_DELAY = float(os.getenv("DIGEST_FLUSH_DELAY", "3"))  # макс. ожидание неполного дайджеста, сек.
+USE_RULE_ENGINE = os.getenv("USE_RULE_ENGINE", "1") == "1"  # скомпилированный движок правил
+DETECTION_POLICY = os.getenv("DETECTION_POLICY", "rules_then_ml")  # rules_only | rules_then_ml | ml_above_length | always_both
+ML_MIN_LENGTH = int(os.getenv("ML_MIN_LENGTH", "40"))  # порог длины для ml_above_length
+ML_BATCH_SIZE = int(os.getenv("ML_BATCH_SIZE", "64"))  # макс. размер пачки ML (1 - без батчинга)
+ML_BATCH_DELAY_MS = float(os.getenv("ML_BATCH_DELAY_MS", "5"))  # сколько ждать соседей по пачке
+ML_BACKEND = os.getenv("ML_BACKEND", "thread")  # thread | process (пул процессов в обход GIL)
+ML_POOL_SIZE = int(os.getenv("ML_POOL_SIZE", "2"))  # процессов инференса
+ML_QUEUE_DEPTH = int(os.getenv("ML_QUEUE_DEPTH", "8"))  # пачек, одновременно отправленных в пул
+ML_CONFIDENCE_ON_CARD = os.getenv("ML_CONFIDENCE_ON_CARD", "0") == "1"  # досчитывать ML для карточки, если правила решили без него (стоит инференса на каждое подозрительное)
+ML_FEATURES = os.getenv("ML_FEATURES", "vocab")  # vocab | hashed (хэшированные n-граммы без словаря)
+ML_HASH_FEATURES = int(os.getenv("ML_HASH_FEATURES", str(2 ** 18)))  # размер пространства хэшированных признаков
+ML_EVALUATION = os.getenv("ML_EVALUATION", "holdout")  # holdout | kfold | none - оценка при полном обучении
+ML_EVAL_FOLDS = int(os.getenv("ML_EVAL_FOLDS", "5"))  # фолдов для kfold
+ML_CONFIDENCE_THRESHOLD = float(os.getenv("ML_CONFIDENCE_THRESHOLD", "0.7"))  # уверенность ML, с которой сообщение подозрительно
+DEDUP_WINDOW = int(os.getenv("DEDUP_WINDOW", "5000"))  # сообщений в окне поиска почти-дубликатов (0 - выкл.)
+DEDUP_TTL = float(os.getenv("DEDUP_TTL", "3600"))  # сколько секунд сообщение остаётся в окне
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.6"))  # сходство (Жаккар по шинглам), с которого сообщения - один шаблон
+DEDUP_MIN_LENGTH = int(os.getenv("DEDUP_MIN_LENGTH", "30"))  # короче - без кластеризации ("спасибо", "+")
+DEDUP_AUTO_BAN = os.getenv("DEDUP_AUTO_BAN", "0") == "1"  # банить копии шаблона, уже забаненного модератором, без карточки
+REPUTATION_SIZE = int(os.getenv("REPUTATION_SIZE", "100000"))  # авторов в памяти для предфильтра репутации (0 - выкл.)
+REPUTATION_NEW_USER_WINDOW = float(os.getenv("REPUTATION_NEW_USER_WINDOW", "60"))  # сек. после входа, когда ссылка новичка сразу подозрительна
+REPUTATION_FLOOD_RATE = float(os.getenv("REPUTATION_FLOOD_RATE", "10"))  # сообщений в минуту с повторами, после которых автор - флудер
+REPUTATION_VETERAN_MESSAGES = int(os.getenv("REPUTATION_VETERAN_MESSAGES", "20"))  # чистых сообщений, после которых автор проверяется без ML
+REPUTATION_VETERAN_DAYS = float(os.getenv("REPUTATION_VETERAN_DAYS", "7"))  # дней с первого появления для проверки без ML
+REPUTATION_FLUSH_INTERVAL = float(os.getenv("REPUTATION_FLUSH_INTERVAL", "60"))  # сек. между сохранениями репутации в хранилище
 CHANNEL_ID = os.getenv("CHANNEL_ID")
 BAN_LIST_CHAT_ID = int(os.getenv("BAN_LIST_CHAT_ID")) if os.getenv("BAN_LIST_CHAT_ID") and os.getenv("BAN_LIST_CHAT_ID").lstrip('-').isdigit() else os.getenv("BAN_LIST_CHAT_ID")
-RENDER_EXTERNAL_URL = os.getenv("RENDER_EXTERNAL_URL")  # Обязательно для вебхуков!
\ No newline at end of file
+CHANNEL_CHAT_ID = int(CHANNEL_ID) if CHANNEL_ID and CHANNEL_ID.lstrip('-').isdigit() else None  # числовой id отслеживаемого по умолчанию чата
+MONITOR_UNLISTED_CHATS = os.getenv("MONITOR_UNLISTED_CHATS", "1") == "1"  # проверять чаты без строки в chat_settings с настройками по умолчанию
+RENDER_EXTERNAL_URL = os.getenv("RENDER_EXTERNAL_URL")  # Обязательно для вебхуков!
+BOT_MODE = os.getenv("BOT_MODE", "polling")  # polling | webhook (вебхук включается только явно)
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")  # путь вебхука на нашем сервере
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")  # секрет заголовка X-Telegram-Bot-Api-Secret-Token
+WEBHOOK_PORT = int(os.getenv("PORT", "8080"))  # порт HTTP-сервера (Render передаёт его в PORT)
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))  # одновременных доставок от Telegram
+UPDATE_WORKERS = int(os.getenv("UPDATE_WORKERS", "16"))  # обработчиков апдейтов
+UPDATE_QUEUE_SIZE = int(os.getenv("UPDATE_QUEUE_SIZE", "1000"))  # апдейтов в очереди (вебхук и polling)
+UPDATE_PUT_TIMEOUT = float(os.getenv("UPDATE_PUT_TIMEOUT", "2"))  # сек. ожидания места в очереди, дальше 503
+UPDATE_DRAIN_TIMEOUT = float(os.getenv("UPDATE_DRAIN_TIMEOUT", "20"))  # сек. на доработку очереди при остановке
+UPDATE_PER_CHAT = int(os.getenv("UPDATE_PER_CHAT", "0"))  # обработчиков на один чат (0 - четверть UPDATE_WORKERS)
\ No newline at end of file
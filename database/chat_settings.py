@@ -0,0 +1,95 @@
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+
+class ChatSettings:
+    """Настройки модерации одного отслеживаемого чата"""
+    __slots__ = ('chat_id', 'ban_list_chat_id', 'policy', 'ml_threshold', 'ml_min_length', 'model_path')
+
+    def __init__(self, chat_id: Optional[int], ban_list_chat_id: Optional[int], policy: str, ml_threshold: float,
+                 ml_min_length: int, model_path: Optional[str] = None):
+        self.chat_id = chat_id
+        self.ban_list_chat_id = ban_list_chat_id
+        self.policy = policy
+        self.ml_threshold = ml_threshold
+        self.ml_min_length = ml_min_length
+        self.model_path = model_path  # None - общая модель бота
+
+    @property
+    def detector_key(self) -> tuple:
+        """Чаты с одинаковым ключом делят один экземпляр детектора"""
+        return self.model_path, self.policy, self.ml_threshold, self.ml_min_length
+
+
+class ChatSettingsCache:
+    """
+    Настройки всех отслеживаемых чатов в памяти процесса.
+
+    Загружаются целиком из таблицы chat_settings при старте (и по
+    /reload_chats); пустые поля строки берутся из default - настроек из
+    переменных окружения. Чат default (CHANNEL_ID) отслеживается всегда,
+    даже если таблицы нет. Чаты без строки в таблице при monitor_unlisted
+    проверяются с настройками default, как до появления таблицы; строка с
+    enabled = false выключает чат, ban-list чаты не проверяются никогда.
+    """
+
+    def __init__(self, default: ChatSettings, monitor_unlisted: bool = True):
+        self.default = default
+        self.monitor_unlisted = monitor_unlisted
+        self._chats: Dict[int, ChatSettings] = {}
+        self._disabled: Set[int] = set()
+        self._ban_lists: Set[Any] = set()
+        self._reset()
+
+    def _reset(self):
+        self._chats = {}
+        self._disabled = set()
+        self._ban_lists = {self.default.ban_list_chat_id}
+        if self.default.chat_id is not None:
+            self._chats[self.default.chat_id] = self.default
+
+    def load(self, rows: Iterable[Dict[str, Any]]):
+        """Полностью заменяет настройки чатов строками таблицы chat_settings"""
+        self._reset()
+        default = self.default
+        for row in rows:
+            chat_id = int(row["chat_id"])
+            if not row.get("enabled", True):
+                self._chats.pop(chat_id, None)
+                self._disabled.add(chat_id)
+                continue
+
+            def field(name, fallback):
+                value = row.get(name)
+                return fallback if value is None else value
+
+            ban_list_chat_id = field("ban_list_chat_id", default.ban_list_chat_id)
+            if ban_list_chat_id is None:
+                continue  # некуда отправлять карточки
+            self._chats[chat_id] = ChatSettings(
+                chat_id=chat_id,
+                ban_list_chat_id=int(ban_list_chat_id),
+                policy=field("policy", default.policy),
+                ml_threshold=float(field("ml_threshold", default.ml_threshold)),
+                ml_min_length=int(field("ml_min_length", default.ml_min_length)),
+                model_path=row.get("model_path"),
+            )
+            self._ban_lists.add(int(ban_list_chat_id))
+
+    @property
+    def unlisted_enabled(self) -> bool:
+        """Проверяются ли чаты без строки в таблице (нужен ban-list чат по умолчанию)"""
+        return self.monitor_unlisted and self.default.ban_list_chat_id is not None
+
+    def get(self, chat_id: int) -> Optional[ChatSettings]:
+        """Настройки чата или None, если чат не отслеживается"""
+        settings = self._chats.get(chat_id)
+        if settings is None and self.unlisted_enabled \
+                and chat_id not in self._disabled and chat_id not in self._ban_lists:
+            return self.default
+        return settings
+
+    def all(self) -> List[ChatSettings]:
+        return list(self._chats.values())
+
+    def __len__(self) -> int:
+        return len(self._chats)
@@ -0,0 +1,273 @@
+import asyncio
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from database.storage import StorageBackend
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS trusted_users (
+    user_id INTEGER PRIMARY KEY,
+    username TEXT,
+    full_name TEXT,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS chat_settings (
+    chat_id INTEGER PRIMARY KEY,
+    ban_list_chat_id INTEGER,
+    policy TEXT,
+    ml_threshold REAL,
+    ml_min_length INTEGER,
+    model_path TEXT,
+    enabled INTEGER NOT NULL DEFAULT 1
+);
+CREATE TABLE IF NOT EXISTS ban_list (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    chat_id INTEGER,
+    message_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    username TEXT,
+    full_name TEXT,
+    suspect_message TEXT,
+    ml_confidence REAL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    token TEXT UNIQUE,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS ban_list_user_id ON ban_list (user_id);
+CREATE INDEX IF NOT EXISTS ban_list_message_status ON ban_list (message_id, status);
+CREATE TABLE IF NOT EXISTS training_examples (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    text TEXT NOT NULL,
+    label INTEGER NOT NULL,
+    moderated_by INTEGER,
+    processed INTEGER NOT NULL DEFAULT 0,
+    token TEXT,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS training_examples_processed ON training_examples (processed, id);
+CREATE TABLE IF NOT EXISTS user_reputation (
+    user_id INTEGER PRIMARY KEY,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL,
+    messages INTEGER NOT NULL DEFAULT 0,
+    clean INTEGER NOT NULL DEFAULT 0,
+    flags INTEGER NOT NULL DEFAULT 0,
+    last_flag REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS user_reputation_last_seen ON user_reputation (last_seen);
+"""
+
+_BAN_LIST_COLUMNS = (
+    "chat_id", "message_id", "user_id", "username", "full_name", "suspect_message", "ml_confidence", "status", "token",
+)
+_REPUTATION_COLUMNS = (
+    "user_id", "first_seen", "last_seen", "messages", "clean", "flags", "last_flag",
+)
+# Столбцы, которые фильтр может сравнивать в count_training_examples
+_COUNT_FILTERS = {"label", "processed"}
+# Переменных в одном запросе SQLite (старые сборки - не больше 999)
+_VARIABLES_CHUNK = 500
+
+
+class SqliteStorage(StorageBackend):
+    """
+    Таблицы в локальном файле SQLite: без сети, для одного процесса бота и
+    для работы офлайн. Журнал WAL - чтения не ждут записи. Все запросы идут
+    через одно соединение в отдельном потоке, поэтому event loop не
+    блокируется, а запись не конкурирует сама с собой.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str):
+        self.path = path
+        self._connection: Optional[sqlite3.Connection] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            connection = sqlite3.connect(self.path)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA journal_mode=WAL")
+            # В WAL synchronous=NORMAL не теряет целостность, только последние транзакции при сбое питания
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(SCHEMA)
+            self._migrate(connection)
+            self._connection = connection
+        return self._connection
+
+    @staticmethod
+    def _migrate(connection: sqlite3.Connection):
+        """Столбцы, появившиеся после создания файла базы"""
+        columns = {row["name"] for row in connection.execute("PRAGMA table_info(training_examples)")}
+        if "token" not in columns:
+            connection.execute("ALTER TABLE training_examples ADD COLUMN token TEXT")
+        # ALTER TABLE не добавляет UNIQUE - уникальность через индекс (NULL не конфликтуют)
+        connection.execute("CREATE UNIQUE INDEX IF NOT EXISTS training_examples_token ON training_examples (token)")
+        connection.commit()
+
+    async def _call(self, work: Callable[[sqlite3.Connection], Any]):
+        def run():
+            connection = self._connect()
+            with connection:  # транзакция: commit или rollback
+                return work(connection)
+
+        return await asyncio.get_running_loop().run_in_executor(self._executor, run)
+
+    async def _fetch(self, sql: str, params: tuple = ()) -> List[Dict[str, Any]]:
+        return await self._call(lambda db: [dict(row) for row in db.execute(sql, params)])
+
+    def is_permanent_error(self, error: BaseException) -> bool:
+        # Занятая база и ошибки ввода-вывода проходят, остальное - данные или схема
+        if isinstance(error, (sqlite3.IntegrityError, sqlite3.ProgrammingError, sqlite3.InterfaceError,
+                              sqlite3.DataError)):
+            return True
+        if isinstance(error, sqlite3.OperationalError):
+            message = str(error).lower()
+            return not any(word in message for word in ("locked", "busy", "disk", "i/o"))
+        return False
+
+    async def ping(self):
+        await self._call(lambda db: db.execute("SELECT 1").fetchone())
+
+    async def close(self):
+        def close():
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+        await asyncio.get_running_loop().run_in_executor(self._executor, close)
+        self._executor.shutdown(wait=False)
+
+    async def load_trusted_user_ids(self) -> List[int]:
+        return await self._call(lambda db: [row[0] for row in db.execute("SELECT user_id FROM trusted_users")])
+
+    async def is_trusted(self, user_id: int) -> bool:
+        return await self._call(
+            lambda db: db.execute("SELECT 1 FROM trusted_users WHERE user_id = ?", (user_id,)).fetchone() is not None
+        )
+
+    async def upsert_trusted_user(self, row: Dict[str, Any]):
+        await self._call(lambda db: db.execute(
+            "INSERT INTO trusted_users (user_id, username, full_name) VALUES (?, ?, ?) "
+            "ON CONFLICT (user_id) DO UPDATE SET username = excluded.username, full_name = excluded.full_name",
+            (row["user_id"], row.get("username"), row.get("full_name")),
+        ))
+
+    async def load_chat_settings(self) -> List[Dict[str, Any]]:
+        return await self._fetch("SELECT * FROM chat_settings")
+
+    async def insert_suspects(self, rows: List[Dict[str, Any]]):
+        placeholders = ", ".join("?" * len(_BAN_LIST_COLUMNS))
+        values = [tuple(row.get(column) for column in _BAN_LIST_COLUMNS) for row in rows]
+        await self._call(lambda db: db.executemany(
+            f"INSERT INTO ban_list ({', '.join(_BAN_LIST_COLUMNS)}) VALUES ({placeholders}) "
+            f"ON CONFLICT (token) DO NOTHING",
+            values
+        ))
+
+    async def get_suspect(self, token: Optional[str] = None, message_id: Optional[int] = None,
+                          chat_id: Optional[int] = None, status: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        if token:
+            where, params = ["token = ?"], [token]
+        else:
+            where, params = ["message_id = ?"], [message_id]
+            if chat_id is not None:
+                where.append("chat_id = ?")
+                params.append(chat_id)
+        if status is not None:
+            where.append("status = ?")
+            params.append(status)
+        rows = await self._fetch(f"SELECT * FROM ban_list WHERE {' AND '.join(where)} LIMIT 1", tuple(params))
+        return rows[0] if rows else None
+
+    async def get_suspects(self, message_ids: List[int], chat_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        def select(db):
+            rows = []
+            for start in range(0, len(message_ids), _VARIABLES_CHUNK):
+                chunk = message_ids[start:start + _VARIABLES_CHUNK]
+                sql = (
+                    f"SELECT chat_id, message_id, user_id, suspect_message FROM ban_list "
+                    f"WHERE message_id IN ({', '.join('?' * len(chunk))})"
+                )
+                params = list(chunk)
+                if chat_id is not None:
+                    sql += " AND chat_id = ?"
+                    params.append(chat_id)
+                rows.extend(dict(row) for row in db.execute(sql, params))
+            return rows
+
+        return await self._call(select)
+
+    async def update_suspects_status(self, status: str, tokens: Optional[List[str]] = None,
+                                     message_ids: Optional[List[int]] = None, chat_id: Optional[int] = None):
+        column, values = ("token", tokens) if tokens else ("message_id", message_ids or [])
+
+        def update(db):
+            for start in range(0, len(values), _VARIABLES_CHUNK):
+                chunk = values[start:start + _VARIABLES_CHUNK]
+                sql = f"UPDATE ban_list SET status = ? WHERE {column} IN ({', '.join('?' * len(chunk))})"
+                params = [status, *chunk]
+                if chat_id is not None:
+                    sql += " AND chat_id = ?"
+                    params.append(chat_id)
+                db.execute(sql, params)
+
+        await self._call(update)
+
+    async def insert_training_examples(self, rows: List[Dict[str, Any]]):
+        values = [
+            (row["text"], row["label"], row.get("moderated_by"), int(bool(row.get("processed"))), row.get("token"))
+            for row in rows
+        ]
+        await self._call(lambda db: db.executemany(
+            "INSERT INTO training_examples (text, label, moderated_by, processed, token) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (token) DO NOTHING",
+            values
+        ))
+
+    async def unprocessed_training_page(self, after_id: int, limit: int) -> List[Dict[str, Any]]:
+        return await self._fetch(
+            "SELECT id, text, label FROM training_examples WHERE processed = 0 AND id > ? ORDER BY id LIMIT ?",
+            (after_id, limit),
+        )
+
+    async def mark_training_processed(self, ids: List[int]) -> int:
+        def update(db):
+            changed = 0
+            for start in range(0, len(ids), _VARIABLES_CHUNK):
+                chunk = ids[start:start + _VARIABLES_CHUNK]
+                changed += db.execute(
+                    f"UPDATE training_examples SET processed = 1 WHERE id IN ({', '.join('?' * len(chunk))}) "
+                    f"AND processed = 0",
+                    chunk,
+                ).rowcount
+            return changed
+
+        return await self._call(update)
+
+    async def count_training_examples(self, **filters) -> int:
+        unknown = set(filters) - _COUNT_FILTERS
+        if unknown:
+            raise ValueError(f"Неизвестные фильтры: {unknown}")
+        where = " AND ".join(f"{column} = ?" for column in filters) or "1"
+        params = tuple(int(value) for value in filters.values())
+        return await self._call(
+            lambda db: db.execute(f"SELECT COUNT(*) FROM training_examples WHERE {where}", params).fetchone()[0]
+        )
+
+    async def load_user_reputation(self, limit: int) -> List[Dict[str, Any]]:
+        return await self._fetch("SELECT * FROM user_reputation ORDER BY last_seen DESC LIMIT ?", (limit,))
+
+    async def upsert_user_reputation(self, rows: List[Dict[str, Any]]):
+        updates = ", ".join(f"{column} = excluded.{column}" for column in _REPUTATION_COLUMNS[1:])
+        values = [tuple(row[column] for column in _REPUTATION_COLUMNS) for row in rows]
+        await self._call(lambda db: db.executemany(
+            f"INSERT INTO user_reputation ({', '.join(_REPUTATION_COLUMNS)}) "
+            f"VALUES ({', '.join('?' * len(_REPUTATION_COLUMNS))}) ON CONFLICT (user_id) DO UPDATE SET {updates}",
+            values
+        ))
@@ -0,0 +1,100 @@
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional
+
+
+class StorageBackend(ABC):
+    """
+    Хранилище бота: таблицы trusted_users, chat_settings, ban_list,
+    training_examples и user_reputation. Database держит над ним кэши и очередь записи;
+    бэкенд только выполняет запросы. Все методы пробрасывают ошибки.
+    """
+
+    name: str = ""
+    # Есть ли в ban_list столбец token; без него статусы пишутся по сообщению
+    stores_suspect_tokens: bool = True
+
+    @abstractmethod
+    async def ping(self):
+        """Реальный запрос к хранилищу (проверка подключения)"""
+
+    @abstractmethod
+    async def close(self):
+        """Освобождает соединения"""
+
+    async def check_schema(self):
+        """Проверка необязательных столбцов (миграций) при старте; пробрасывает ошибки соединения"""
+
+    def is_permanent_error(self, error: BaseException) -> bool:
+        """Ошибка, которую повтор запроса не исправит (данные, схема); по умолчанию - временная"""
+        return False
+
+    # trusted_users
+
+    @abstractmethod
+    async def load_trusted_user_ids(self) -> List[int]:
+        """Все доверенные"""
+
+    @abstractmethod
+    async def is_trusted(self, user_id: int) -> bool:
+        pass
+
+    @abstractmethod
+    async def upsert_trusted_user(self, row: Dict[str, Any]):
+        """Строка trusted_users (user_id, username, full_name); повтор - обновление"""
+
+    # chat_settings
+
+    @abstractmethod
+    async def load_chat_settings(self) -> List[Dict[str, Any]]:
+        """Все строки chat_settings"""
+
+    # ban_list
+
+    @abstractmethod
+    async def insert_suspects(self, rows: List[Dict[str, Any]]):
+        """Строки ban_list; строка с уже записанным token пропускается"""
+
+    @abstractmethod
+    async def get_suspect(self, token: Optional[str] = None, message_id: Optional[int] = None,
+                          chat_id: Optional[int] = None, status: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Строка ban_list по токену или по сообщению (chat_id, status - доп. фильтры)"""
+
+    @abstractmethod
+    async def get_suspects(self, message_ids: List[int], chat_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        """chat_id, message_id, user_id, suspect_message строк по списку сообщений"""
+
+    @abstractmethod
+    async def update_suspects_status(self, status: str, tokens: Optional[List[str]] = None,
+                                     message_ids: Optional[List[int]] = None, chat_id: Optional[int] = None):
+        """Статус строк ban_list по токенам или по сообщениям (в чате chat_id, если задан)"""
+
+    # training_examples
+
+    @abstractmethod
+    async def insert_training_examples(self, rows: List[Dict[str, Any]]):
+        """
+        Строки training_examples (text, label, moderated_by, processed и
+        необязательный token); строка с уже записанным token пропускается
+        """
+
+    @abstractmethod
+    async def unprocessed_training_page(self, after_id: int, limit: int) -> List[Dict[str, Any]]:
+        """id, text, label необработанных примеров с id > after_id в порядке id"""
+
+    @abstractmethod
+    async def mark_training_processed(self, ids: List[int]) -> int:
+        """Помечает обработанными примеры по списку id; число изменённых"""
+
+    @abstractmethod
+    async def count_training_examples(self, **filters) -> int:
+        """Число примеров с равенством по filters (label, processed)"""
+
+    # user_reputation
+
+    @abstractmethod
+    async def load_user_reputation(self, limit: int) -> List[Dict[str, Any]]:
+        """Не больше limit строк репутации, недавно активные первыми"""
+
+    @abstractmethod
+    async def upsert_user_reputation(self, rows: List[Dict[str, Any]]):
+        """Строки user_reputation; строка уже известного user_id заменяет прежнюю"""
@@ -1,11 +1,172 @@
-from supabase import create_client, Client
-from config import SUPABASE_URL, SUPABASE_KEY
+from config import (
+    STORAGE_BACKEND, SQLITE_PATH,
+    SUPABASE_URL, SUPABASE_KEY, SUPABASE_MAX_CONCURRENCY, TRUSTED_NEGATIVE_TTL, TRAINING_STATS_REFRESH,
+    SUSPECT_REGISTRY_SIZE, WRITE_FLUSH_INTERVAL_MS, WRITE_FLUSH_ROWS, WRITE_SPOOL_PATH, WRITE_DEAD_LETTER_PATH,
+    CHANNEL_CHAT_ID, BAN_LIST_CHAT_ID, DETECTION_POLICY, ML_CONFIDENCE_THRESHOLD, ML_MIN_LENGTH,
+    MONITOR_UNLISTED_CHATS,
+)
+from database.storage import StorageBackend
+from database.trusted_cache import TrustedUsersCache
+from database.chat_settings import ChatSettings, ChatSettingsCache
+from database.suspect_registry import Suspect, SuspectRegistry, new_token
+from database.training_stats import TrainingStatsCounter
+from database.write_buffer import WriteBehindBuffer
+import asyncio
 import logging
-from typing import List, Optional
+import uuid
+from typing import AsyncIterator, List, Optional
+
+
+def create_storage(backend: str = STORAGE_BACKEND) -> StorageBackend:
+    """Хранилище по имени из STORAGE_BACKEND: supabase | sqlite"""
+    if backend == "sqlite":
+        from database.sqlite_storage import SqliteStorage
+        return SqliteStorage(SQLITE_PATH)
+    if backend == "supabase":
+        from database.supabase_storage import SupabaseStorage
+        return SupabaseStorage(SUPABASE_URL, SUPABASE_KEY, max_concurrency=SUPABASE_MAX_CONCURRENCY)
+    raise ValueError(f"Неизвестное хранилище: {backend}")
+
+
+storage = create_storage()
+
+# Кэш доверенных: повторные сообщения одного автора не ходят в сеть
+trusted_cache = TrustedUsersCache(negative_ttl=TRUSTED_NEGATIVE_TTL)
+
+# Счётчики обучающих примеров: /training_stats не скачивает таблицу
+training_stats = TrainingStatsCounter(refresh_interval=TRAINING_STATS_REFRESH)
+
+# Подозреваемые с карточками: кнопки модерации не читают ban_list
+suspects = SuspectRegistry(maxsize=SUSPECT_REGISTRY_SIZE)
+
+# Настройки отслеживаемых чатов; по умолчанию - чат из переменных окружения
+chat_settings = ChatSettingsCache(ChatSettings(
+    chat_id=CHANNEL_CHAT_ID,
+    ban_list_chat_id=BAN_LIST_CHAT_ID,
+    policy=DETECTION_POLICY,
+    ml_threshold=ML_CONFIDENCE_THRESHOLD,
+    ml_min_length=ML_MIN_LENGTH,
+), monitor_unlisted=MONITOR_UNLISTED_CHATS)
+
+# Страница необработанных примеров при дообучении
+PAGE_SIZE = 1000
+
+
+async def _flush_writes(group: tuple, rows: List[dict]):
+    """
+    Одна группа отложенных записей - один запрос к хранилищу. Группы:
+    ("insert", таблица), ("status", статус, "token") и
+    ("status", статус, "message", chat_id)
+    """
+    if group[0] == "insert":
+        if group[1] == "ban_list":
+            await storage.insert_suspects(rows)
+        else:
+            await storage.insert_training_examples(rows)
+            # Счётчики - только после записи: потерянная или отложенная в спул
+            # строка в статистику не попадает
+            bad = sum(row["label"] == 1 for row in rows)
+            training_stats.added(1, bad)
+            training_stats.added(0, len(rows) - bad)
+        return
+
+    _, status, column, *chat = group
+    if column == "token":
+        await storage.update_suspects_status(status, tokens=[row["token"] for row in rows])
+    else:
+        await storage.update_suspects_status(
+            status, message_ids=[row["message_id"] for row in rows], chat_id=chat[0] if chat else None
+        )
+
+
+# Вставки в ban_list/training_examples и статусы подозреваемых пишутся
+# пачками в фоне - обработчики сообщений и кнопок не ждут БД
+writes = WriteBehindBuffer(
+    _flush_writes,
+    interval=WRITE_FLUSH_INTERVAL_MS / 1000,
+    max_rows=WRITE_FLUSH_ROWS,
+    spool_path=WRITE_SPOOL_PATH,
+    dead_letter_path=WRITE_DEAD_LETTER_PATH,
+    is_permanent=storage.is_permanent_error,
+)
+
+
+def _queue_status(status: str, message_id: int, chat_id: Optional[int], token: Optional[str]):
+    """Статус подозреваемого: правка ещё не записанной строки или UPDATE в очереди"""
+    if token is None:
+        suspect = suspects.find(chat_id, message_id)
+        token = suspect.token if suspect is not None else None
+    if token is None and isinstance(chat_id, str):
+        # Чат известен только как @username (карточка старого формата) - строку
+        # ban_list по сообщению не выделить: message_id повторяется в разных чатах
+        logging.warning(f"Статус {status} сообщения {message_id} в {chat_id} не записан: нет числового id чата")
+        return
+    if token is not None and writes.amend(("ban_list", token), {"status": status}):
+        return
+    if token is None or not storage.stores_suspect_tokens:
+        writes.put(("status", status, "message", chat_id), {"message_id": message_id})
+    else:
+        writes.put(("status", status, "token"), {"token": token})
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 
 class Database:
+    @staticmethod
+    async def close():
+        """Дописывает отложенные записи и закрывает соединения хранилища"""
+        await writes.close()
+        try:
+            await storage.close()
+        except Exception as e:
+            logging.error(f"Error closing {storage.name} storage: {e}")
+
+    @staticmethod
+    async def ping():
+        """Реальный запрос к БД в обход кэша (для проверки подключения). Пробрасывает ошибки."""
+        await storage.ping()
+
+    @staticmethod
+    async def check_schema():
+        """Подстраивается под недостающие миграции хранилища. Пробрасывает ошибки."""
+        await storage.check_schema()
+
+    @staticmethod
+    def storage_name() -> str:
+        return storage.name
+
+    @staticmethod
+    async def load_trusted_users() -> int:
+        """Загружает всех доверенных в кэш одним проходом. Пробрасывает ошибки."""
+        user_ids = await storage.load_trusted_user_ids()
+        trusted_cache.load(user_ids)
+        logging.info(f"Loaded {len(user_ids)} trusted users into cache")
+        return len(user_ids)
+
+    @staticmethod
+    def trusted_cache_stats() -> dict:
+        """Счётчики попаданий/промахов кэша доверенных"""
+        return trusted_cache.stats()
+
+    @staticmethod
+    async def load_chat_settings() -> int:
+        """Загружает настройки всех чатов из chat_settings в кэш. Пробрасывает ошибки."""
+        chat_settings.load(await storage.load_chat_settings())
+        logging.info(f"Loaded settings for {len(chat_settings)} chats")
+        return len(chat_settings)
+
+    @staticmethod
+    def get_chat_settings(chat_id: int) -> Optional[ChatSettings]:
+        """Настройки чата из кэша (None - чат не отслеживается)"""
+        return chat_settings.get(chat_id)
+
+    @staticmethod
+    def monitored_chats() -> List[ChatSettings]:
+        return chat_settings.all()
+
+    @staticmethod
+    def monitors_unlisted_chats() -> bool:
+        """Проверяются ли чаты без строки в chat_settings (с настройками по умолчанию)"""
+        return chat_settings.unlisted_enabled
+
     @staticmethod
     async def add_trusted_user(user_id: int, username: str = None, full_name: str = None):
         """Добавить пользователя в список доверенных"""
@@ -15,7 +176,9 @@ class Database:
                 "username": username,
                 "full_name": full_name
             }
-            supabase.table("trusted_users").upsert(data).execute()
+            await storage.upsert_trusted_user(data)
+            # Кэш - только после записи: иначе при сбое память и БД расходятся до перезапуска
+            trusted_cache.set_trusted(user_id)
             logging.info(f"User {user_id} added to trusted list")
         except Exception as e:
             logging.error(f"Error adding trusted user: {e}")
@@ -23,125 +186,273 @@ class Database:
     @staticmethod
     async def is_trusted(user_id: int) -> bool:
         """Проверить, является ли пользователь доверенным"""
+        cached = trusted_cache.get(user_id)
+        if cached is not None:
+            return cached
         try:
-            result = supabase.table("trusted_users").select("*").eq("user_id", user_id).execute()
-            return len(result.data) > 0
+            trusted = await storage.is_trusted(user_id)
+            if trusted:
+                trusted_cache.set_trusted(user_id)
+            else:
+                trusted_cache.set_untrusted(user_id)
+            return trusted
         except Exception as e:
             logging.error(f"Error checking trusted user: {e}")
             return False
 
     @staticmethod
-    async def add_to_ban_list(chat_id: int, message_id: int, user_id: int, username: str, full_name: str, suspect_message: str, ml_confidence: float = None):
-        """Сохранить информацию о подозреваемом (с ML уверенностью)"""
+    async def add_to_ban_list(chat_id: int, message_id: int, user_id: int, username: str, full_name: str, suspect_message: str, ml_confidence: float = None,
+                              token: Optional[str] = None) -> str:
+        """
+        Сохранить информацию о подозреваемом (с ML уверенностью). Запись
+        сразу попадает в реестр подозреваемых, в ban_list - отложенно;
+        возвращает её токен для кнопок (новый, если token не передан)
+        """
+        token = token or new_token()
+        suspects.add(Suspect(token, chat_id, message_id, user_id, suspect_message, ml_confidence))
+        data = {
+            "chat_id": chat_id,
+            "message_id": message_id,
+            "user_id": user_id,
+            "username": username,
+            "full_name": full_name,
+            "suspect_message": suspect_message,
+            "ml_confidence": ml_confidence,
+            "status": "pending",
+            "token": token
+        }
+        writes.put(("insert", "ban_list"), data, key=("ban_list", token))
+        return token
+
+    @staticmethod
+    async def get_suspect(token: str) -> Optional[Suspect]:
+        """Подозреваемый по токену из кнопки: из реестра, при промахе - из ban_list"""
+        suspect = suspects.get(token)
+        if suspect is not None:
+            return suspect
         try:
-            data = {
-                "chat_id": chat_id,
-                "message_id": message_id,
-                "user_id": user_id,
-                "username": username,
-                "full_name": full_name,
-                "suspect_message": suspect_message,
-                "ml_confidence": ml_confidence,
-                "status": "pending"
-            }
-            supabase.table("ban_list").insert(data).execute()
-            logging.info(f"Suspicious user {user_id} added to ban_list")
+            row = await storage.get_suspect(token=token)
         except Exception as e:
-            logging.error(f"Error adding to ban_list: {e}")
+            logging.error(f"Error getting suspect: {e}")
+            return None
+        if row is None:
+            return None
+        return suspects.setdefault(Suspect.from_row(row))
 
     @staticmethod
-    async def get_pending_suspect(message_id: int):
+    async def find_suspect(message_id: int, chat_id: Optional[int] = None) -> Optional[Suspect]:
+        """Подозреваемый по сообщению - для карточек без токена (старый формат кнопок)"""
+        suspect = suspects.find(chat_id, message_id)
+        if suspect is not None:
+            return suspect
+        row = await Database.get_suspect_message(message_id, chat_id)
+        if row is None:
+            return None
+        suspect = Suspect.from_row(row)
+        if suspect.token:
+            suspect = suspects.setdefault(suspect)
+        return suspect
+
+    @staticmethod
+    async def resolve_suspect(suspect: Suspect, status: str, moderated_by: int, label: Optional[int] = None):
+        """
+        Решение модератора: статус в ban_list и (если label задан) обучающий
+        пример уходят в очередь отложенной записи - одной пачкой, без ожидания БД
+        """
+        suspect.status = status
+        await Database.update_suspect_status(suspect.message_id, status, suspect.chat_id, suspect.token)
+        if label is not None and suspect.text:
+            await Database.add_training_example(text=suspect.text, label=label, moderated_by=moderated_by)
+
+    @staticmethod
+    def cached_suspect(message_id: int, chat_id: Optional[int]) -> Optional[Suspect]:
+        """Подозреваемый из реестра без обращения к БД"""
+        return suspects.find(chat_id, message_id)
+
+    @staticmethod
+    async def replay_writes():
+        """Дописывает в БД записи, отложенные в спул прошлым запуском"""
+        await writes.replay()
+
+    @staticmethod
+    def writes_summary() -> str:
+        return writes.summary()
+
+    @staticmethod
+    def suspect_registry_stats() -> dict:
+        return suspects.stats()
+
+    @staticmethod
+    async def get_pending_suspect(message_id: int, chat_id: Optional[int] = None):
         """Получить данные о подозреваемом по ID сообщения (статус pending)"""
         try:
-            result = supabase.table("ban_list").select("*").eq("message_id", message_id).eq("status", "pending").execute()
-            return result.data[0] if result.data else None
+            return await storage.get_suspect(message_id=message_id, chat_id=chat_id, status="pending")
         except Exception as e:
             logging.error(f"Error getting pending suspect: {e}")
             return None
 
     @staticmethod
-    async def update_suspect_status(message_id: int, status: str):
-        """Обновить статус подозреваемого"""
-        try:
-            supabase.table("ban_list").update({"status": status}).eq("message_id", message_id).execute()
-            logging.info(f"Updated suspect status to {status} for message {message_id}")
-        except Exception as e:
-            logging.error(f"Error updating suspect status: {e}")
+    async def update_suspect_status(message_id: int, status: str, chat_id: Optional[int] = None,
+                                    token: Optional[str] = None):
+        """Обновить статус подозреваемого (отложенно; по токену, если он известен)"""
+        _queue_status(status, message_id, chat_id, token)
 
     @staticmethod
-    async def get_suspect_message(message_id: int) -> Optional[dict]:
+    async def get_suspect_message(message_id: int, chat_id: Optional[int] = None) -> Optional[dict]:
         """Получает запись из ban_list по message_id (для получения текста сообщения)"""
         try:
-            result = supabase.table("ban_list").select("*").eq("message_id", message_id).execute()
-            return result.data[0] if result.data else None
+            return await storage.get_suspect(message_id=message_id, chat_id=chat_id)
         except Exception as e:
             logging.error(f"Error getting suspect message: {e}")
             return None
 
-    # Новые методы для ML обучения
+    @staticmethod
+    async def add_to_ban_list_bulk(rows: List[dict]):
+        """Сохраняет пачку подозреваемых (поля как у add_to_ban_list) в реестр и в очередь записи"""
+        for row in rows:
+            token = new_token()
+            suspects.add(Suspect(token, row["chat_id"], row["message_id"], row["user_id"],
+                                 row.get("suspect_message"), row.get("ml_confidence")))
+            writes.put(("insert", "ban_list"), {**row, "status": "pending", "token": token}, key=("ban_list", token))
 
     @staticmethod
-    async def add_training_example(text: str, label: int, moderated_by: int):
-        """Добавляет размеченный пример для обучения"""
+    async def get_suspect_messages(message_ids: List[int], chat_id: Optional[int] = None) -> List[dict]:
+        """Записи ban_list по списку message_id одним запросом"""
+        if not message_ids:
+            return []
         try:
-            data = {
-                "text": text,
-                "label": label,
-                "moderated_by": moderated_by,
-                "processed": False
-            }
-            result = supabase.table("training_examples").insert(data).execute()
-            logging.info(f"Training example added (label={label})")
-            return result.data
+            return await storage.get_suspects(message_ids, chat_id)
         except Exception as e:
-            logging.error(f"Error adding training example: {e}")
-            return None
+            logging.error(f"Error getting suspect messages: {e}")
+            return []
+
+    @staticmethod
+    async def update_suspects_status(message_ids: List[int], status: str, chat_id: Optional[int] = None):
+        """Статус сразу для нескольких подозреваемых - уходит одной пачкой"""
+        for message_id in message_ids:
+            _queue_status(status, message_id, chat_id, None)
+
+    # Новые методы для ML обучения
+
+    @staticmethod
+    async def add_training_example(text: str, label: int, moderated_by: int):
+        """Добавляет размеченный пример для обучения (отложенно, пачкой с соседними)"""
+        data = {
+            "text": text,
+            "label": label,
+            "moderated_by": moderated_by,
+            "processed": False,
+            # Ключ идемпотентности: повтор пачки из спула не создаёт дублей
+            "token": uuid.uuid4().hex,
+        }
+        writes.put(("insert", "training_examples"), data)
+        logging.info(f"Training example queued (label={label})")
+
+    @staticmethod
+    async def add_training_examples_bulk(rows: List[dict], moderated_by: int) -> int:
+        """
+        Добавляет пачку примеров ({"text", "label"}) одним INSERT.
+        Пробрасывает ошибки - вызывающий решает, повторять ли пачку.
+        """
+        if not rows:
+            return 0
+        data = [
+            {"text": row["text"], "label": row["label"], "moderated_by": moderated_by, "processed": False}
+            for row in rows
+        ]
+        await storage.insert_training_examples(data)
+        bad = sum(row["label"] for row in rows)
+        training_stats.added(1, bad)
+        training_stats.added(0, len(rows) - bad)
+        return len(rows)
+
+    @staticmethod
+    async def iter_unprocessed_training_examples(page_size: int = PAGE_SIZE, after_id: int = 0) -> AsyncIterator[List[dict]]:
+        """
+        Необработанные примеры страницами по page_size в порядке id.
+        Keyset-пагинация (id > последнего): страница не сдвигается, даже если
+        предыдущие строки тем временем помечены обработанными.
+        Пробрасывает ошибки.
+        """
+        last_id = after_id
+        while True:
+            page = await storage.unprocessed_training_page(last_id, page_size)
+            if not page:
+                return
+            yield page
+            if len(page) < page_size:
+                return
+            last_id = page[-1]["id"]
 
     @staticmethod
     async def get_unprocessed_training_examples() -> List[dict]:
         """Получает все необработанные примеры"""
+        examples = []
         try:
-            result = supabase.table("training_examples").select("*").eq("processed", False).execute()
-            return result.data
+            async for page in Database.iter_unprocessed_training_examples():
+                examples.extend(page)
         except Exception as e:
             logging.error(f"Error getting unprocessed training examples: {e}")
-            return []
+        return examples
+
+    @staticmethod
+    async def mark_trained_examples_processed(ids: List[int]) -> int:
+        """
+        Помечает обработанными ровно обученные примеры. Не диапазоном id:
+        строки параллельной загрузки или отложенной записи могут получить id
+        внутри диапазона уже после чтения страницы. Пробрасывает ошибки.
+        """
+        changed = await storage.mark_training_processed(ids)
+        training_stats.processed(changed)
+        logging.info(f"Marked {changed} training examples as processed ({len(ids)} trained)")
+        return changed
 
     @staticmethod
     async def mark_training_examples_processed(ids: List[int]):
         """Помечает примеры как обработанные"""
         try:
-            supabase.table("training_examples").update({"processed": True}).in_("id", ids).execute()
+            training_stats.processed(await storage.mark_training_processed(ids=ids))
             logging.info(f"Marked {len(ids)} training examples as processed")
         except Exception as e:
             logging.error(f"Error marking training examples as processed: {e}")
     
     @staticmethod
-    async def get_training_stats() -> dict:
-        """Получает статистику по обучающим примерам"""
+    async def _count_training_examples(**filters) -> int:
+        """Число строк по фильтру: COUNT в хранилище, сами строки не передаются"""
+        return await storage.count_training_examples(**filters)
+
+    @staticmethod
+    async def get_training_stats(refresh: bool = False) -> dict:
+        """
+        Статистика по обучающим примерам. Обычно отдаётся из счётчиков в памяти;
+        из БД (четыре COUNT-запроса параллельно) - при первом вызове, по
+        истечении интервала сверки или при refresh=True
+        """
+        if not refresh and training_stats.is_fresh:
+            return training_stats.snapshot()
         try:
-            # Все примеры
-            all_result = supabase.table("training_examples").select("*").execute()
-            total = len(all_result.data)
-            
-            # Хорошие примеры (label=0)
-            good_result = supabase.table("training_examples").select("*").eq("label", 0).execute()
-            good = len(good_result.data)
-            
-            # Плохие примеры (label=1)
-            bad_result = supabase.table("training_examples").select("*").eq("label", 1).execute()
-            bad = len(bad_result.data)
-            
-            # Необработанные
-            unprocessed_result = supabase.table("training_examples").select("*").eq("processed", False).execute()
-            unprocessed = len(unprocessed_result.data)
-            
-            return {
-                "total": total,
-                "good": good,
-                "bad": bad,
-                "unprocessed": unprocessed
-            }
+            total, good, bad, unprocessed = await asyncio.gather(
+                Database._count_training_examples(),
+                Database._count_training_examples(label=0),
+                Database._count_training_examples(label=1),
+                Database._count_training_examples(processed=False),
+            )
+            training_stats.load({"total": total, "good": good, "bad": bad, "unprocessed": unprocessed})
+            return training_stats.snapshot()
         except Exception as e:
             logging.error(f"Error getting training stats: {e}")
-            return {"total": 0, "good": 0, "bad": 0, "unprocessed": 0}
\ No newline at end of file
+            return {"total": 0, "good": 0, "bad": 0, "unprocessed": 0}
+
+    @staticmethod
+    async def load_user_reputation(limit: int) -> List[dict]:
+        """Репутация недавно активных авторов (не больше limit)"""
+        try:
+            return await storage.load_user_reputation(limit)
+        except Exception as e:
+            logging.error(f"Error loading user reputation: {e}")
+            return []
+
+    @staticmethod
+    async def save_user_reputation(rows: List[dict]):
+        """Сохраняет изменённые записи репутации; ошибку пробрасывает - записи останутся несохранёнными"""
+        await storage.upsert_user_reputation(rows)
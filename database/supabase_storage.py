@@ -0,0 +1,248 @@
+import asyncio
+import logging
+from typing import Any, Callable, Dict, List, Optional
+
+from supabase import acreate_client, AsyncClient
+from postgrest import APIError, CountMethod, ReturnMethod
+
+from database.storage import StorageBackend
+
+# PostgREST по умолчанию отдаёт не больше 1000 строк за запрос
+PAGE_SIZE = 1000
+# Сколько id передавать в одном in_(...) - фильтр идёт в URL
+MARK_CHUNK = 200
+# Код Postgres: для ON CONFLICT нет подходящего UNIQUE-ограничения
+NO_UNIQUE_CONSTRAINT = "42P10"
+# Код PostgREST: в таблице нет столбца из запроса
+NO_COLUMN = "PGRST204"
+# Код Postgres: нет столбца (в select)
+UNDEFINED_COLUMN = "42703"
+# Классы SQLSTATE, которые повтором не лечатся: данные, ограничения, схема/права
+PERMANENT_SQLSTATE_CLASSES = ("22", "23", "42")
+
+
+def _in_chat(query, chat_id: Optional[int]):
+    """message_id уникален только внутри чата - фильтр по чату, если он известен"""
+    return query if chat_id is None else query.eq("chat_id", chat_id)
+
+
+class SupabaseStorage(StorageBackend):
+    """Таблицы в Supabase (PostgREST) через асинхронный клиент"""
+
+    name = "supabase"
+
+    def __init__(self, url: str, key: str, max_concurrency: int = 20):
+        self.url = url
+        self.key = key
+        # Асинхронный клиент создаётся лениво внутри event loop (acreate_client - корутина).
+        # Под капотом у него один httpx.AsyncClient с пулом соединений.
+        self._client: Optional[AsyncClient] = None
+        self._client_lock = asyncio.Lock()
+        # Ограничиваем число одновременных запросов к Supabase, чтобы всплеск
+        # сообщений не открывал сотни соединений разом
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        # Есть ли UNIQUE на ban_list.token (миграция); без него - обычный INSERT
+        self._token_unique = True
+        self.stores_suspect_tokens = True
+        # То же для training_examples.token; None - нет и самого столбца
+        self._training_token = "unique"
+
+    async def get_client(self) -> AsyncClient:
+        """Возвращает (и при первом вызове создаёт) асинхронный клиент Supabase"""
+        if self._client is None:
+            async with self._client_lock:
+                if self._client is None:
+                    self._client = await acreate_client(self.url, self.key)
+        return self._client
+
+    async def _run(self, build: Callable[[AsyncClient], object]):
+        """Строит запрос на клиенте и выполняет его, не блокируя event loop"""
+        client = await self.get_client()
+        async with self._semaphore:
+            return await build(client).execute()
+
+    async def _select_all(self, table: str, columns: str) -> List[Dict[str, Any]]:
+        rows = []
+        offset = 0
+        while True:
+            result = await self._run(
+                lambda db: db.table(table).select(columns).range(offset, offset + PAGE_SIZE - 1)
+            )
+            rows.extend(result.data)
+            if len(result.data) < PAGE_SIZE:
+                return rows
+            offset += PAGE_SIZE
+
+    async def check_schema(self):
+        try:
+            await self._run(lambda db: db.table("ban_list").select("token").limit(1))
+        except APIError as e:
+            if e.code not in (UNDEFINED_COLUMN, NO_COLUMN):
+                raise
+            self.stores_suspect_tokens = False
+            self._token_unique = False
+            logging.warning(
+                "В ban_list нет столбца token - статусы пишутся по сообщению, кнопки ищут подозреваемого "
+                "только в памяти. Миграция: ALTER TABLE ban_list ADD COLUMN IF NOT EXISTS token text; "
+                "ALTER TABLE ban_list ADD CONSTRAINT ban_list_token_key UNIQUE (token);"
+            )
+
+    def is_permanent_error(self, error: BaseException) -> bool:
+        # Ошибки PostgREST (PGRST...) и Postgres о данных и схеме - ответ 4xx;
+        # сетевые ошибки и 5xx приходят не как APIError или с другим классом
+        if not isinstance(error, APIError) or not error.code:
+            return False
+        return error.code.startswith("PGRST") or error.code[:2] in PERMANENT_SQLSTATE_CLASSES
+
+    async def ping(self):
+        await self._run(lambda db: db.table("trusted_users").select("user_id").limit(1))
+
+    async def close(self):
+        if self._client is not None:
+            client, self._client = self._client, None
+            await client.postgrest.aclose()
+
+    async def load_trusted_user_ids(self) -> List[int]:
+        return [row["user_id"] for row in await self._select_all("trusted_users", "user_id")]
+
+    async def is_trusted(self, user_id: int) -> bool:
+        result = await self._run(lambda db: db.table("trusted_users").select("user_id").eq("user_id", user_id).limit(1))
+        return len(result.data) > 0
+
+    async def upsert_trusted_user(self, row: Dict[str, Any]):
+        await self._run(lambda db: db.table("trusted_users").upsert(row, returning=ReturnMethod.minimal))
+
+    async def load_chat_settings(self) -> List[Dict[str, Any]]:
+        return await self._select_all("chat_settings", "*")
+
+    async def insert_suspects(self, rows: List[Dict[str, Any]]):
+        if self._token_unique and self.stores_suspect_tokens:
+            try:
+                # Повтор пачки (из спула) не создаёт дублей: токен уникален
+                await self._run(lambda db: db.table("ban_list").upsert(
+                    rows, on_conflict="token", ignore_duplicates=True, returning=ReturnMethod.minimal
+                ))
+                return
+            except APIError as e:
+                if e.code not in (NO_UNIQUE_CONSTRAINT, NO_COLUMN):
+                    raise
+                self._token_unique = False
+                if e.code == NO_COLUMN:
+                    # Статусы пойдут по сообщению (см. stores_suspect_tokens)
+                    self.stores_suspect_tokens = False
+                logging.warning(
+                    "ban_list.token без UNIQUE - вставка без защиты от дублей при повторе из спула. "
+                    "Миграция: ALTER TABLE ban_list ADD COLUMN IF NOT EXISTS token text; "
+                    "ALTER TABLE ban_list ADD CONSTRAINT ban_list_token_key UNIQUE (token);"
+                )
+        if not self.stores_suspect_tokens:
+            rows = [{column: value for column, value in row.items() if column != "token"} for row in rows]
+        await self._run(lambda db: db.table("ban_list").insert(rows, returning=ReturnMethod.minimal))
+
+    async def get_suspect(self, token: Optional[str] = None, message_id: Optional[int] = None,
+                          chat_id: Optional[int] = None, status: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        if token and not self.stores_suspect_tokens:
+            return None  # столбца token нет - искать не по чему
+
+        def build(db):
+            query = db.table("ban_list").select("*")
+            query = query.eq("token", token) if token else _in_chat(query.eq("message_id", message_id), chat_id)
+            if status is not None:
+                query = query.eq("status", status)
+            return query.limit(1)
+
+        result = await self._run(build)
+        return result.data[0] if result.data else None
+
+    async def get_suspects(self, message_ids: List[int], chat_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        result = await self._run(
+            lambda db: _in_chat(
+                db.table("ban_list").select("chat_id,message_id,user_id,suspect_message").in_("message_id", message_ids),
+                chat_id
+            )
+        )
+        return result.data
+
+    async def update_suspects_status(self, status: str, tokens: Optional[List[str]] = None,
+                                     message_ids: Optional[List[int]] = None, chat_id: Optional[int] = None):
+        column, values = ("token", tokens) if tokens else ("message_id", message_ids or [])
+        for start in range(0, len(values), MARK_CHUNK):
+            chunk = values[start:start + MARK_CHUNK]
+            await self._run(lambda db: _in_chat(
+                db.table("ban_list").update({"status": status}, returning=ReturnMethod.minimal).in_(column, chunk),
+                chat_id
+            ))
+
+    async def insert_training_examples(self, rows: List[Dict[str, Any]]):
+        # returning=minimal: вставленные строки не нужны, не гоняем их обратно
+        if self._training_token == "unique" and any(row.get("token") for row in rows):
+            try:
+                # Повтор пачки (из спула) не создаёт дублей: токен уникален
+                await self._run(lambda db: db.table("training_examples").upsert(
+                    rows, on_conflict="token", ignore_duplicates=True, returning=ReturnMethod.minimal
+                ))
+                return
+            except APIError as e:
+                if e.code not in (NO_UNIQUE_CONSTRAINT, NO_COLUMN):
+                    raise
+                self._training_token = "plain" if e.code == NO_UNIQUE_CONSTRAINT else None
+                logging.warning(
+                    "training_examples.token без UNIQUE - вставка без защиты от дублей при повторе из спула. "
+                    "Миграция: ALTER TABLE training_examples ADD COLUMN IF NOT EXISTS token text UNIQUE;"
+                )
+        if self._training_token is None:
+            rows = [{column: value for column, value in row.items() if column != "token"} for row in rows]
+        await self._run(lambda db: db.table("training_examples").insert(rows, returning=ReturnMethod.minimal))
+
+    async def unprocessed_training_page(self, after_id: int, limit: int) -> List[Dict[str, Any]]:
+        result = await self._run(
+            lambda db: db.table("training_examples").select("id,text,label")
+            .eq("processed", False).gt("id", after_id).order("id").limit(limit)
+        )
+        return result.data
+
+    async def mark_training_processed(self, ids: List[int]) -> int:
+        def update(db):
+            return db.table("training_examples").update(
+                {"processed": True}, count=CountMethod.exact, returning=ReturnMethod.minimal
+            )
+
+        # Фильтр по processed=False: считаются только реально изменённые строки
+        changed = 0
+        # Частями: длинный in_(...) не помещается в URL запроса
+        for start in range(0, len(ids), MARK_CHUNK):
+            chunk = ids[start:start + MARK_CHUNK]
+            result = await self._run(lambda db: update(db).in_("id", chunk).eq("processed", False))
+            changed += result.count or 0
+        return changed
+
+    async def count_training_examples(self, **filters) -> int:
+        # COUNT на сервере, сами строки не передаются
+        def build(db):
+            query = db.table("training_examples").select("id", count="exact", head=True)
+            for column, value in filters.items():
+                query = query.eq(column, value)
+            return query
+
+        result = await self._run(build)
+        return result.count or 0
+
+    async def load_user_reputation(self, limit: int) -> List[Dict[str, Any]]:
+        rows = []
+        while len(rows) < limit:
+            offset = len(rows)
+            result = await self._run(
+                lambda db: db.table("user_reputation").select("*").order("last_seen", desc=True)
+                .range(offset, min(limit, offset + PAGE_SIZE) - 1)
+            )
+            rows.extend(result.data)
+            if len(result.data) < PAGE_SIZE:
+                break
+        return rows
+
+    async def upsert_user_reputation(self, rows: List[Dict[str, Any]]):
+        for start in range(0, len(rows), PAGE_SIZE):
+            chunk = rows[start:start + PAGE_SIZE]
+            await self._run(lambda db: db.table("user_reputation").upsert(
+                chunk, on_conflict="user_id", returning=ReturnMethod.minimal
+            ))
@@ -0,0 +1,130 @@
+import secrets
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+# Алфавит токенов: callback_data ограничена 64 байтами
+_DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+
+def new_token() -> str:
+    """Короткий непрозрачный токен подозреваемого: 48 случайных бит в base36 (до 10 символов)"""
+    value = secrets.randbits(48)
+    chars = []
+    while True:
+        value, digit = divmod(value, 36)
+        chars.append(_DIGITS[digit])
+        if not value:
+            return "".join(reversed(chars))
+
+
+class Suspect:
+    """Подозреваемый из карточки модерации: всё, что нужно кнопкам без чтения БД"""
+    __slots__ = ('token', 'chat_id', 'message_id', 'user_id', 'text', 'ml_confidence', 'status')
+
+    def __init__(self, token: str, chat_id: int, message_id: int, user_id: int, text: Optional[str],
+                 ml_confidence: Optional[float], status: str = "pending"):
+        self.token = token
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.user_id = user_id
+        self.text = text
+        self.ml_confidence = ml_confidence
+        self.status = status
+
+    def claim(self) -> bool:
+        """
+        Берёт подозреваемого в обработку (проверка и смена статуса без await
+        между ними); False - решение уже принято или принимается
+        """
+        if self.status != "pending":
+            return False
+        self.status = "processing"
+        return True
+
+    def release(self):
+        """Возвращает в ожидание, если решение применить не удалось"""
+        if self.status == "processing":
+            self.status = "pending"
+
+    @classmethod
+    def from_row(cls, row: Dict[str, Any]) -> "Suspect":
+        return cls(
+            token=row.get("token"),
+            chat_id=row["chat_id"],
+            message_id=row["message_id"],
+            user_id=row["user_id"],
+            text=row.get("suspect_message"),
+            ml_confidence=row.get("ml_confidence"),
+            status=row.get("status") or "pending",
+        )
+
+
+class SuspectRegistry:
+    """
+    Подозреваемые, ждущие решения модератора, в памяти процесса.
+
+    Запись создаётся при отправке карточки (и пишется в ban_list вместе с
+    токеном), поэтому нажатие кнопки не читает БД. Ищется по токену из
+    callback_data и по (chat_id, message_id) - для дайджестов и карточек
+    старого формата. Хранятся последние maxsize записей; промах (перезапуск,
+    вытеснение) - чтение ban_list по токену.
+    """
+
+    def __init__(self, maxsize: int = 20_000):
+        self.maxsize = maxsize
+        self._by_token: "OrderedDict[str, Suspect]" = OrderedDict()
+        self._by_message: Dict[Tuple[int, int], Suspect] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def add(self, suspect: Suspect):
+        old = self._by_token.pop(suspect.token, None)
+        if old is not None:
+            self._by_message.pop((old.chat_id, old.message_id), None)
+        while len(self._by_token) >= self.maxsize:
+            _, evicted = self._by_token.popitem(last=False)
+            if self._by_message.get((evicted.chat_id, evicted.message_id)) is evicted:
+                del self._by_message[(evicted.chat_id, evicted.message_id)]
+        self._by_token[suspect.token] = suspect
+        self._by_message[(suspect.chat_id, suspect.message_id)] = suspect
+
+    def setdefault(self, suspect: Suspect) -> Suspect:
+        """
+        Запись с токеном suspect, если она уже есть (её прочитал параллельный
+        промах), иначе добавляет suspect - у токена один объект и один статус
+        """
+        existing = self._by_token.get(suspect.token)
+        if existing is not None:
+            self._by_token.move_to_end(suspect.token)
+            return existing
+        self.add(suspect)
+        return suspect
+
+    def get(self, token: str) -> Optional[Suspect]:
+        suspect = self._by_token.get(token)
+        if suspect is None:
+            self.misses += 1
+            return None
+        self._by_token.move_to_end(token)
+        self.hits += 1
+        return suspect
+
+    def find(self, chat_id: Optional[int], message_id: int) -> Optional[Suspect]:
+        suspect = self._by_message.get((chat_id, message_id))
+        if suspect is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return suspect
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._by_token),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def __len__(self) -> int:
+        return len(self._by_token)
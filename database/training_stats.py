@@ -0,0 +1,47 @@
+import time
+from typing import Dict, Optional
+
+
+class TrainingStatsCounter:
+    """
+    Счётчики обучающих примеров в памяти процесса.
+
+    Точные значения берутся из БД агрегирующими запросами (count, без строк),
+    дальше поддерживаются инкрементально при добавлении и обработке примеров.
+    Раз в refresh_interval секунд счётчики сверяются с БД, чтобы подхватить
+    изменения, сделанные в обход бота.
+    """
+
+    FIELDS = ("total", "good", "bad", "unprocessed")
+
+    def __init__(self, refresh_interval: float = 300.0):
+        self.refresh_interval = refresh_interval
+        self._counts: Dict[str, int] = dict.fromkeys(self.FIELDS, 0)
+        self._loaded_at: Optional[float] = None
+
+    @property
+    def is_fresh(self) -> bool:
+        return self._loaded_at is not None and time.monotonic() - self._loaded_at < self.refresh_interval
+
+    def load(self, counts: Dict[str, int]):
+        self._counts = {field: int(counts.get(field) or 0) for field in self.FIELDS}
+        self._loaded_at = time.monotonic()
+
+    def added(self, label: int, count: int = 1):
+        """Новые необработанные примеры с меткой label"""
+        if self._loaded_at is None:
+            return
+        self._counts["total"] += count
+        self._counts["unprocessed"] += count
+        if label == 0:
+            self._counts["good"] += count
+        elif label == 1:
+            self._counts["bad"] += count
+
+    def processed(self, count: int):
+        if self._loaded_at is None:
+            return
+        self._counts["unprocessed"] = max(0, self._counts["unprocessed"] - count)
+
+    def snapshot(self) -> Dict[str, int]:
+        return dict(self._counts)
@@ -0,0 +1,64 @@
+import time
+from typing import Dict, Iterable, Optional, Set
+
+
+class TrustedUsersCache:
+    """
+    Кэш доверенных пользователей в памяти процесса.
+
+    Положительные записи (доверенные) хранятся бессрочно - они загружаются
+    целиком при старте и пополняются при добавлении доверенного.
+    Отрицательные записи (не доверенные) живут negative_ttl секунд, чтобы
+    доверенный, добавленный из другого места, со временем подхватывался.
+    """
+
+    def __init__(self, negative_ttl: float = 600.0, max_negative: int = 100_000):
+        self.negative_ttl = negative_ttl
+        self.max_negative = max_negative
+        self._trusted: Set[int] = set()
+        self._negative: Dict[int, float] = {}  # user_id -> момент истечения
+        self.loaded = False
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, user_ids: Iterable[int]):
+        """Полностью заменяет множество доверенных (массовая загрузка)"""
+        self._trusted = set(user_ids)
+        self._negative.clear()
+        self.loaded = True
+
+    def get(self, user_id: int) -> Optional[bool]:
+        """True/False если ответ известен без обращения к БД, иначе None"""
+        if user_id in self._trusted:
+            self.hits += 1
+            return True
+
+        expires_at = self._negative.get(user_id)
+        if expires_at is not None:
+            if expires_at > time.monotonic():
+                self.hits += 1
+                return False
+            del self._negative[user_id]
+
+        self.misses += 1
+        return None
+
+    def set_trusted(self, user_id: int):
+        self._trusted.add(user_id)
+        self._negative.pop(user_id, None)
+
+    def set_untrusted(self, user_id: int):
+        if len(self._negative) >= self.max_negative:
+            # dict хранит порядок вставки - выкидываем самую старую запись
+            self._negative.pop(next(iter(self._negative)))
+        self._negative[user_id] = time.monotonic() + self.negative_ttl
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "trusted": len(self._trusted),
+            "negative": len(self._negative),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
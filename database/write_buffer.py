@@ -0,0 +1,255 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from utils.metrics import LatencyStat
+
+logger = logging.getLogger(__name__)
+
+# Запись: (группа, данные). Записи одной группы пишутся одним запросом;
+# группа и данные должны сериализоваться в JSON - так они попадают в спул
+Entry = Tuple[tuple, Dict[str, Any]]
+
+
+class WriteBehindBuffer:
+    """
+    Отложенная запись в БД.
+
+    Записи копятся в памяти и уходят пачками: через interval секунд после
+    первой записи в пачке или сразу, как набралось max_rows. Пачка делится
+    на группы (одна группа - один запрос) в порядке первого появления,
+    поэтому вставка строки уходит раньше правки её статуса.
+
+    Если группа не записалась из-за временной ошибки (сеть, 5xx), она и все
+    следующие группы пачки дописываются в спул - локальный JSONL-файл.
+    Спул переигрывается при старте и перед каждой пачкой, новые пачки
+    после этого всё равно пишутся прямо в БД. Файл удаляется, когда
+    переигрался целиком.
+
+    Постоянная ошибка (is_permanent: неверная строка, нет столбца) повтором
+    не лечится: строки группы пишутся по одной, и не записавшиеся уходят в
+    dead_letter_path с текстом ошибки, а не блокируют спул.
+    """
+
+    def __init__(self, flush: Callable[[tuple, List[Dict[str, Any]]], Awaitable[None]],
+                 interval: float = 0.5, max_rows: int = 200, spool_path: Optional[str] = None,
+                 dead_letter_path: Optional[str] = None,
+                 is_permanent: Callable[[BaseException], bool] = lambda error: False):
+        self.flush = flush
+        self.interval = interval
+        self.max_rows = max_rows
+        self.spool_path = spool_path
+        self.dead_letter_path = dead_letter_path
+        self.is_permanent = is_permanent
+
+        self._entries: List[Entry] = []
+        self._keyed: Dict[Any, Dict[str, Any]] = {}  # ключ -> данные ещё не записанной записи
+        self._timer: Optional[asyncio.Task] = None
+        self._flushing = set()
+        self._lock = asyncio.Lock()  # пачки и спул пишутся строго по очереди
+
+        self.written = 0
+        self.failures = 0
+        self.dead = 0
+        self.spooled = self._count_spooled()
+        # Время записи одной пачки (все группы)
+        self.latency = LatencyStat()
+
+    @property
+    def depth(self) -> int:
+        return len(self._entries)
+
+    def put(self, group: tuple, data: Dict[str, Any], key: Any = None):
+        """Ставит запись в очередь; по key её можно поправить, пока она не записана"""
+        self._entries.append((group, data))
+        if key is not None:
+            self._keyed[key] = data
+        if len(self._entries) >= self.max_rows:
+            self._flush_now()
+        elif self._timer is None or self._timer.done():
+            self._timer = asyncio.create_task(self._flush_later())
+
+    def amend(self, key: Any, changes: Dict[str, Any]) -> bool:
+        """Правит ещё не записанную запись; False - она уже ушла в БД (или в спул)"""
+        data = self._keyed.get(key)
+        if data is None:
+            return False
+        data.update(changes)
+        return True
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.interval)
+        self._timer = None
+        self._flush_now()
+
+    def _flush_now(self):
+        if self._timer is not None and self._timer is not asyncio.current_task():
+            self._timer.cancel()
+            self._timer = None
+        if not self._entries:
+            return
+        entries, self._entries = self._entries, []
+        self._keyed = {}
+        task = asyncio.create_task(self._write(entries))
+        self._flushing.add(task)
+        task.add_done_callback(self._flushing.discard)
+
+    @staticmethod
+    def _groups(entries: List[Entry]) -> List[Tuple[tuple, List[Dict[str, Any]]]]:
+        groups: Dict[tuple, List[Dict[str, Any]]] = {}
+        for group, data in entries:
+            groups.setdefault(group, []).append(data)
+        return list(groups.items())
+
+    async def _write_rows(self, group: tuple, rows: List[Dict[str, Any]], error: BaseException
+                          ) -> List[Dict[str, Any]]:
+        """
+        Группа с постоянной ошибкой: строки по одной, чтобы одна плохая не
+        тянула за собой соседей. Возвращает строки с временной ошибкой
+        """
+        if len(rows) == 1:
+            self._dead_letter([((group, rows[0]), error)])
+            return []
+        dead: List[Tuple[Entry, BaseException]] = []
+        retry = []
+        for data in rows:
+            try:
+                await self.flush(group, [data])
+                self.written += 1
+            except Exception as e:
+                if self.is_permanent(e):
+                    dead.append(((group, data), e))
+                else:
+                    retry.append(data)
+        self._dead_letter(dead)
+        return retry
+
+    async def _write_groups(self, groups: List[Tuple[tuple, List[Dict[str, Any]]]]) -> List[Entry]:
+        """
+        Пишет группы по порядку; возвращает записи, которые не удалось
+        записать из-за временной ошибки (постоянные уходят в dead letter)
+        """
+        for index, (group, rows) in enumerate(groups):
+            try:
+                await self.flush(group, rows)
+                self.written += len(rows)
+            except Exception as e:
+                self.failures += 1
+                if self.is_permanent(e):
+                    logger.error(f"❌ Отложенная запись {group} ({len(rows)} шт.) отклонена хранилищем: {e}")
+                    retry = await self._write_rows(group, rows, e)
+                    if not retry:
+                        continue
+                    rows = retry
+                else:
+                    logger.error(f"❌ Отложенная запись {group} ({len(rows)} шт.) не удалась: {e}")
+                return [(group, data) for data in rows] + [
+                    (g, data) for g, chunk in groups[index + 1:] for data in chunk
+                ]
+        return []
+
+    async def _write(self, entries: List[Entry]):
+        async with self._lock:
+            started = time.perf_counter()
+            if self.spooled:
+                await self._replay()
+            # Даже если спул не переигрался целиком, новые записи идут прямо в БД:
+            # хранилище может быть доступно, а застрять - только старый хвост
+            failed = await self._write_groups(self._groups(entries))
+            self.latency.since(started)
+            if failed:
+                self._spool(failed)
+
+    def _dead_letter(self, dead: List[Tuple[Entry, BaseException]]):
+        if not dead:
+            return
+        self.dead += len(dead)
+        if not self.dead_letter_path:
+            logger.error(f"❌ Dead letter не настроен - отброшено {len(dead)} записей: {dead[0][1]}")
+            return
+        try:
+            os.makedirs(os.path.dirname(self.dead_letter_path) or ".", exist_ok=True)
+            with open(self.dead_letter_path, "a", encoding="utf-8") as f:
+                for (group, data), error in dead:
+                    f.write(json.dumps({"group": group, "data": data, "error": str(error)}, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            logger.error(
+                f"☠️ {len(dead)} записей отклонены хранилищем и сохранены в {self.dead_letter_path}: {dead[0][1]}"
+            )
+        except OSError as e:
+            logger.error(f"❌ Не удалось записать dead letter: {e} - потеряно {len(dead)} записей")
+
+    def _spool(self, entries: List[Entry]):
+        if not self.spool_path:
+            logger.error(f"❌ Спул не настроен - потеряно {len(entries)} записей")
+            return
+        try:
+            os.makedirs(os.path.dirname(self.spool_path) or ".", exist_ok=True)
+            with open(self.spool_path, "a", encoding="utf-8") as f:
+                for group, data in entries:
+                    f.write(json.dumps({"group": group, "data": data}, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self.spooled += len(entries)
+            logger.warning(f"💾 В спул отложено {len(entries)} записей (всего {self.spooled})")
+        except OSError as e:
+            logger.error(f"❌ Не удалось записать спул: {e} - потеряно {len(entries)} записей")
+
+    def _read_spool(self) -> List[Entry]:
+        entries = []
+        with open(self.spool_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # строка, оборванная падением процесса
+                entries.append((tuple(record["group"]), record["data"]))
+        return entries
+
+    def _count_spooled(self) -> int:
+        if not self.spool_path or not os.path.exists(self.spool_path):
+            return 0
+        with open(self.spool_path, encoding="utf-8") as f:
+            return sum(1 for _ in f)
+
+    async def _replay(self):
+        """Переигрывает спул; не записавшийся остаток остаётся в файле"""
+        if not self.spool_path or not os.path.exists(self.spool_path):
+            self.spooled = 0
+            return
+        entries = self._read_spool()
+        failed = await self._write_groups(self._groups(entries))
+        if len(failed) == len(entries):
+            return  # не записалось ничего - файл не трогаем
+        replay_path = self.spool_path + ".replay"
+        if failed:
+            with open(replay_path, "w", encoding="utf-8") as f:
+                for group, data in failed:
+                    f.write(json.dumps({"group": group, "data": data}, ensure_ascii=False) + "\n")
+            os.replace(replay_path, self.spool_path)
+        else:
+            os.remove(self.spool_path)
+        logger.info(f"💾 Спул переигран: записано {len(entries) - len(failed)}, осталось {len(failed)}")
+        self.spooled = len(failed)
+
+    async def replay(self):
+        """Переигрывает спул, оставшийся с прошлого запуска"""
+        if self.spooled:
+            async with self._lock:
+                await self._replay()
+
+    async def close(self):
+        """Записывает накопленное (или отправляет в спул) и дожидается записи"""
+        self._flush_now()
+        if self._flushing:
+            await asyncio.gather(*self._flushing)
+
+    def summary(self) -> str:
+        return (
+            f"в очереди {self.depth}, записано {self.written}, в спуле {self.spooled}, "
+            f"отклонено {self.dead}, ошибок {self.failures}; пачка: {self.latency.summary()}"
+        )
@@ -1,19 +1,60 @@
 from aiogram import F, Bot
 from aiogram.types import Message, CallbackQuery, ReactionTypeEmoji
-from bot import dp, bot
-from database.supabase_db import Database
-from utils.detector_instance import detector  # импортируем общий экземпляр
-from keyboards.inline import get_moderation_keyboard
-from config import CHANNEL_ID, BAN_LIST_CHAT_ID
+from bot import dp, bot, api
+from database.supabase_db import Database, chat_settings
+from database.chat_settings import ChatSettings
+from database.suspect_registry import Suspect, new_token
+from utils.detector import BotDetector
+from utils.detector_instance import detectors, training_scheduler, reputation
+from keyboards.inline import (
+    get_moderation_keyboard, get_digest_keyboard, parse_digest_keyboard, DIGEST_TOGGLE, DIGEST_ACTION,
+)
+from config import (
+    CHANNEL_ID, ML_CONFIDENCE_ON_CARD,
+    DIGEST_BURST_THRESHOLD, DIGEST_WINDOW, DIGEST_MAX_ITEMS, DIGEST_FLUSH_DELAY, DEDUP_AUTO_BAN,
+)
 from handlers.commands import router as commands_router
+from utils.metrics import LatencyStat
+from utils.telegram_scheduler import Priority
+from utils.moderation_digest import ModerationDigest, SuspectItem
+from utils.near_duplicates import Cluster
+from collections import OrderedDict
+from typing import Dict, List, Optional
+import asyncio
+import html
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 
+# От получения сообщения до карточки у модераторов и до завершения всей отправки
+# (реакция и запись в БД)
+moderation_latency = {
+    'card': LatencyStat(),
+    'total': LatencyStat(),
+}
+
 dp.include_router(commands_router)
 
+# Длина текста сообщения в строке дайджеста и лимит Telegram на сообщение
+DIGEST_EXCERPT = 80
+MESSAGE_LIMIT = 4096
+
+# Через сколько секунд обновлять счётчик похожих в карточке (правки копятся)
+CLUSTER_CARD_DELAY = 2.0
+_card_updates = set()  # кластеры с запланированной правкой карточки
+
 OWNER_ID = 2068329433
 
+@dp.message(F.new_chat_members)
+async def new_members_handler(message: Message):
+    """Вход в отслеживаемый чат: отметка для предфильтра новичков"""
+    if reputation is None or Database.get_chat_settings(message.chat.id) is None:
+        return
+    for user in message.new_chat_members:
+        if not user.is_bot:
+            reputation.joined(user.id)
+
 @dp.message(~F.text.startswith("/"))
 async def channel_message_handler(message: Message):
     logger.info("all_messages handle")
@@ -24,6 +65,11 @@ async def channel_message_handler(message: Message):
     await handle_user_message(message)
 
 async def handle_user_message(message: Message):
+    started = time.perf_counter()
+    settings = Database.get_chat_settings(message.chat.id)
+    if settings is None:
+        return  # чат не отслеживается
+    detector = detectors.get(settings)
     try:
         is_trusted = await Database.is_trusted(message.from_user.id)
         if is_trusted:
@@ -38,139 +84,602 @@ async def handle_user_message(message: Message):
 
         text_to_check = message.text or message.caption or ""
 
-        is_susp, ml_confidence = await detector.is_suspicious(text_to_check, user_info)
-
-        if is_susp:
-            try:
-                await message.react([ReactionTypeEmoji(emoji="👀")])
-            except Exception as e:
-                logger.error(f"❌ Не удалось поставить реакцию: {e}")
+        is_susp, ml_confidence, cluster = await detector.classify(text_to_check, user_info)
 
-            await send_to_moderation(message, ml_confidence)
+        if not is_susp:
+            return
+        if cluster is not None and cluster.verdict and cluster.source == "moderator" and DEDUP_AUTO_BAN:
+            # Копия шаблона, который модератор уже забанил
+            await ban_duplicate(message, ml_confidence, cluster)
+        elif cluster is not None and cluster.card is not None and cluster.card[0] == settings.ban_list_chat_id:
+            # По шаблону уже есть карточка - сообщение присоединяется к ней
+            await join_cluster_card(message, ml_confidence, cluster, settings, detector)
+        else:
+            await send_to_moderation(message, ml_confidence, started=started, cluster=cluster,
+                                     settings=settings, detector=detector)
 
     except Exception as e:
         logger.error(f"❌ Ошибка в handle_user_message: {e}", exc_info=True)
 
-async def send_to_moderation(message: Message, ml_confidence: float = None):
-    from bot import bot
-
-    user = message.from_user
-    logger.info(f"📤 Пересылка сообщения в бан-лист чат {BAN_LIST_CHAT_ID}")
-
+async def _react(message: Message):
     try:
-        forwarded = await message.forward(chat_id=BAN_LIST_CHAT_ID)
-        logger.info(f"✅ Сообщение переслано, ID: {forwarded.message_id}")
-
-        if message.chat.username:
-            original_link = f"https://t.me/{message.chat.username}/{message.message_id}"
-        else:
-            original_link = f"Сообщение ID: {message.message_id}"
-
-        ml_info = ""
-        if ml_confidence is not None:
-            confidence_percent = ml_confidence * 100
-            ml_info = f"🤖 <b>ML уверенность:</b> {confidence_percent:.1f}%\n"
-
-        info_text = (
-            f"👾 <b>ПОДОЗРИТЕЛЬНЫЙ ПОЛЬЗОВАТЕЛЬ</b>\n\n"
-            f"👤 <b>Имя:</b> {user.full_name}\n"
-            f"🆔 <b>ID:</b> <code>{user.id}</code>\n"
-            f"📝 <b>Username:</b> @{user.username if user.username else 'нет'}\n"
-            f"🔗 <b>Ссылка на оригинал:</b> {original_link}\n"
-            f"{ml_info}"
-            f"\n👆 <b>Выше переслано оригинальное сообщение</b>\n"
-            f"👀 <b>Что делать?</b>"
-        )
-
-        info_message = await bot.send_message(
-            chat_id=BAN_LIST_CHAT_ID,
-            text=info_text,
-            reply_markup=get_moderation_keyboard(message.message_id, user.id)
+        # Реакция информационная: в рейд уступает банам и карточкам, а
+        # пролежавшая в очереди минуту уже не нужна
+        await api.call(
+            message.chat.id, lambda: message.react([ReactionTypeEmoji(emoji="👀")]), Priority.LOW, ttl=60
         )
-        logger.info(f"✅ Информация отправлена, ID: {info_message.message_id}")
+    except Exception as e:
+        logger.error(f"❌ Не удалось поставить реакцию: {e}")
 
-        message_text = message.text or message.caption or "[Медиафайл]"
-        await Database.add_to_ban_list(
+async def _save_suspect(message: Message, ml_confidence: Optional[float], token: Optional[str] = None) -> Optional[str]:
+    """Запись в ban_list и реестр подозреваемых; токен для кнопок"""
+    user = message.from_user
+    try:
+        token = await Database.add_to_ban_list(
             chat_id=message.chat.id,
             message_id=message.message_id,
             user_id=user.id,
             username=user.username,
             full_name=user.full_name,
-            suspect_message=message_text,
-            ml_confidence=ml_confidence
+            suspect_message=message.text or message.caption or "[Медиафайл]",
+            ml_confidence=ml_confidence,
+            token=token
         )
         logger.info(f"✅ Данные сохранены в БД")
+    except Exception as e:
+        logger.error(f"❌ Ошибка сохранения в БД: {e}")
+    return token
+
+def _info_text(message: Message, ml_confidence: Optional[float]) -> str:
+    user = message.from_user
+    if message.chat.username:
+        original_link = f"https://t.me/{message.chat.username}/{message.message_id}"
+    else:
+        original_link = f"Сообщение ID: {message.message_id}"
+
+    ml_info = ""
+    if ml_confidence is not None:
+        confidence_percent = ml_confidence * 100
+        ml_info = f"🤖 <b>ML уверенность:</b> {confidence_percent:.1f}%\n"
+
+    return (
+        f"👾 <b>ПОДОЗРИТЕЛЬНЫЙ ПОЛЬЗОВАТЕЛЬ</b>\n\n"
+        f"👤 <b>Имя:</b> {user.full_name}\n"
+        f"🆔 <b>ID:</b> <code>{user.id}</code>\n"
+        f"📝 <b>Username:</b> @{user.username if user.username else 'нет'}\n"
+        f"🔗 <b>Ссылка на оригинал:</b> {original_link}\n"
+        f"{ml_info}"
+        f"\n👆 <b>Выше переслано оригинальное сообщение</b>\n"
+        f"👀 <b>Что делать?</b>"
+    )
+
+async def send_to_moderation(message: Message, ml_confidence: float = None, started: Optional[float] = None,
+                             cluster: Optional[Cluster] = None, settings: Optional[ChatSettings] = None,
+                             detector: Optional[BotDetector] = None):
+    """
+    Реакция, пересылка и расчёт уверенности ML идут параллельно; запись в БД
+    стартует, как только известна уверенность. Порядок соблюдается там, где
+    он виден модератору: карточка отправляется только после пересылки.
+    """
+    from bot import bot
+
+    if started is None:
+        started = time.perf_counter()
+    if settings is None:
+        settings = Database.get_chat_settings(message.chat.id) or chat_settings.default
+    if detector is None:
+        detector = detectors.get(settings)
+    ban_list_chat_id = settings.ban_list_chat_id
+    user = message.from_user
+
+    digest = get_digest(ban_list_chat_id)
+    if digest.register():
+        # Рейд: вместо пересылки и карточки - строка в общем дайджесте
+        react_task = asyncio.create_task(_react(message))
+        if ml_confidence is None and ML_CONFIDENCE_ON_CARD:
+            ml_confidence = await detector.ml_confidence(message.text or message.caption or "")
+        digest.add(SuspectItem(message, ml_confidence, started))
+        await react_task
+        return
+
+    logger.info(f"📤 Пересылка сообщения в бан-лист чат {ban_list_chat_id}")
+    if cluster is not None and cluster.card is None:
+        # Похожие сообщения, пришедшие до отправки карточки, сразу копятся в кластере
+        cluster.card = (ban_list_chat_id, None, None, None)
+
+    react_task = asyncio.create_task(_react(message))
+    forward_task = asyncio.create_task(
+        api.call(ban_list_chat_id, lambda: message.forward(chat_id=ban_list_chat_id), send=True)
+    )
+
+    # Правила уже вынесли вердикт без ML - досчитываем уверенность для модератора
+    if ml_confidence is None and ML_CONFIDENCE_ON_CARD:
+        ml_confidence = await detector.ml_confidence(message.text or message.caption or "")
+    # Токен известен до записи: карточка не ждёт БД
+    token = new_token()
+    save_task = asyncio.create_task(_save_suspect(message, ml_confidence, token))
+
+    try:
+        forwarded = await forward_task
+        logger.info(f"✅ Сообщение переслано, ID: {forwarded.message_id}")
+
+        info_text = _info_text(message, ml_confidence)
+        keyboard = get_moderation_keyboard(token)
+        info_message = await api.call(ban_list_chat_id, lambda: bot.send_message(
+            chat_id=ban_list_chat_id,
+            text=info_text,
+            reply_markup=keyboard
+        ), send=True)
+        moderation_latency['card'].since(started)
+        logger.info(f"✅ Информация отправлена, ID: {info_message.message_id}")
+        if cluster is not None:
+            cluster.card = (ban_list_chat_id, info_message.message_id, info_text, keyboard)
+            if cluster.members:
+                asyncio.create_task(update_cluster_card(cluster))
 
     except Exception as e:
         logger.error(f"❌ Ошибка отправки в бан-лист: {e}")
+        if cluster is not None:
+            cluster.card = None
+    finally:
+        await asyncio.gather(react_task, save_task)
+        moderation_latency['total'].since(started)
+
+async def ban_duplicate(message: Message, ml_confidence: Optional[float], cluster: Cluster):
+    """Бан без карточки: модератор уже забанил сообщение этого шаблона"""
+    from bot import bot
+
+    user = message.from_user
+    chat_id = message.chat.id
+    token = await _save_suspect(message, ml_confidence)
+    try:
+        await api.call(chat_id, lambda: bot.ban_chat_member(chat_id=chat_id, user_id=user.id), Priority.URGENT)
+        await api.call(
+            chat_id, lambda: bot.delete_message(chat_id=chat_id, message_id=message.message_id), Priority.URGENT
+        )
+        await Database.update_suspect_status(message.message_id, 'banned', chat_id, token)
+        logger.info(f"🔨 {user.id} забанен автоматически: копия забаненного шаблона #{cluster.id}")
+    except Exception as e:
+        logger.error(f"❌ Не удалось забанить копию шаблона #{cluster.id}: {e}")
+
+async def join_cluster_card(message: Message, ml_confidence: Optional[float], cluster: Cluster,
+                            settings: ChatSettings, detector: BotDetector):
+    """Сообщение ждёт решения по уже отправленной карточке своего шаблона"""
+    if not detector.near_duplicates.add_member(cluster, message.chat.id, message.message_id, message.from_user.id):
+        # Список кластера полон - отдельная карточка
+        await send_to_moderation(message, ml_confidence, settings=settings, detector=detector)
+        return
+    await asyncio.gather(_react(message), _save_suspect(message, ml_confidence))
+    if cluster.card is not None and cluster.card[1] is not None:
+        # Правка отложена - обработчик апдейта её не ждёт
+        asyncio.create_task(update_cluster_card(cluster))
+
+async def update_cluster_card(cluster: Cluster):
+    """Счётчик похожих в карточке; правки за CLUSTER_CARD_DELAY секунд сливаются в одну"""
+    from bot import bot
+
+    if cluster in _card_updates:
+        return
+    _card_updates.add(cluster)
+    try:
+        await asyncio.sleep(CLUSTER_CARD_DELAY)
+        card = cluster.card
+        if card is None or card[1] is None or cluster.card_size == len(cluster.members):
+            return
+        cluster.card_size = len(cluster.members)
+        chat_id, message_id, text, keyboard = card
+        await api.call(chat_id, lambda: bot.edit_message_text(
+            chat_id=chat_id,
+            message_id=message_id,
+            text=text + f"\n\n🧬 <b>Похожих сообщений:</b> {cluster.card_size} - решение применится ко всем",
+            reply_markup=keyboard
+        ), Priority.LOW, ttl=60)
+    except Exception as e:
+        logger.error(f"❌ Не удалось обновить карточку шаблона #{cluster.id}: {e}")
+    finally:
+        _card_updates.discard(cluster)
+
+async def _apply_in_chat(chat_id: int, rows: List[tuple], banned: bool, keep_users=()) -> int:
+    """
+    Решение по сообщениям одного чата (message_id, user_id): баны
+    параллельно (массового бана в API нет), удаление пачками до 100,
+    статусы одним UPDATE. Возвращает число неудавшихся банов
+    """
+    from bot import bot
+
+    message_ids = [message_id for message_id, _ in rows]
+    failed = 0
+    if banned:
+        users = list(dict.fromkeys(user_id for _, user_id in rows if user_id not in keep_users))
+        results = await asyncio.gather(*(
+            api.call(chat_id, lambda user_id=user_id: bot.ban_chat_member(chat_id=chat_id, user_id=user_id),
+                     Priority.URGENT)
+            for user_id in users
+        ), return_exceptions=True)
+        failed = sum(isinstance(result, Exception) for result in results)
+        for start in range(0, len(message_ids), 100):
+            chunk = message_ids[start:start + 100]
+            try:
+                await api.call(chat_id, lambda chunk=chunk: bot.delete_messages(chat_id=chat_id, message_ids=chunk),
+                               Priority.URGENT)
+            except Exception as e:
+                logger.error(f"❌ Не удалось удалить сообщения: {e}")
+    await Database.update_suspects_status(message_ids, 'banned' if banned else 'skipped', chat_id)
+    return failed
+
+async def apply_decision(messages: List[tuple], banned: bool, keep_users=()) -> int:
+    """То же для сообщений (chat_id, message_id, user_id) из разных чатов - чаты параллельно"""
+    by_chat: Dict[int, List[tuple]] = {}
+    for chat_id, message_id, user_id in messages:
+        by_chat.setdefault(chat_id, []).append((message_id, user_id))
+    failed = await asyncio.gather(*(
+        _apply_in_chat(chat_id, rows, banned, keep_users) for chat_id, rows in by_chat.items()
+    ))
+    return sum(failed)
+
+async def resolve_cluster(cluster: Optional[Cluster], banned: bool, exclude_user: int) -> int:
+    """Применяет решение модератора к похожим сообщениям кластера. Возвращает число сообщений"""
+    if cluster is None:
+        return 0
+    members, cluster.members = cluster.members, []
+    cluster.card = None
+    cluster.card_size = 0
+    if members:
+        await apply_decision(members, banned, keep_users=(exclude_user,))
+    return len(members)
+
+def _cluster_note(count: int) -> str:
+    return f" (+{count} похожих)" if count else ""
+
+def _digest_text(items: List[SuspectItem], excerpt: int) -> str:
+    lines = []
+    for number, item in enumerate(items, 1):
+        message = item.message
+        user = message.from_user
+        text = message.text or message.caption or "[Медиафайл]"
+        if len(text) > excerpt:
+            text = text[:excerpt] + "…"
+        confidence = f" 🤖 {item.ml_confidence * 100:.0f}%" if item.ml_confidence is not None else ""
+        lines.append(
+            f"<b>{number}.</b> {html.escape(user.full_name)} "
+            f"(@{user.username if user.username else 'нет'}, <code>{user.id}</code>){confidence}\n"
+            f"    <i>{html.escape(text)}</i>"
+        )
+    return (
+        f"🚨 <b>РЕЙД: {len(items)} подозрительных сообщений</b>\n\n"
+        + "\n".join(lines)
+        + "\n\n👀 <b>Отметьте строки или примените действие ко всем</b>"
+    )
+
+async def send_digest(ban_list_chat_id: int, items: List[SuspectItem]):
+    """Один дайджест вместо len(items) пересылок и карточек"""
+    from bot import bot
+
+    excerpt = DIGEST_EXCERPT
+    text = _digest_text(items, excerpt)
+    while len(text) > MESSAGE_LIMIT and excerpt > 10:
+        excerpt //= 2
+        text = _digest_text(items, excerpt)
+
+    keyboard = get_digest_keyboard(
+        [
+            (item.message.chat.id, item.message.message_id, item.message.from_user.id,
+             f"@{item.message.from_user.username}" if item.message.from_user.username
+             else item.message.from_user.full_name[:24])
+            for item in items
+        ],
+        selected=set()
+    )
+    rows = [
+        {
+            "chat_id": item.message.chat.id,
+            "message_id": item.message.message_id,
+            "user_id": item.message.from_user.id,
+            "username": item.message.from_user.username,
+            "full_name": item.message.from_user.full_name,
+            "suspect_message": item.message.text or item.message.caption or "[Медиафайл]",
+            "ml_confidence": item.ml_confidence,
+        }
+        for item in items
+    ]
+    # Запись в БД и отправка дайджеста параллельно
+    save_task = asyncio.create_task(Database.add_to_ban_list_bulk(rows))
+    try:
+        await api.call(ban_list_chat_id, lambda: bot.send_message(
+            chat_id=ban_list_chat_id,
+            text=text,
+            reply_markup=keyboard
+        ), send=True)
+        for item in items:
+            moderation_latency['card'].since(item.started)
+        logger.info(f"✅ Дайджест отправлен: {len(items)} подозреваемых")
+    finally:
+        await save_task
+
+# Дайджест включается сам, когда подозрительных сообщений становится много;
+# всплеск считается отдельно для каждого бан-лист чата
+_digests: Dict[int, ModerationDigest] = {}
+
+def get_digest(ban_list_chat_id: int) -> ModerationDigest:
+    digest = _digests.get(ban_list_chat_id)
+    if digest is None:
+        digest = _digests[ban_list_chat_id] = ModerationDigest(
+            lambda items: send_digest(ban_list_chat_id, items),
+            burst_threshold=DIGEST_BURST_THRESHOLD,
+            window=DIGEST_WINDOW,
+            max_items=DIGEST_MAX_ITEMS,
+            flush_delay=DIGEST_FLUSH_DELAY,
+        )
+    return digest
+
+# Дайджесты (чат, сообщение), решение по которым применяется или применено:
+# повторное нажатие, в том числе со старой клавиатурой, ничего не делает
+APPLIED_DIGESTS_SIZE = 1000
+_applied_digests: "OrderedDict[tuple, None]" = OrderedDict()
+
+def _mark_digest_applied(key: tuple):
+    _applied_digests[key] = None
+    while len(_applied_digests) > APPLIED_DIGESTS_SIZE:
+        _applied_digests.popitem(last=False)
+
+async def close_digests():
+    """Отправляет накопленные дайджесты всех бан-лист чатов"""
+    await asyncio.gather(*(digest.close() for digest in _digests.values()))
+
+def digest_summary() -> str:
+    digests = sum(digest.digests for digest in _digests.values())
+    digested = sum(digest.digested for digest in _digests.values())
+    pending = sum(digest.pending for digest in _digests.values())
+    return f"дайджестов {digests} ({digested} сообщений), ждут отправки {pending}"
+
+def _legacy_chat_id():
+    """
+    Чат кнопок старого формата без chat_id - CHANNEL_ID как есть: числовой
+    id или @username, с которым Telegram-вызовы работают так же
+    """
+    return chat_settings.default.chat_id if chat_settings.default.chat_id is not None else CHANNEL_ID
+
+async def _callback_suspect(data: str):
+    """
+    action:token; карточки старых форматов - action:chat_id:message_id:user_id
+    и action:message_id:user_id (чат по умолчанию) - ищутся по сообщению
+    """
+    action, *parts = data.split(':')
+    if len(parts) == 1:
+        return action, await Database.get_suspect(parts[0])
+    if len(parts) == 2:
+        chat_id = _legacy_chat_id()
+        message_id, user_id = map(int, parts)
+        if not isinstance(chat_id, int):
+            # Числовой id чата неизвестен - сообщение без чата искать нельзя:
+            # message_id совпадает в разных чатах. Решение - только в Telegram
+            return action, Suspect(None, chat_id, message_id, user_id, None, None)
+    else:
+        chat_id, message_id, user_id = map(int, parts)
+    suspect = await Database.find_suspect(message_id, chat_id)
+    if suspect is None:
+        # В ban_list записи нет - решение всё равно применяется к пользователю
+        suspect = Suspect(None, chat_id, message_id, user_id, None, None)
+    return action, suspect
+
+def _detector_for(chat_id: Optional[int]) -> BotDetector:
+    settings = (Database.get_chat_settings(chat_id) if chat_id is not None else None) or chat_settings.default
+    return detectors.get(settings)
 
 @dp.callback_query(lambda c: c.data.startswith(('skip:', 'ban:', 'trust:')))
 async def moderation_callback(callback: CallbackQuery):
+    """Нажатие не читает БД: всё о подозреваемом - в реестре, записи идут параллельно"""
     from bot import bot
 
-    action, message_id, user_id = callback.data.split(':')
-    message_id = int(message_id)
-    user_id = int(user_id)
-
     moderator = callback.from_user
+    suspect = None
 
     try:
+        action, suspect = await _callback_suspect(callback.data)
+        if suspect is None:
+            await callback.answer("Подозреваемый не найден", show_alert=True)
+            return
+        # Захват до первого await: второе нажатие на ту же карточку видит "Уже обработано"
+        if not suspect.claim():
+            await callback.answer("Уже обработано")
+            return
+        chat_id, message_id, user_id = suspect.chat_id, suspect.message_id, suspect.user_id
+        detector = _detector_for(chat_id)
+
         if action == 'skip':
             # Сохраняем как хороший пример
-            message_info = await Database.get_suspect_message(message_id)
-            if message_info and message_info.get('suspect_message'):
-                await Database.add_training_example(
-                    text=message_info['suspect_message'],
-                    label=0,
-                    moderated_by=moderator.id
-                )
-
-            await Database.update_suspect_status(message_id, 'skipped')
-            await callback.message.edit_text(
-                callback.message.text + f"\n\n✅ <b>Пропущено модератором @{moderator.username}</b>"
+            cluster = detector.record_verdict(suspect.text, False) if suspect.text else None
+            if reputation is not None:
+                reputation.moderated(user_id, banned=False)
+            _, similar = await asyncio.gather(
+                Database.resolve_suspect(suspect, 'skipped', moderator.id, label=0),
+                resolve_cluster(cluster, banned=False, exclude_user=user_id),
             )
+            if suspect.text:
+                training_scheduler.notify()
+
+            await api.call(callback.message.chat.id, lambda: callback.message.edit_text(
+                callback.message.text + f"\n\n✅ <b>Пропущено модератором @{moderator.username}</b>{_cluster_note(similar)}"
+            ))
             await callback.answer("✅ Пропущено")
 
         elif action == 'ban':
             try:
-                await bot.ban_chat_member(chat_id=CHANNEL_ID, user_id=user_id)
-
-                message_info = await Database.get_suspect_message(message_id)
-                if message_info and message_info.get('suspect_message'):
-                    await Database.add_training_example(
-                        text=message_info['suspect_message'],
-                        label=1,
-                        moderated_by=moderator.id
-                    )
-
-                await Database.update_suspect_status(message_id, 'banned')
-
-                try:
-                    await bot.delete_message(chat_id=CHANNEL_ID, message_id=message_id)
-                except Exception as e:
-                    logger.error(f"❌ Не удалось удалить сообщение: {e}")
+                await api.call(
+                    chat_id, lambda: bot.ban_chat_member(chat_id=chat_id, user_id=user_id), Priority.URGENT
+                )
 
-                await callback.message.edit_text(
-                    callback.message.text + f"\n\n🔨 <b>Забанен модератором @{moderator.username}</b>"
+                async def delete():
+                    try:
+                        await api.call(
+                            chat_id, lambda: bot.delete_message(chat_id=chat_id, message_id=message_id),
+                            Priority.URGENT
+                        )
+                    except Exception as e:
+                        logger.error(f"❌ Не удалось удалить сообщение: {e}")
+
+                cluster = detector.record_verdict(suspect.text, True) if suspect.text else None
+                if reputation is not None:
+                    reputation.moderated(user_id, banned=True)
+                _, similar, _ = await asyncio.gather(
+                    Database.resolve_suspect(suspect, 'banned', moderator.id, label=1),
+                    resolve_cluster(cluster, banned=True, exclude_user=user_id),
+                    delete(),
                 )
+                if suspect.text:
+                    training_scheduler.notify()
+
+                await api.call(callback.message.chat.id, lambda: callback.message.edit_text(
+                    callback.message.text + f"\n\n🔨 <b>Забанен модератором @{moderator.username}</b>{_cluster_note(similar)}"
+                ))
                 await callback.answer("🔨 Забанен")
 
             except Exception as e:
                 logger.error(f"❌ Ошибка бана: {e}")
+                suspect.release()
                 await callback.answer(f"Ошибка: {e}", show_alert=True)
 
         elif action == 'trust':
-            await Database.add_trusted_user(
-                user_id=user_id,
-                username=moderator.username,
-                full_name=moderator.full_name
+            await asyncio.gather(
+                Database.add_trusted_user(
+                    user_id=user_id,
+                    username=moderator.username,
+                    full_name=moderator.full_name
+                ),
+                Database.resolve_suspect(suspect, 'trusted', moderator.id),
             )
-            await Database.update_suspect_status(message_id, 'trusted')
-            await callback.message.edit_text(
+            await api.call(callback.message.chat.id, lambda: callback.message.edit_text(
                 callback.message.text + f"\n\n👑 <b>Доверенный (добавил @{moderator.username})</b>"
-            )
+            ))
             await callback.answer("👑 Добавлен в доверенные")
 
     except Exception as e:
         logger.error(f"❌ Ошибка в moderation_callback: {e}", exc_info=True)
-        await callback.answer("Ошибка", show_alert=True)
\ No newline at end of file
+        if suspect is not None:
+            suspect.release()
+        await callback.answer("Ошибка", show_alert=True)
+
+@dp.callback_query(lambda c: c.data.startswith((DIGEST_TOGGLE + ':', DIGEST_ACTION + ':')))
+async def digest_callback(callback: CallbackQuery):
+    from bot import bot
+
+    items, selected = parse_digest_keyboard(callback.message.reply_markup, _legacy_chat_id())
+    digest_key = (callback.message.chat.id, callback.message.message_id)
+    if not items or digest_key in _applied_digests:
+        await callback.answer("Дайджест уже обработан")
+        return
+
+    prefix, *args = callback.data.split(':')
+    moderator = callback.from_user
+    claimed = []
+    applied = False  # решение начало применяться - откатывать захват нельзя
+    answered = False  # на callback уже ответили, второй answer не пройдёт
+
+    try:
+        if prefix == DIGEST_TOGGLE:
+            # Переключатель строки: перерисовываем клавиатуру, действий нет
+            key = (int(args[0]), int(args[1])) if len(args) == 4 else (_legacy_chat_id(), int(args[0]))
+            selected ^= {key}
+            await api.call(callback.message.chat.id, lambda: callback.message.edit_reply_markup(
+                reply_markup=get_digest_keyboard(items, selected)
+            ))
+            await callback.answer()
+            return
+
+        action = args[0]
+        if action == 'ban_all':
+            banned = {(chat_id, message_id) for chat_id, message_id, _, _ in items}
+        elif action == 'ban_selected':
+            if not selected:
+                await callback.answer("Никто не отмечен", show_alert=True)
+                return
+            banned = selected
+        else:
+            banned = set()
+
+        # Захват до первого await, как у одиночной карточки: второе нажатие
+        # видит дайджест обработанным, строки, уже решённые по карточке, пропускаются
+        _mark_digest_applied(digest_key)
+        pending = []
+        for item in items:
+            suspect = Database.cached_suspect(item[1], item[0])
+            if suspect is not None:
+                if not suspect.claim():
+                    continue
+                claimed.append(suspect)
+            pending.append(item)
+        items = pending
+
+        to_ban = [(chat_id, message_id, user_id) for chat_id, message_id, user_id, _ in items
+                  if (chat_id, message_id) in banned]
+        to_skip = [(chat_id, message_id, user_id) for chat_id, message_id, user_id, _ in items
+                   if (chat_id, message_id) not in banned]
+        ban_users = {(chat_id, user_id) for chat_id, _, user_id in to_ban}
+        applied = True
+        if reputation is not None:
+            for _, _, user_id in to_ban:
+                reputation.moderated(user_id, banned=True)
+            for _, _, user_id in to_skip:
+                reputation.moderated(user_id, banned=False)
+
+        await callback.answer("⏳ Применяю...")
+        answered = True
+
+        # Telegram и статусы - по чатам; тексты для обучения - из реестра,
+        # чтение БД (одно на чат) - только для вытесненных из него
+        texts: Dict[tuple, str] = {}
+        by_chat: Dict[int, List[int]] = {}
+        for chat_id, message_id, _, _ in items:
+            suspect = Database.cached_suspect(message_id, chat_id)
+            if suspect is None:
+                if isinstance(chat_id, int):  # без числового id чата строку не найти
+                    by_chat.setdefault(chat_id, []).append(message_id)
+                continue
+            suspect.status = 'banned' if (chat_id, message_id) in banned else 'skipped'
+            if suspect.text:
+                texts[(chat_id, message_id)] = suspect.text
+        results = await asyncio.gather(
+            apply_decision(to_ban, banned=True),
+            apply_decision(to_skip, banned=False),
+            *(Database.get_suspect_messages(message_ids, chat_id) for chat_id, message_ids in by_chat.items()),
+        )
+        failed = results[0]
+        for chunk in results[2:]:
+            for info in chunk:
+                if info.get("suspect_message"):
+                    texts[(info["chat_id"], info["message_id"])] = info["suspect_message"]
+        examples = [
+            {"text": text, "label": 1 if key in banned else 0}
+            for key, text in texts.items()
+        ]
+        try:
+            await Database.add_training_examples_bulk(examples, moderated_by=moderator.id)
+            training_scheduler.notify(len(examples))
+        except Exception as e:
+            logger.error(f"❌ Не удалось сохранить примеры для обучения: {e}")
+
+        verdict = (
+            f"\n\n🔨 <b>Забанено: {len(ban_users) - failed}</b>"
+            + (f" (ошибок: {failed})" if failed else "")
+            + f", ✅ <b>пропущено: {len(to_skip)}</b> - @{moderator.username}"
+        )
+        await api.call(callback.message.chat.id, lambda: callback.message.edit_text(
+            callback.message.html_text + verdict, reply_markup=None
+        ))
+
+    except Exception as e:
+        logger.error(f"❌ Ошибка в digest_callback: {e}", exc_info=True)
+        if not applied:
+            # Ничего не применено - дайджест можно нажать снова
+            for suspect in claimed:
+                suspect.release()
+            _applied_digests.pop(digest_key, None)
+        try:
+            if answered:
+                await api.call(callback.message.chat.id, lambda: callback.message.reply(
+                    f"❌ Дайджест применён не полностью: {html.escape(str(e))}"
+                ), send=True)
+            else:
+                await callback.answer("Ошибка", show_alert=True)
+        except Exception as report_error:
+            logger.error(f"❌ Не удалось сообщить об ошибке дайджеста: {report_error}")
@@ -1,14 +1,17 @@
 from aiogram import Router
 from aiogram.types import Message, FSInputFile
-from aiogram.filters import Command
+from aiogram.filters import Command, CommandObject
 import logging
 import os
-import tempfile
-from config import CHANNEL_ID, BAN_LIST_CHAT_ID
-from bot import bot
-from utils.detector_instance import detector
+import time
+from config import (
+    CHANNEL_ID, BAN_LIST_CHAT_ID, TRAINING_INSERT_BATCH, TRAINING_INSERT_CONCURRENCY, TRAINING_INGEST_DIR, BOT_MODE,
+)
+from bot import bot, api, updates
+from utils.detector_instance import detector, detectors, training_scheduler, reputation
+from utils.metrics import format_stats
 from database.supabase_db import Database
-from utils.training_loader import TrainingDataLoader
+from utils.training_loader import TrainingDataLoader, LoadProgress
 
 router = Router()
 logger = logging.getLogger(__name__)
@@ -72,15 +75,19 @@ async def cmd_test_message(message: Message):
         f"✅ Если вы видите это сообщение в ban-list чате, значит всё работает!"
     )
     
+    # Ban-list чат того чата, где вызвана команда (если он отслеживается)
+    settings = Database.get_chat_settings(message.chat.id)
+    ban_list_chat_id = settings.ban_list_chat_id if settings else BAN_LIST_CHAT_ID
+    
     try:
         sent = await bot.send_message(
-            chat_id=BAN_LIST_CHAT_ID,
+            chat_id=ban_list_chat_id,
             text=test_text
         )
         
         await message.reply(
             f"✅ <b>Тестовое сообщение отправлено!</b>\n\n"
-            f"📍 Проверьте чат: <code>{BAN_LIST_CHAT_ID}</code>\n"
+            f"📍 Проверьте чат: <code>{ban_list_chat_id}</code>\n"
             f"📎 ID сообщения: <code>{sent.message_id}</code>"
         )
 
@@ -113,6 +120,38 @@ async def cmd_channel_info(message: Message):
     
     await message.reply(info_text)
 
+def _batcher_status() -> str:
+    batcher = detector.ml_batcher
+    if batcher is None:
+        return "• Батчинг ML: выключен\n"
+    return (
+        f"• Пачек ML: {batcher.batches}, ср. размер {batcher.mean_batch_size:.1f}, "
+        f"ср. время {batcher.batch_latency.mean_ms:.2f} мс\n"
+    )
+
+def _updates_status() -> str:
+    if BOT_MODE != "webhook":
+        return ""
+    return f"• Входящие апдейты: {updates.summary()}\n• Обработка апдейта: {updates.latency.summary()}\n"
+
+def _dedup_status() -> str:
+    index = detector.near_duplicates
+    if index is None:
+        return ""
+    return f"• Почти-дубликаты: {index.summary()}, вердиктов без проверки {detector.dedup_hits}\n"
+
+def _pool_status() -> str:
+    pool = detector.inference_pool
+    if pool is None:
+        return ""
+    lines = [f"• Пул процессов: {pool.pool_size} воркеров, в работе {pool.inflight}, перезапусков {pool.restarts}"]
+    for worker in pool.health():
+        lines.append(
+            f"  ◦ pid {worker['pid']}: {worker['batches']} пачек, ср. {worker['mean_ms']:.2f} мс, "
+            f"макс. {worker['max_ms']:.1f} мс, простой {worker['idle_s']:.0f} с"
+        )
+    return "\n".join(lines) + "\n"
+
 @router.message(Command("monster_moderator_status"))
 async def cmd_status(message: Message):
     """Статус бота - /monster_moderator_status"""
@@ -123,25 +162,48 @@ async def cmd_status(message: Message):
         logger.warning(f"User {user.id} tried to use status command without permission")
         return
     
-    # Проверка подключения к Supabase (опционально)
+    # Проверка подключения к хранилищу (опционально)
     supabase_status = "✅ Подключено"
     try:
-        from database.supabase_db import Database
-        await Database.is_trusted(0)
+        await Database.ping()
     except Exception as e:
         supabase_status = f"❌ Ошибка: {str(e)[:50]}"
+
+    cache = Database.trusted_cache_stats()
+    registry = Database.suspect_registry_stats()
+    # channel импортирует этот модуль, поэтому импорт - по месту
+    from handlers.channel import moderation_latency, digest_summary
     
     status_text = (
         f"📊 <b>СТАТУС БОТА</b>\n\n"
         f"🤖 <b>Бот:</b> @{bot.username}\n"
-        f"⚡ <b>Режим:</b> Локальный (polling)\n"
+        f"⚡ <b>Режим:</b> {'Вебхук' if BOT_MODE == 'webhook' else 'Локальный (polling)'}\n"
         f"✅ <b>Статус:</b> Работает\n\n"
         f"<b>🔌 Подключения:</b>\n"
         f"• Telegram API: ✅\n"
-        f"• Supabase: {supabase_status}\n\n"
+        f"• Хранилище ({Database.storage_name()}): {supabase_status}\n"
+        f"• Отложенная запись: {Database.writes_summary()}\n\n"
+        f"<b>👑 Кэш доверенных:</b>\n"
+        f"• Доверенных: {cache['trusted']}, отрицательных: {cache['negative']}\n"
+        f"• Попаданий: {cache['hits']}, промахов: {cache['misses']} ({cache['hit_rate'] * 100:.1f}%)\n"
+        f"• Реестр подозреваемых: {registry['size']}, попаданий {registry['hits']}, "
+        f"промахов {registry['misses']} ({registry['hit_rate'] * 100:.1f}%)\n\n"
+        f"<b>🧠 Детектор ({detector.policy}):</b>\n"
+        f"{format_stats(detector.stage_latency)}\n"
+        f"• Без ML: {detector.ml_skipped}\n"
+        f"{_batcher_status()}"
+        f"{_pool_status()}"
+        f"{_dedup_status()}"
+        f"• Репутация: {reputation.summary() if reputation is not None else 'выкл.'}\n"
+        f"• Фоновое обучение: {training_scheduler.status()}\n\n"
+        f"<b>📤 Отправка модераторам:</b>\n"
+        f"{format_stats(moderation_latency)}\n"
+        f"• Очередь Telegram API: {api.summary()}\n"
+        f"{_updates_status()}"
+        f"• Дайджесты: {digest_summary()}\n\n"
         f"<b>⚙️ Конфигурация:</b>\n"
-        f"• Канал: {CHANNEL_ID}\n"
-        f"• Ban-list: {BAN_LIST_CHAT_ID}\n"
+        f"• Канал по умолчанию: {CHANNEL_ID}, ban-list: {BAN_LIST_CHAT_ID}\n"
+        f"• Отслеживаемых чатов: {len(Database.monitored_chats())}, детекторов: {len(detectors)}\n"
         f"• Владелец: <code>{OWNER_ID}</code>"
     )
     
@@ -178,33 +240,38 @@ async def cmd_learn_moderate(message: Message):
         await message.reply("❌ У вас нет прав на использование этой команды.")
         return
 
-    await message.reply("🔄 Начинаю обучение ML модели...")
+    status = await message.reply(
+        "⏳ Обучение уже идёт, ваш запрос выполнится следующим..." if training_scheduler.running
+        else "🔄 Начинаю обучение ML модели..."
+    )
+    
+    async def report(summary: dict):
+        try:
+            await status.edit_text(
+                f"🔄 Обучение: применено {summary['examples']} примеров "
+                f"({summary['chunks']} порций), версия <code>{summary['version']}</code>"
+            )
+        except Exception as e:
+            logger.debug(f"Не удалось обновить прогресс: {e}")
 
     try:
-        # Получаем все непрочитанные размеченные примеры
-        examples = await Database.get_unprocessed_training_examples()
+        # Обучение идёт в фоновом процессе планировщика; ждём итог запуска,
+        # который учтёт этот запрос
+        summary = await training_scheduler.trigger(on_progress=report)
         
-        if not examples:
+        if 'error' in summary:
+            await message.reply(
+                f"❌ Ошибка обучения: {summary['error']}\n"
+                f"Применено до ошибки: {summary['examples']} примеров"
+            )
+        elif not summary['examples'] and not summary['recovered']:
             await message.reply("📭 Нет новых примеров для обучения")
-            return
-
-        texts = [ex['text'] for ex in examples]
-
-        labels = [ex['label'] for ex in examples]
-
-        # Дообучаем модель
-
-        result = await detector.train_ml(texts, labels, incremental=True)
-        
-        # Помечаем примеры как обработанные
-        example_ids = [ex['id'] for ex in examples]
-        
-        if 'error' not in result:
-            # Помечаем примеры как обработанные только при успехе
-            await Database.mark_training_examples_processed(example_ids)
-            await message.reply(f"✅ Модель успешно дообучена!\n...")
         else:
-            await message.reply(f"❌ Ошибка обучения: {result['error']}")
+            await message.reply(
+                f"✅ Модель успешно дообучена!\n"
+                f"📊 Примеров: {summary['examples']} ({summary['chunks']} порций)\n"
+                f"📦 Версия: <code>{summary['version'] or detector.ml_classifier.version}</code>"
+            )
             
     except Exception as e:
         logger.error(f"Ошибка обучения: {e}")
@@ -215,6 +282,54 @@ async def cmd_learn_moderate(message: Message):
 async def cmd_learn_short(message: Message):
     await cmd_learn_moderate(message)
 
+@router.message(Command("mm_model"))
+async def cmd_model(message: Message, command: CommandObject):
+    """
+    Версии ML модели - /mm_model
+    /mm_model rollback <версия> - откатиться на версию
+    /mm_model reload - перечитать активную модель с диска
+    """
+    if not is_owner(message.from_user.id):
+        await message.reply("❌ Только для владельца")
+        return
+    
+    args = (command.args or "").split()
+    
+    try:
+        if args and args[0] == "rollback":
+            if len(args) < 2:
+                await message.reply("❌ Укажите версию: /mm_model rollback &lt;версия&gt;")
+                return
+            await detector.rollback_ml(args[1])
+            await detectors.reload_shared()
+            await message.reply(f"⏪ Модель откатена на <code>{args[1]}</code>")
+            return
+        
+        if args and args[0] == "reload":
+            if await detector.reload_ml():
+                await detectors.reload_shared()
+                await message.reply("🔄 Модель перечитана с диска")
+            else:
+                await message.reply("❌ Не удалось загрузить модель")
+            return
+        
+        versions, active = detector.list_ml_versions()
+        if not versions:
+            await message.reply("📭 Сохранённых версий модели нет")
+            return
+        
+        lines = [
+            f"{'✅' if version == active else '▫️'} <code>{version}</code>"
+            for version in versions
+        ]
+        await message.reply(
+            f"📦 <b>Версии ML модели</b>\n\n" + "\n".join(lines) +
+            f"\n\nОткат: /mm_model rollback &lt;версия&gt;"
+        )
+    except Exception as e:
+        logger.error(f"Ошибка управления версиями модели: {e}")
+        await message.reply(f"❌ Ошибка: {e}")
+
 @router.message(Command("load_training_data"))
 async def cmd_load_training_data(message: Message):
     """Загружает стандартные обучающие данные (100 хороших + 100 плохих)"""
@@ -229,7 +344,10 @@ async def cmd_load_training_data(message: Message):
         csv_data = TrainingDataLoader.get_default_training_data()
         
         # Загружаем в БД
-        good, bad = await TrainingDataLoader.load_from_csv(csv_data, moderated_by=OWNER_ID)
+        good, bad = await TrainingDataLoader.load_from_csv(
+            csv_data, moderated_by=OWNER_ID,
+            batch_size=TRAINING_INSERT_BATCH, concurrency=TRAINING_INSERT_CONCURRENCY,
+        )
         
         await message.reply(
             f"✅ Данные загружены!\n"
@@ -253,35 +371,56 @@ async def cmd_load_training_file(message: Message):
         await message.reply("📎 Пришлите CSV файл с данными (формат: text,label)")
         return
     
+    # Файл и чекпоинт именуются по file_unique_id: повторная отправка того же
+    # файла после сбоя продолжит загрузку с последней записанной пачки
+    os.makedirs(TRAINING_INGEST_DIR, exist_ok=True)
+    base = os.path.join(TRAINING_INGEST_DIR, message.document.file_unique_id)
+    csv_path, checkpoint_path = base + ".csv", base + ".checkpoint.json"
+    resuming = os.path.exists(checkpoint_path)
+    
+    status = await message.reply("🔄 Продолжаю загрузку файла..." if resuming else "🔄 Загружаю файл...")
+    last_update = 0.0
+    
+    async def report(progress: LoadProgress):
+        nonlocal last_update
+        # Не чаще раза в 3 секунды - правка сообщения тоже запрос к API
+        if time.monotonic() - last_update < 3:
+            return
+        last_update = time.monotonic()
+        try:
+            await status.edit_text(
+                f"🔄 Загружено {progress.inserted} примеров "
+                f"({progress.rate:.0f}/с, прочитано строк: {progress.rows})"
+            )
+        except Exception as e:
+            logger.debug(f"Не удалось обновить прогресс: {e}")
+    
     try:
-        # Скачиваем файл
+        # Скачиваем файл на диск и читаем его потоково
         file = await bot.get_file(message.document.file_id)
-        file_path = file.file_path
+        await bot.download_file(file.file_path, csv_path)
         
-        # Создаем временный файл
-        with tempfile.NamedTemporaryFile(mode='w+', suffix='.csv', delete=False) as tmp:
-            await bot.download_file(file_path, tmp.name)
-            
-            # Читаем файл
-            with open(tmp.name, 'r', encoding='utf-8') as f:
-                csv_content = f.read()
-            
-            # Загружаем в БД
-            good, bad = await TrainingDataLoader.load_from_csv(csv_content, moderated_by=OWNER_ID)
-            
-            # Удаляем временный файл
-            os.unlink(tmp.name)
-            
-            await message.reply(
-                f"✅ Данные из файла загружены!\n"
-                f"📊 Хороших примеров: {good}\n"
-                f"📊 Плохих примеров: {bad}\n\n"
-                f"Теперь выполните /learn_moderate для обучения модели"
-            )
+        progress = await TrainingDataLoader.load_from_file(
+            csv_path, moderated_by=OWNER_ID,
+            batch_size=TRAINING_INSERT_BATCH, concurrency=TRAINING_INSERT_CONCURRENCY,
+            checkpoint_path=checkpoint_path, on_progress=report,
+        )
+        os.unlink(csv_path)
+        
+        await status.edit_text(
+            f"✅ Данные из файла загружены!\n"
+            f"📊 Хороших примеров: {progress.good}\n"
+            f"📊 Плохих примеров: {progress.bad}\n"
+            f"♻️ Повторов: {progress.duplicates}, некорректных строк: {progress.invalid}\n"
+            + (f"⏭ Уже было загружено ранее: {progress.resumed}\n" if progress.resumed else "")
+            + f"⏱ {progress.rate:.0f} примеров/с\n\n"
+            f"Теперь выполните /learn_moderate для обучения модели"
+        )
             
     except Exception as e:
         logger.error(f"Ошибка загрузки файла: {e}")
-        await message.reply(f"❌ Ошибка: {e}")
+        hint = "\nОтправьте тот же файл ещё раз, чтобы продолжить" if os.path.exists(checkpoint_path) else ""
+        await message.reply(f"❌ Ошибка: {e}{hint}")
 
 @router.message(Command("training_stats"))
 async def cmd_training_stats(message: Message):
@@ -291,13 +430,8 @@ async def cmd_training_stats(message: Message):
         return
     
     try:
-        # Получаем статистику из БД
-        examples = await Database.get_unprocessed_training_examples()
-        
-        # Также получаем все обработанные (можно добавить метод)
-        # Пока просто считаем общее количество
-        
-        result = await Database.get_training_stats()  # добавим этот метод ниже
+        # Счётчики из памяти; COUNT-запросы к БД - только при сверке
+        result = await Database.get_training_stats()
         
         await message.reply(
             f"📊 <b>Статистика обучающих данных</b>\n\n"
@@ -312,6 +446,34 @@ async def cmd_training_stats(message: Message):
         logger.error(f"Ошибка получения статистики: {e}")
         await message.reply(f"❌ Ошибка: {e}")
 
+@router.message(Command("mm_chats"))
+async def cmd_chats(message: Message, command: CommandObject):
+    """
+    Отслеживаемые чаты и их настройки - /mm_chats
+    /mm_chats reload - перечитать таблицу chat_settings
+    """
+    if not is_owner(message.from_user.id):
+        await message.reply("❌ Только для владельца")
+        return
+    
+    try:
+        if (command.args or "").strip() == "reload":
+            await Database.load_chat_settings()
+        
+        lines = [f"💬 <b>Отслеживаемые чаты ({len(Database.monitored_chats())}):</b>\n"]
+        for settings in Database.monitored_chats():
+            lines.append(
+                f"• <code>{settings.chat_id}</code> → <code>{settings.ban_list_chat_id}</code>, "
+                f"{settings.policy}, порог ML {settings.ml_threshold:.2f}, "
+                f"модель: {settings.model_path or 'общая'}"
+            )
+        if Database.monitors_unlisted_chats():
+            lines.append("• остальные чаты - с настройками по умолчанию")
+        await message.reply("\n".join(lines))
+    except Exception as e:
+        logger.error(f"Ошибка загрузки настроек чатов: {e}")
+        await message.reply(f"❌ Ошибка: {e}")
+
 # Короткие алиасы
 @router.message(Command("mm_load"))
 async def cmd_load_short(message: Message):
@@ -1,27 +1,104 @@
+from typing import List, Optional, Set, Tuple
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
-def get_moderation_keyboard(message_id: int, user_id: int) -> InlineKeyboardMarkup:
+def get_moderation_keyboard(token: str) -> InlineKeyboardMarkup:
     """
-    Клавиатура для модерации в Ban-list чате
+    Клавиатура для модерации в Ban-list чате. token - ключ подозреваемого
+    в реестре: чат, сообщение и текст кнопки берут оттуда, а не из БД
     """
     builder = InlineKeyboardBuilder()
     
     builder.row(
         InlineKeyboardButton(
             text="✅ Скипнуть",
-            callback_data=f"skip:{message_id}:{user_id}"
+            callback_data=f"skip:{token}"
         ),
         InlineKeyboardButton(
             text="🔨 Забанить",
-            callback_data=f"ban:{message_id}:{user_id}"
+            callback_data=f"ban:{token}"
         )
     )
     builder.row(
         InlineKeyboardButton(
             text="👑 Доверенное лицо",
-            callback_data=f"trust:{message_id}:{user_id}"
+            callback_data=f"trust:{token}"
         )
     )
     
-    return builder.as_markup()
\ No newline at end of file
+    return builder.as_markup()
+
+# Дайджест подозреваемых во время рейда. Состояние (кто в дайджесте и кто
+# отмечен) хранится в самой клавиатуре - в callback_data строк, поэтому
+# кнопки работают и после перезапуска бота.
+DIGEST_TOGGLE = "dgt"
+DIGEST_ACTION = "dga"
+
+
+def get_digest_keyboard(items: List[Tuple[int, int, int, str]],
+                        selected: Set[Tuple[int, int]]) -> InlineKeyboardMarkup:
+    """
+    Клавиатура дайджеста: строка-переключатель на каждого подозреваемого
+    и общие действия
+
+    Args:
+        items: (chat_id, message_id, user_id, подпись) в порядке дайджеста
+        selected: (chat_id, message_id) отмеченных строк
+    """
+    builder = InlineKeyboardBuilder()
+    
+    for number, (chat_id, message_id, user_id, label) in enumerate(items, 1):
+        is_selected = (chat_id, message_id) in selected
+        builder.row(
+            InlineKeyboardButton(
+                text=f"{'☑️' if is_selected else '⬜'} {number}. {label}",
+                callback_data=f"{DIGEST_TOGGLE}:{chat_id}:{message_id}:{user_id}:{int(is_selected)}"
+            )
+        )
+    builder.row(
+        InlineKeyboardButton(
+            text="🔨 Забанить отмеченных",
+            callback_data=f"{DIGEST_ACTION}:ban_selected"
+        ),
+        InlineKeyboardButton(
+            text="🔨 Забанить всех",
+            callback_data=f"{DIGEST_ACTION}:ban_all"
+        )
+    )
+    builder.row(
+        InlineKeyboardButton(
+            text="✅ Скипнуть всех",
+            callback_data=f"{DIGEST_ACTION}:skip_all"
+        )
+    )
+    
+    return builder.as_markup()
+
+
+def parse_digest_keyboard(markup: Optional[InlineKeyboardMarkup],
+                          default_chat_id: Optional[int] = None
+                          ) -> Tuple[List[Tuple[int, int, int, str]], Set[Tuple[int, int]]]:
+    """
+    Обратное к get_digest_keyboard: (items, selected) из клавиатуры сообщения.
+    В дайджестах без chat_id в строках чат - default_chat_id (как есть)
+    """
+    items: List[Tuple[int, int, int, str]] = []
+    selected: Set[Tuple[int, int]] = set()
+    if markup is None:
+        return items, selected
+    for row in markup.inline_keyboard:
+        for button in row:
+            if not (button.callback_data or "").startswith(DIGEST_TOGGLE + ":"):
+                continue
+            parts = button.callback_data.split(":")[1:]
+            if len(parts) == 3:
+                chat_id = default_chat_id  # может быть и @username
+                message_id, user_id, is_selected = parts
+            else:
+                chat_id, message_id, user_id, is_selected = parts
+                chat_id = int(chat_id)
+            label = button.text.split(" ", 2)[2] if button.text.count(" ") >= 2 else button.text
+            items.append((chat_id, int(message_id), int(user_id), label))
+            if is_selected == "1":
+                selected.add((chat_id, int(message_id)))
+    return items, selected
@@ -1,9 +1,12 @@
 import asyncio
 import logging
-from bot import bot, dp
+import signal
+from bot import bot, dp, api, updates
 import handlers.channel
 import handlers.commands
 from database.supabase_db import Database
+from utils.detector_instance import detector, detectors, training_scheduler, reputation
+from config import BOT_MODE, UPDATE_DRAIN_TIMEOUT, REPUTATION_SIZE, REPUTATION_FLUSH_INTERVAL
 
 # Настройка логирования
 logging.basicConfig(
@@ -16,41 +19,103 @@ async def on_startup():
     """Действия при запуске"""
     logger.info("=" * 50)
     logger.info("🚀 Бот запускается...")
-    logger.info("📋 Проверка подключения к Supabase...")
+    logger.info(f"📋 Проверка подключения к хранилищу ({Database.storage_name()})...")
     
     try:
-        test_user = await Database.is_trusted(0)
-        logger.info("✅ Подключение к Supabase успешно!")
+        trusted_count = await Database.load_trusted_users()
+        logger.info(f"✅ Подключение к хранилищу успешно! Доверенных в кэше: {trusted_count}")
     except Exception as e:
-        logger.error(f"❌ Ошибка подключения к Supabase: {e}")
+        logger.error(f"❌ Ошибка подключения к хранилищу: {e}")
+    
+    try:
+        await Database.check_schema()
+    except Exception as e:
+        logger.error(f"❌ Не удалось проверить схему хранилища: {e}")
+    
+    try:
+        await Database.replay_writes()
+    except Exception as e:
+        logger.error(f"❌ Не удалось переиграть спул записей: {e}")
+    
+    try:
+        chats = await Database.load_chat_settings()
+        logger.info(f"💬 Отслеживаемых чатов: {chats}")
+    except Exception as e:
+        logger.error(f"❌ Не удалось загрузить chat_settings, работаем с чатом по умолчанию: {e}")
+    if Database.monitors_unlisted_chats():
+        logger.info("💬 Чаты без строки в chat_settings проверяются с настройками по умолчанию")
+    elif not Database.monitored_chats():
+        logger.error(
+            "❌ Ни один чат не отслеживается: задайте числовой CHANNEL_ID, строки chat_settings "
+            "или MONITOR_UNLISTED_CHATS=1 с BAN_LIST_CHAT_ID"
+        )
+    
+    if reputation is not None:
+        reputation.load(await Database.load_user_reputation(REPUTATION_SIZE))
+        logger.info(f"👤 Репутация авторов: загружено {len(reputation)}")
+        reputation.start(Database.save_user_reputation, REPUTATION_FLUSH_INTERVAL)
+    
+    # ML модель грузится в фоне: до готовности работает только rule-based детекция
+    detector.start_background_load()
+    training_scheduler.start()
     
     # Получаем информацию о боте
     bot_info = await bot.get_me()
-    logger.info(f"🤖 Бот: @{bot_info.username}")
-    logger.info("⏩ Пропускаем старые апдейты...")
+    logger.info(f"🤖 Бот: @{bot_info.username}, режим: {BOT_MODE}")
     logger.info("✅ Бот готов к работе!")
     logger.info("=" * 50)
 
 async def on_shutdown():
     """Действия при остановке"""
     logger.info("🛑 Бот останавливается...")
+    await training_scheduler.stop()
+    await handlers.channel.close_digests()
+    await detectors.close()
+    await api.close()
+    if reputation is not None:
+        await reputation.close()
+    await Database.close()
     await bot.session.close()
     logger.info("✅ Бот остановлен")
 
-async def main():
-    """Главная функция"""
+async def run_polling():
+    """
+    Long polling до SIGTERM/SIGINT. Апдейты идут через ту же очередь по
+    чатам, что и вебхук: рейд в одном чате не задерживает остальные
+    """
     await on_startup()
-    
+    updates.start()
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+
+    poll_task = None
     try:
-        # Запускаем поллинг с пропуском старых апдейтов
-        await dp.start_polling(
-            bot,
-            skip_updates=True  # ВОТ ЭТО РЕШЕНИЕ!
-        )
+        # Вебхук мешает getUpdates - снимаем его, сохранив накопленные апдейты
+        await bot.delete_webhook(drop_pending_updates=False)
+        poll_task = asyncio.create_task(updates.poll(allowed_updates=dp.resolve_used_update_types()))
+        stop_task = asyncio.create_task(stop.wait())
+        await asyncio.wait({poll_task, stop_task}, return_when=asyncio.FIRST_COMPLETED)
+        stop_task.cancel()
     except Exception as e:
         logger.error(f"❌ Ошибка при работе бота: {e}")
     finally:
+        # Сначала перестаём получать апдейты и дорабатываем очередь, потом останавливаем остальное
+        if poll_task is not None:
+            poll_task.cancel()
+            await asyncio.gather(poll_task, return_exceptions=True)
+        await updates.close(drain_timeout=UPDATE_DRAIN_TIMEOUT)
         await on_shutdown()
 
+async def main():
+    """Главная функция"""
+    if BOT_MODE == "webhook":
+        from webhook import run_webhook
+        await run_webhook(on_startup, on_shutdown)
+    else:
+        await run_polling()
+
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main())
@@ -0,0 +1,232 @@
+"""
+Компактный формат модели и лёгкий скорер без sklearn.
+
+Из обученного Pipeline(TfidfVectorizer(char_wb) + SGDClassifier) в .npz
+сохраняются только словарь n-грамм, веса IDF и коэффициенты линейной модели.
+CompactScorer воспроизводит decision_function и predict_proba пайплайна на
+чистом Python + NumPy, поэтому горячему пути не нужен импорт sklearn.
+
+Для хэшированного пайплайна (HashedCharVectorizer + TfidfTransformer)
+словаря нет - сохраняются размер пространства признаков, IDF и коэффициенты,
+а инференс выполняет HashedScorer.
+"""
+import re
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from .hashed_features import count_matrix, linear_tfidf_scores
+
+_WHITE_SPACES = re.compile(r"\s\s+")
+
+FORMAT_VERSION = 1
+
+
+def char_wb_ngrams(text: str, min_n: int, max_n: int) -> List[str]:
+    """Символьные n-граммы внутри слов - повторяет TfidfVectorizer(analyzer='char_wb')"""
+    text = _WHITE_SPACES.sub(" ", text)
+    ngrams = []
+    append = ngrams.append
+    for w in text.split():
+        w = " " + w + " "
+        w_len = len(w)
+        for n in range(min_n, max_n + 1):
+            offset = 0
+            append(w[offset:offset + n])
+            while offset + n < w_len:
+                offset += 1
+                append(w[offset:offset + n])
+            if offset == 0:  # короткое слово учитываем один раз
+                break
+    return ngrams
+
+
+def _sigmoid(x: np.ndarray) -> np.ndarray:
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+def pipeline_arrays(pipeline) -> Dict[str, np.ndarray]:
+    """Извлекает из обученного пайплайна всё, что нужно для инференса"""
+    if 'hash' in pipeline.named_steps:
+        return _hashed_pipeline_arrays(pipeline)
+    
+    tfidf = pipeline.named_steps['tfidf']
+    clf = pipeline.named_steps['clf']
+    if tfidf.analyzer != 'char_wb' or tfidf.norm != 'l2' or not tfidf.use_idf:
+        raise ValueError("Компактный формат поддерживает только char_wb + idf + l2")
+
+    vocabulary = tfidf.vocabulary_
+    terms = [''] * len(vocabulary)
+    for term, index in vocabulary.items():
+        terms[index] = term
+
+    return {
+        'format_version': np.int64(FORMAT_VERSION),
+        'kind': np.str_('vocab'),
+        'terms': np.array(terms, dtype=np.str_),
+        'idf': tfidf.idf_.astype(np.float64),
+        'coef': clf.coef_.ravel().astype(np.float64),
+        'intercept': np.float64(clf.intercept_[0]),
+        'classes': np.asarray(clf.classes_, dtype=np.int64),
+        'ngram_range': np.asarray(tfidf.ngram_range, dtype=np.int64),
+        'lowercase': np.bool_(tfidf.lowercase),
+        'sublinear_tf': np.bool_(tfidf.sublinear_tf),
+    }
+
+
+def _hashed_pipeline_arrays(pipeline) -> Dict[str, np.ndarray]:
+    hasher = pipeline.named_steps['hash']
+    tfidf = pipeline.named_steps['tfidf']
+    clf = pipeline.named_steps['clf']
+    if tfidf.norm != 'l2' or not tfidf.use_idf:
+        raise ValueError("Компактный формат поддерживает только idf + l2")
+    return {
+        'format_version': np.int64(FORMAT_VERSION),
+        'kind': np.str_('hashed'),
+        'n_features': np.int64(hasher.n_features),
+        'idf': tfidf.idf_.astype(np.float64),
+        'coef': clf.coef_.ravel().astype(np.float64),
+        'intercept': np.float64(clf.intercept_[0]),
+        'classes': np.asarray(clf.classes_, dtype=np.int64),
+        'ngram_range': np.asarray(hasher.ngram_range, dtype=np.int64),
+        'lowercase': np.bool_(hasher.lowercase),
+        'sublinear_tf': np.bool_(tfidf.sublinear_tf),
+    }
+
+
+def scorer_from_arrays(data):
+    """CompactScorer или HashedScorer - в зависимости от типа модели"""
+    if str(data['kind']) == 'hashed':
+        return HashedScorer.from_arrays(data)
+    return CompactScorer.from_arrays(data)
+
+
+def scorer_from_pipeline(pipeline):
+    return scorer_from_arrays(pipeline_arrays(pipeline))
+
+
+def load_scorer(path: str):
+    with np.load(path, allow_pickle=False) as data:
+        return scorer_from_arrays(data)
+
+
+def _predictions(decision: np.ndarray, classes: np.ndarray) -> List[Tuple[int, float]]:
+    """[(класс, уверенность), ...] - как argmax(predict_proba) пайплайна"""
+    positive = _sigmoid(decision)
+    negative_class, positive_class = int(classes[0]), int(classes[1])
+    return [
+        (positive_class, float(p)) if p > 0.5 else (negative_class, float(1.0 - p))
+        for p in positive
+    ]
+
+
+def export_compact(pipeline, path: str):
+    """Сохраняет обученный пайплайн в .npz (вызывается на стороне обучения)"""
+    with open(path, 'wb') as f:
+        np.savez(f, **pipeline_arrays(pipeline))
+
+
+class CompactScorer:
+    """Линейный скорер TF-IDF(char_wb) + логистическая регрессия на NumPy"""
+
+    def __init__(self, terms: List[str], idf: np.ndarray, coef: np.ndarray, intercept: float,
+                 classes: np.ndarray, ngram_range: Tuple[int, int], lowercase: bool = True,
+                 sublinear_tf: bool = False):
+        self.vocabulary: Dict[str, int] = {term: i for i, term in enumerate(terms)}
+        self.idf = idf
+        self.coef = coef
+        self.intercept = float(intercept)
+        self.classes = classes
+        self.min_n, self.max_n = int(ngram_range[0]), int(ngram_range[1])
+        self.lowercase = lowercase
+        self.sublinear_tf = sublinear_tf
+
+    @classmethod
+    def from_arrays(cls, data) -> "CompactScorer":
+        return cls(
+            terms=data['terms'].tolist(),
+            idf=np.asarray(data['idf']),
+            coef=np.asarray(data['coef']),
+            intercept=float(data['intercept']),
+            classes=np.asarray(data['classes']),
+            ngram_range=tuple(np.asarray(data['ngram_range']).tolist()),
+            lowercase=bool(data['lowercase']),
+            sublinear_tf=bool(data['sublinear_tf']),
+        )
+
+    def _features(self, texts: List[str]):
+        """Разреженное представление пачки: (номера документов, номера признаков, tf)"""
+        vocabulary = self.vocabulary
+        rows: List[int] = []
+        cols: List[int] = []
+        counts: List[int] = []
+        for doc, text in enumerate(texts):
+            if self.lowercase:
+                text = text.lower()
+            doc_counts: Dict[int, int] = {}
+            for gram in char_wb_ngrams(text, self.min_n, self.max_n):
+                index = vocabulary.get(gram)
+                if index is not None:
+                    doc_counts[index] = doc_counts.get(index, 0) + 1
+            rows.extend([doc] * len(doc_counts))
+            cols.extend(doc_counts.keys())
+            counts.extend(doc_counts.values())
+        return (
+            np.asarray(rows, dtype=np.intp),
+            np.asarray(cols, dtype=np.intp),
+            np.asarray(counts, dtype=np.float64),
+        )
+
+    def decision_function(self, texts: List[str]) -> np.ndarray:
+        rows, cols, tf = self._features(texts)
+        return linear_tfidf_scores(rows, cols, tf, len(texts), self.idf, self.coef,
+                                   self.intercept, self.sublinear_tf)
+
+    def predict_batch(self, texts: List[str]) -> List[Tuple[int, float]]:
+        """[(класс, уверенность), ...] - как argmax(predict_proba) пайплайна"""
+        if not texts:
+            return []
+        return _predictions(self.decision_function(texts), self.classes)
+
+
+class HashedScorer:
+    """
+    Линейный скорер над хэшированными char_wb n-граммами: хэширование,
+    IDF и скалярное произведение с коэффициентами - векторно на всю пачку.
+    Память постоянна и определяется n_features.
+    """
+
+    def __init__(self, n_features: int, idf: np.ndarray, coef: np.ndarray, intercept: float,
+                 classes: np.ndarray, ngram_range: Tuple[int, int], lowercase: bool = True,
+                 sublinear_tf: bool = False):
+        self.n_features = int(n_features)
+        self.idf = idf
+        self.coef = coef
+        self.intercept = float(intercept)
+        self.classes = classes
+        self.ngram_range = (int(ngram_range[0]), int(ngram_range[1]))
+        self.lowercase = lowercase
+        self.sublinear_tf = sublinear_tf
+
+    @classmethod
+    def from_arrays(cls, data) -> "HashedScorer":
+        return cls(
+            n_features=int(data['n_features']),
+            idf=np.asarray(data['idf']),
+            coef=np.asarray(data['coef']),
+            intercept=float(data['intercept']),
+            classes=np.asarray(data['classes']),
+            ngram_range=tuple(np.asarray(data['ngram_range']).tolist()),
+            lowercase=bool(data['lowercase']),
+            sublinear_tf=bool(data['sublinear_tf']),
+        )
+
+    def decision_function(self, texts: List[str]) -> np.ndarray:
+        rows, cols, tf = count_matrix(texts, self.n_features, self.ngram_range, self.lowercase)
+        return linear_tfidf_scores(rows, cols, tf, len(texts), self.idf, self.coef,
+                                   self.intercept, self.sublinear_tf)
+
+    def predict_batch(self, texts: List[str]) -> List[Tuple[int, float]]:
+        if not texts:
+            return []
+        return _predictions(self.decision_function(texts), self.classes)
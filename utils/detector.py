@@ -1,14 +1,42 @@
 import re
+import time
 import logging
 from typing import List, Dict, Any, Optional, Tuple
 import asyncio
 
 from .ml_classifier import MLClassifier
+from .rule_engine import RuleEngine
+from .metrics import LatencyStat
+from .inference_batcher import BatchingInference
+from .inference_pool import ProcessPoolInference
+from .text_preprocessor import PreparedText, preprocessor
+from .near_duplicates import Cluster, NearDuplicateIndex
+from .user_reputation import Prefilter, ReputationStore
 
 logger = logging.getLogger(__name__)
+calibration_logger = logging.getLogger(__name__ + ".calibration")
+
+
+class EvaluationPolicy:
+    """Порядок применения правил и ML в BotDetector.is_suspicious"""
+    RULES_ONLY = "rules_only"            # только правила, ML не вызывается
+    RULES_THEN_ML = "rules_then_ml"      # ML только если правила ничего не нашли
+    ML_ABOVE_LENGTH = "ml_above_length"  # длинные сообщения - только ML, короткие - только правила
+    ALWAYS_BOTH = "always_both"          # всегда и то и другое, с логом для калибровки
+
+    ALL = (RULES_ONLY, RULES_THEN_ML, ML_ABOVE_LENGTH, ALWAYS_BOTH)
+
 
 class BotDetector:
-    def __init__(self, use_ml: bool = True, ml_model_path: str = "models/bot_detector.pkl"):
+    def __init__(self, use_ml: bool = True, ml_model_path: str = "models/bot_detector.pkl", use_rule_engine: bool = True,
+                 policy: str = EvaluationPolicy.RULES_THEN_ML, ml_min_length: int = 40,
+                 ml_batch_size: int = 64, ml_batch_delay: float = 0.005,
+                 ml_backend: str = "thread", ml_pool_size: int = 2, ml_queue_depth: int = 8,
+                 lazy_ml: bool = False, ml_features: str = "vocab", ml_hash_features: int = 2 ** 18,
+                 ml_evaluation: str = "holdout", ml_eval_folds: int = 5,
+                 dedup_window: int = 0, dedup_threshold: float = 0.6, dedup_min_length: int = 30,
+                 dedup_ttl: float = 3600.0, ml_threshold: float = 0.7,
+                 reputation: Optional[ReputationStore] = None):
         # Основные паттерны
         self.patterns = [
             self._gift_patterns,
@@ -79,8 +107,38 @@ class BotDetector:
             'ого', 'вау', 'супер', 'отлично', 'здорово'
         }
         
+        # Ключевые слова функций-паттернов
+        self.giveaway_keywords = ['разда', 'розыгр', 'конкурс']
+        self.action_keywords = ['участв', 'побед', 'выигр']
+        self.free_keywords = ['бесплатн', 'халяв', 'даров']
+        self.spam_keywords = ['@channel', '@everyone', 'подпишись', 'вступай']
+        self.call_to_action = ['жми', 'переходи', 'кликай']
+        self.contest_keywords = ['конкурс', 'розыгрыш', 'приз', 'призы']
+        self.scam_phrases = [
+            'бесплатно за подписку',
+            'получи приз за лайк',
+            'раздача каждый день',
+            'дарят подарки',
+            'легкий заработок',
+        ]
+        
         self.compiled_regex = [re.compile(pattern) for pattern in self.regex_patterns]
         self.exclusion_compiled = [re.compile(pattern) for pattern in self.exclusion_patterns]
+        self.emoji_regex = re.compile(
+            "["
+            "\U0001F600-\U0001F64F"  # эмоции
+            "\U0001F300-\U0001F5FF"  # символы
+            "\U0001F680-\U0001F6FF"  # транспорт
+            "\U0001F1E0-\U0001F1FF"  # флаги
+            "\U00002700-\U000027BF"  # разные символы
+            "\U000024C2-\U0001F251"  # прочее
+            "]+", flags=re.UNICODE
+        )
+        self.url_regex = re.compile(r'https?://[^\s]+|t\.me/[^\s]+|telegram\.me/[^\s]+')
+        self.mention_regex = re.compile(r'@(\w+)')
+        
+        # Скомпилированный движок правил: один проход по тексту вместо цепочки функций
+        self.rule_engine = RuleEngine(self) if use_rule_engine else None
         
         # Счетчики для анализа
         self.word_count_threshold = 50  # сообщения длиннее не проверяем по эмодзи
@@ -88,13 +146,103 @@ class BotDetector:
         
         # ML компонент
         self.use_ml = use_ml
+        self.ml_model_path = ml_model_path
         self.ml_classifier = None
-        self.ml_confidence_threshold = 0.7  # Порог уверенности для ML
-        
+        # Текст нормализуется один раз: lower - для правил, normalized - для ML
+        self.preprocessor = preprocessor
+        self.ml_features = ml_features  # vocab | hashed - для новых обучений
+        self.ml_hash_features = ml_hash_features
+        self.ml_evaluation = ml_evaluation  # holdout | kfold | none - при полном обучении
+        self.ml_eval_folds = ml_eval_folds
+        self.ml_confidence_threshold = ml_threshold  # Порог уверенности для ML
+        
+        # Политика оценки
+        if policy not in EvaluationPolicy.ALL:
+            raise ValueError(f"Неизвестная политика оценки: {policy}")
+        self.policy = policy
+        self.ml_min_length = ml_min_length  # порог длины для ML_ABOVE_LENGTH
+        
+        # Задержки по стадиям
+        self.stage_latency = {
+            'rules': LatencyStat(),
+            'ml': LatencyStat(),
+            'total': LatencyStat(),
+        }
+        self.ml_skipped = 0  # сколько сообщений прошло без ML
+        
+        # Почти-дубликаты: сообщения одного шаблона получают вердикт первого из них
+        self.near_duplicates = None
+        if dedup_window > 0:
+            self.near_duplicates = NearDuplicateIndex(threshold=dedup_threshold, window=dedup_window, ttl=dedup_ttl)
+        self.dedup_min_length = dedup_min_length
+        self.dedup_hits = 0  # сколько вердиктов взято у кластера без правил и ML
+        
+        # Репутация авторов (общая для всех детекторов): предфильтр до правил и ML
+        self.reputation = reputation
+        
+        # Бэкенд инференса: потоки по умолчанию или отдельные процессы (в обход GIL)
+        if ml_backend not in ("thread", "process"):
+            raise ValueError(f"Неизвестный ML бэкенд: {ml_backend}")
+        self.inference_pool = None
+        self._run_batch = self._predict_batch_threaded
+        max_inflight = 1
+        if use_ml and ml_backend == "process":
+            self.inference_pool = ProcessPoolInference(
+                ml_model_path, pool_size=ml_pool_size, queue_depth=ml_queue_depth
+            )
+            self._run_batch = self.inference_pool.predict_batch
+            max_inflight = ml_queue_depth
+        
+        # Микробатчинг ML: параллельные сообщения считаются одной пачкой
+        self.ml_batcher = None
+        if use_ml and ml_batch_size > 1:
+            self.ml_batcher = BatchingInference(
+                self._run_batch,
+                max_batch=ml_batch_size,
+                max_delay=ml_batch_delay,
+                max_inflight=max_inflight,
+            )
+        
+        self._ml_load_task: Optional[asyncio.Task] = None
         if use_ml:
-            self.ml_classifier = MLClassifier(model_path=ml_model_path)
-            if not self.ml_classifier.load():
-                logger.warning("ML модель не найдена, будет использоваться только rule-based детекция")
+            self.ml_classifier = self._new_classifier()
+            # При lazy_ml модель грузится в фоне (start_background_load),
+            # а до тех пор работает только rule-based детекция
+            if not lazy_ml:
+                self._load_ml_sync()
+    
+    def _new_classifier(self) -> MLClassifier:
+        return MLClassifier(
+            model_path=self.ml_model_path,
+            features=self.ml_features,
+            n_features=self.ml_hash_features,
+            evaluation=self.ml_evaluation,
+            eval_folds=self.ml_eval_folds,
+        )
+    
+    def _load_ml_sync(self) -> bool:
+        started = time.perf_counter()
+        if not self.ml_classifier.load():
+            logger.warning("ML модель не найдена, будет использоваться только rule-based детекция")
+            return False
+        logger.info(f"ML модель готова за {(time.perf_counter() - started) * 1000:.0f} мс")
+        return True
+    
+    def start_background_load(self) -> Optional[asyncio.Task]:
+        """Запускает загрузку модели в фоне, не задерживая старт поллинга"""
+        if self.ml_classifier is None or self.ml_classifier.is_trained:
+            return None
+        if self._ml_load_task is None:
+            self._ml_load_task = asyncio.create_task(self._load_ml_background())
+        return self._ml_load_task
+    
+    async def _load_ml_background(self):
+        loop = asyncio.get_event_loop()
+        try:
+            if await loop.run_in_executor(None, self._load_ml_sync):
+                await self.warm_up()
+        except Exception as e:
+            logger.error(f"Ошибка фоновой загрузки ML модели: {e}")
         
     async def is_suspicious(self, message_text: str, user_info: Dict[str, Any]) -> Tuple[bool, Optional[float]]:
         """
@@ -103,14 +251,205 @@ class BotDetector:
         Returns:
             (подозрительно ли, уверенность ML если есть)
         """
+        suspicious, ml_confidence, _ = await self.classify(message_text, user_info)
+        return suspicious, ml_confidence
+    
+    async def classify(self, message_text: str,
+                       user_info: Dict[str, Any]) -> Tuple[bool, Optional[float], Optional[Cluster]]:
+        """
+        То же, что is_suspicious, плюс кластер почти-дубликатов сообщения
+        (None, если индекс выключен или текст слишком короткий)
+        """
         if not message_text:
-            return False, None
-            
+            return False, None, None
+        
+        started = time.perf_counter()
+        try:
+            prepared = self.preprocessor.prepare(message_text)
+            record = None
+            if self.reputation is not None and user_info.get("id") is not None:
+                record = self.reputation.observe(user_info["id"], hash(prepared.normalized))
+                decision = self.reputation.prefilter(record, self.url_regex.search(message_text) is not None)
+                if decision == Prefilter.FAST_TRACK:
+                    self.reputation.record(record, True)
+                    return True, None, None
+                if decision == Prefilter.SKIP_ML:
+                    # Давний чистый автор: только правила и без кластера - его
+                    # вердикт не должен доставаться похожим сообщениям других
+                    suspicious, ml_confidence = await self._evaluate(prepared, user_info, skip_ml=True)
+                    self.reputation.record(record, suspicious)
+                    return suspicious, ml_confidence, None
+            if self.near_duplicates is None or len(message_text) < self.dedup_min_length:
+                suspicious, ml_confidence = await self._evaluate(prepared, user_info)
+                cluster = None
+            else:
+                suspicious, ml_confidence, cluster = await self._classify_clustered(prepared, user_info)
+            if record is not None:
+                self.reputation.record(record, suspicious)
+            return suspicious, ml_confidence, cluster
+        finally:
+            self.stage_latency['total'].since(started)
+    
+    async def _classify_clustered(self, prepared: PreparedText,
+                                  user_info: Dict[str, Any]) -> Tuple[bool, Optional[float], Cluster]:
+        cluster = self.near_duplicates.observe(prepared.normalized)
+        while cluster.verdict is None and cluster.pending is not None:
+            # Сообщение шаблона ещё проверяется - ждём его вердикт. Если та
+            # проверка упала, проверку мог уже взять другой ожидающий
+            await asyncio.shield(cluster.pending)
+        if cluster.verdict is not None:
+            self.dedup_hits += 1
+            return cluster.verdict, cluster.ml_confidence, cluster
+        
+        # Между проверкой выше и этой строкой нет await: проверка шаблона одна
+        pending = cluster.pending = asyncio.get_running_loop().create_future()
+        try:
+            suspicious, ml_confidence = await self._evaluate(prepared, user_info)
+            cluster.set_verdict(suspicious, ml_confidence)
+            return suspicious, ml_confidence, cluster
+        finally:
+            cluster.pending = None
+            pending.set_result(None)
+    
+    def record_verdict(self, message_text: str, verdict: bool) -> Optional[Cluster]:
+        """
+        Решение модератора по сообщению распространяется на его кластер;
+        возвращает кластер, если он ещё в окне
+        """
+        if self.near_duplicates is None or not message_text:
+            return None
+        cluster = self.near_duplicates.find(self.preprocessor.normalize(message_text))
+        if cluster is not None:
+            cluster.set_verdict(verdict, cluster.ml_confidence, source="moderator")
+        return cluster
+    
+    @property
+    def ml_available(self) -> bool:
+        return bool(self.use_ml and self.ml_classifier and self.ml_classifier.is_trained)
+    
+    async def _evaluate(self, prepared: PreparedText, user_info: Dict[str, Any],
+                        skip_ml: bool = False) -> Tuple[bool, Optional[float]]:
+        message_text = prepared.text
+        policy = self.policy
+        long_text = len(message_text) >= self.ml_min_length
+        
+        rule_based_suspicious = False
+        if not (policy == EvaluationPolicy.ML_ABOVE_LENGTH and long_text):
+            started = time.perf_counter()
+            excluded, rule_based_suspicious = await self.check_rules(message_text, user_info, prepared.lower)
+            self.stage_latency['rules'].since(started)
+            if excluded:
+                return False, None
+        
+        if policy == EvaluationPolicy.RULES_ONLY:
+            run_ml = False
+        elif policy == EvaluationPolicy.RULES_THEN_ML:
+            run_ml = not rule_based_suspicious  # вердикт уже есть - ML не тратим
+        elif policy == EvaluationPolicy.ML_ABOVE_LENGTH:
+            run_ml = long_text
+        else:
+            run_ml = True
+        run_ml = run_ml and not skip_ml
+        
+        ml_confidence = None
+        ml_suspicious = False
+        
+        if run_ml and self.ml_available:
+            try:
+                pred, confidence = await self._predict_ml(prepared.normalized)
+                ml_confidence = confidence
+                
+                # ML считает подозрительным только если уверенность выше порога
+                if pred == 1 and confidence >= self.ml_confidence_threshold:
+                    ml_suspicious = True
+                    logger.debug(f"ML определил как подозрительное с уверенностью {confidence:.3f}")
+                    
+            except Exception as e:
+                logger.error(f"Ошибка ML предсказания: {e}")
+        else:
+            self.ml_skipped += 1
+        
+        if policy == EvaluationPolicy.ALWAYS_BOTH and ml_confidence is not None:
+            calibration_logger.info(
+                f"rule={rule_based_suspicious} ml={ml_suspicious} conf={ml_confidence:.3f} text={message_text[:50]!r}"
+            )
+        
+        # Комбинируем результаты
+        final_suspicious = rule_based_suspicious or ml_suspicious
+        
+        # Логируем для отладки
+        if final_suspicious:
+            logger.debug(f"Финальное решение: {final_suspicious} (rule: {rule_based_suspicious}, ml: {ml_suspicious}, conf: {ml_confidence})")
+        
+        return final_suspicious, ml_confidence
+    
+    async def _predict_ml(self, normalized: str) -> Tuple[int, float]:
+        """ML предсказание (по нормализованному тексту) вне event loop"""
+        started = time.perf_counter()
+        try:
+            if self.ml_batcher is not None:
+                return await self.ml_batcher.predict(normalized)
+            return (await self._run_batch([normalized]))[0]
+        finally:
+            self.stage_latency['ml'].since(started)
+    
+    async def _predict_batch_threaded(self, texts: List[str]) -> List[Tuple[int, float]]:
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, self.ml_classifier.predict_normalized, texts)
+    
+    async def warm_up(self):
+        """Заранее поднимает воркеры инференса"""
+        if self.inference_pool is not None and self.ml_available:
+            await self.inference_pool.warm_up()
+    
+    async def close(self):
+        """Останавливает фоновые воркеры детектора"""
+        if self._ml_load_task is not None and not self._ml_load_task.done():
+            self._ml_load_task.cancel()
+        if self.ml_batcher is not None:
+            await self.ml_batcher.close()
+        if self.inference_pool is not None:
+            self.inference_pool.shutdown()
+    
+    async def ml_confidence(self, message_text: str) -> Optional[float]:
+        """
+        Уверенность ML для уже помеченного сообщения (для карточки модератора),
+        когда политика не запускала ML на горячем пути
+        """
+        if not message_text or not self.ml_available:
+            return None
+        try:
+            _, confidence = await self._predict_ml(self.preprocessor.normalize(message_text))
+            return confidence
+        except Exception as e:
+            logger.error(f"Ошибка ML предсказания: {e}")
+            return None
+    
+    async def check_rules(self, message_text: str, user_info: Dict[str, Any],
+                          lower: Optional[str] = None) -> Tuple[bool, bool]:
+        """
+        Rule-based детекция (быстрая)
+        
+        Returns:
+            (сработало ли исключение, подозрительно ли по правилам)
+        """
+        if self.rule_engine is not None:
+            excluded, rule = self.rule_engine.evaluate(message_text, lower)
+            if excluded:
+                logger.debug(f"Исключение сработало: {message_text[:50]}")
+            elif rule:
+                logger.debug(f"Правило сработало: {rule}")
+            return excluded, rule is not None
+        
+        return await self._check_rules_legacy(message_text, user_info)
+    
+    async def _check_rules_legacy(self, message_text: str, user_info: Dict[str, Any]) -> Tuple[bool, bool]:
+        """Последовательная проверка: исключения, regex-паттерны, функции-паттерны"""
         # Быстрая проверка на исключения
         for excl_regex in self.exclusion_compiled:
             if excl_regex.search(message_text):
                 logger.debug(f"Исключение сработало: {message_text[:50]}")
-                return False, None
+                return True, False
         
         # Сначала rule-based детекция (быстрая)
         rule_based_suspicious = False
@@ -135,38 +474,7 @@ class BotDetector:
                     logger.error(f"Ошибка в {pattern_func.__name__}: {e}")
                     continue
         
-        # Если rule-based не нашел ничего подозрительного, используем ML
-        ml_confidence = None
-        ml_suspicious = False
-        
-        if self.use_ml and self.ml_classifier and self.ml_classifier.is_trained:
-            try:
-                # Запускаем ML в отдельном потоке, чтобы не блокировать
-                loop = asyncio.get_event_loop()
-                pred, confidence = await loop.run_in_executor(
-                    None, 
-                    self.ml_classifier.predict, 
-                    message_text
-                )
-                
-                ml_confidence = confidence
-                
-                # ML считает подозрительным только если уверенность выше порога
-                if pred == 1 and confidence >= self.ml_confidence_threshold:
-                    ml_suspicious = True
-                    logger.debug(f"ML определил как подозрительное с уверенностью {confidence:.3f}")
-                    
-            except Exception as e:
-                logger.error(f"Ошибка ML предсказания: {e}")
-        
-        # Комбинируем результаты
-        final_suspicious = rule_based_suspicious or ml_suspicious
-        
-        # Логируем для отладки
-        if final_suspicious:
-            logger.debug(f"Финальное решение: {final_suspicious} (rule: {rule_based_suspicious}, ml: {ml_suspicious}, conf: {ml_confidence})")
-        
-        return final_suspicious, ml_confidence
+        return False, rule_based_suspicious
     
     async def _test_pattern(self, text: str, user_info: Dict) -> bool:
         """Тестовый паттерн"""
@@ -221,11 +529,8 @@ class BotDetector:
         """Умный поиск розыгрышей"""
         text_lower = text.lower()
         
-        giveaway_keywords = ['разда', 'розыгр', 'конкурс']
-        action_keywords = ['участв', 'побед', 'выигр']
-        
-        has_giveaway = any(k in text_lower for k in giveaway_keywords)
-        has_action = any(k in text_lower for k in action_keywords)
+        has_giveaway = any(k in text_lower for k in self.giveaway_keywords)
+        has_action = any(k in text_lower for k in self.action_keywords)
         
         # Если есть оба типа слов, может быть подозрительно
         if has_giveaway and has_action:
@@ -240,9 +545,7 @@ class BotDetector:
         """Умный поиск бесплатного"""
         text_lower = text.lower()
         
-        free_keywords = ['бесплатн', 'халяв', 'даров']
-        
-        for keyword in free_keywords:
+        for keyword in self.free_keywords:
             if keyword in text_lower:
                 # Проверяем контекст
                 if 'спасибо' in text_lower or 'класс' in text_lower:
@@ -260,18 +563,7 @@ class BotDetector:
         if len(text) > self.word_count_threshold:
             return False
             
-        emoji_pattern = re.compile(
-            "["
-            "\U0001F600-\U0001F64F"  # эмоции
-            "\U0001F300-\U0001F5FF"  # символы
-            "\U0001F680-\U0001F6FF"  # транспорт
-            "\U0001F1E0-\U0001F1FF"  # флаги
-            "\U00002700-\U000027BF"  # разные символы
-            "\U000024C2-\U0001F251"  # прочее
-            "]+", flags=re.UNICODE
-        )
-        
-        emojis = emoji_pattern.findall(text)
+        emojis = self.emoji_regex.findall(text)
         
         if not emojis:
             return False
@@ -293,15 +585,12 @@ class BotDetector:
         """Улучшенный поиск спама"""
         text_lower = text.lower()
         
-        spam_keywords = ['@channel', '@everyone', 'подпишись', 'вступай']
-        
-        for keyword in spam_keywords:
+        for keyword in self.spam_keywords:
             if keyword in text_lower:
                 return True
                 
         # Поиск призывов к действию
-        call_to_action = ['жми', 'переходи', 'кликай']
-        has_call = any(c in text_lower for c in call_to_action)
+        has_call = any(c in text_lower for c in self.call_to_action)
         has_link = 't.me' in text_lower or 'http' in text_lower
         
         if has_call and has_link:
@@ -313,9 +602,7 @@ class BotDetector:
         """Поиск конкурсов"""
         text_lower = text.lower()
         
-        contest_keywords = ['конкурс', 'розыгрыш', 'приз', 'призы']
-        
-        for keyword in contest_keywords:
+        for keyword in self.contest_keywords:
             if keyword in text_lower:
                 # Исключаем вопросы
                 if '?' in text_lower:
@@ -326,8 +613,7 @@ class BotDetector:
     
     async def _url_patterns(self, text: str, user_info: Dict) -> bool:
         """Анализ URL в сообщениях"""
-        url_pattern = re.compile(r'https?://[^\s]+|t\.me/[^\s]+|telegram\.me/[^\s]+')
-        urls = url_pattern.findall(text)
+        urls = self.url_regex.findall(text)
         
         if not urls:
             return False
@@ -347,7 +633,7 @@ class BotDetector:
         text_lower = text.lower()
         
         # Поиск упоминаний каналов не нашего
-        channel_mentions = re.findall(r'@(\w+)', text)
+        channel_mentions = self.mention_regex.findall(text)
         if channel_mentions:
             # Если упоминается канал и есть призыв
             if 'подпишись' in text_lower or 'вступай' in text_lower:
@@ -359,15 +645,7 @@ class BotDetector:
         """Поиск мошеннических паттернов"""
         text_lower = text.lower()
         
-        scam_phrases = [
-            'бесплатно за подписку',
-            'получи приз за лайк',
-            'раздача каждый день',
-            'дарят подарки',
-            'легкий заработок',
-        ]
-        
-        for phrase in scam_phrases:
+        for phrase in self.scam_phrases:
             if phrase in text_lower:
                 return True
                 
@@ -379,7 +657,7 @@ class BotDetector:
             return {'error': 'ML отключен'}
 
         if not self.ml_classifier:
-            self.ml_classifier = MLClassifier(model_path=self.ml_model_path)
+            self.ml_classifier = self._new_classifier()
 
         # Логируем типы и значения для отладки
         logger.info(f"train_ml: получено {len(texts)} примеров")
@@ -408,4 +686,30 @@ class BotDetector:
         if 'error' in result:
             logger.error(f"Обучение завершилось с ошибкой: {result['error']}")
 
-        return result
\ No newline at end of file
+        return result
+    
+    async def reload_ml(self) -> bool:
+        """Перечитывает активную модель с диска в фоне, не блокируя обработку сообщений"""
+        if not self.ml_classifier:
+            return False
+        fresh = self._new_classifier()
+        loop = asyncio.get_event_loop()
+        if not await loop.run_in_executor(None, fresh.load):
+            return False
+        # Подмена одной ссылкой: текущие предсказания дорабатывают на старой модели
+        self.ml_classifier = fresh
+        return True
+    
+    def list_ml_versions(self) -> Tuple[List[str], Optional[str]]:
+        """(версии от новых к старым, активная версия)"""
+        if not self.ml_classifier:
+            return [], None
+        store = self.ml_classifier.store
+        return store.list_versions(), store.active_version()
+    
+    async def rollback_ml(self, version: str):
+        """Откатывает модель на указанную версию"""
+        if not self.ml_classifier:
+            raise RuntimeError("ML отключен")
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, self.ml_classifier.rollback, version)
\ No newline at end of file
@@ -1,4 +1,73 @@
+from database.chat_settings import ChatSettings
+from database.supabase_db import chat_settings
 from utils.detector import BotDetector
+from utils.detector_registry import DetectorRegistry
+from utils.training_scheduler import TrainingScheduler
+from utils.user_reputation import ReputationStore
+from config import (
+    USE_RULE_ENGINE, ML_BATCH_SIZE, ML_BATCH_DELAY_MS,
+    ML_BACKEND, ML_POOL_SIZE, ML_QUEUE_DEPTH, ML_FEATURES, ML_HASH_FEATURES,
+    ML_EVALUATION, ML_EVAL_FOLDS, DEDUP_WINDOW, DEDUP_TTL, DEDUP_THRESHOLD, DEDUP_MIN_LENGTH,
+    TRAINING_CHUNK_SIZE, TRAINING_AUTO_THRESHOLD, TRAINING_AUTO_INTERVAL,
+    REPUTATION_SIZE, REPUTATION_NEW_USER_WINDOW, REPUTATION_FLOOD_RATE,
+    REPUTATION_VETERAN_MESSAGES, REPUTATION_VETERAN_DAYS,
+)
 
-# Единый экземпляр детектора для всего приложения
-detector = BotDetector(use_ml=True, ml_model_path="models/bot_detector.pkl")
\ No newline at end of file
+DEFAULT_MODEL_PATH = "models/bot_detector.pkl"
+
+# Репутация авторов - общая для всех чатов: автор один, в каком бы чате он ни писал
+reputation = ReputationStore(
+    maxsize=REPUTATION_SIZE,
+    new_user_window=REPUTATION_NEW_USER_WINDOW,
+    flood_rate=REPUTATION_FLOOD_RATE,
+    veteran_messages=REPUTATION_VETERAN_MESSAGES,
+    veteran_age=REPUTATION_VETERAN_DAYS * 86400,
+) if REPUTATION_SIZE > 0 else None
+
+
+def create_detector(settings: ChatSettings, default: bool = False) -> BotDetector:
+    """
+    Детектор с настройками чата. Пул процессов инференса есть только у
+    детектора по умолчанию - остальные считают ML в потоках, чтобы десятки
+    чатов не плодили процессы
+    """
+    return BotDetector(
+        use_ml=True,
+        ml_model_path=settings.model_path or DEFAULT_MODEL_PATH,
+        use_rule_engine=USE_RULE_ENGINE,
+        policy=settings.policy,
+        ml_threshold=settings.ml_threshold,
+        ml_min_length=settings.ml_min_length,
+        ml_batch_size=ML_BATCH_SIZE,
+        ml_batch_delay=ML_BATCH_DELAY_MS / 1000,
+        ml_backend=ML_BACKEND if default else "thread",
+        ml_pool_size=ML_POOL_SIZE,
+        ml_queue_depth=ML_QUEUE_DEPTH,
+        ml_features=ML_FEATURES,
+        ml_hash_features=ML_HASH_FEATURES,
+        ml_evaluation=ML_EVALUATION,
+        ml_eval_folds=ML_EVAL_FOLDS,
+        dedup_window=DEDUP_WINDOW,
+        dedup_threshold=DEDUP_THRESHOLD,
+        dedup_min_length=DEDUP_MIN_LENGTH,
+        dedup_ttl=DEDUP_TTL,
+        lazy_ml=True,  # модель грузится в фоне из on_startup / при первом сообщении чата
+        reputation=reputation,
+    )
+
+
+# Детектор по умолчанию: общая модель и настройки из окружения. Его дообучает
+# training_scheduler, им же пользуются все чаты без собственных настроек
+detector = create_detector(chat_settings.default, default=True)
+
+# Детекторы отслеживаемых чатов (чаты с одинаковыми настройками делят один)
+detectors = DetectorRegistry(detector, chat_settings.default.detector_key, create_detector)
+
+# Фоновое дообучение по накоплению разметки или по таймеру (запускается в on_startup)
+training_scheduler = TrainingScheduler(
+    detector,
+    threshold=TRAINING_AUTO_THRESHOLD,
+    interval=TRAINING_AUTO_INTERVAL,
+    chunk_size=TRAINING_CHUNK_SIZE,
+    on_model_updated=detectors.reload_shared,
+)
@@ -0,0 +1,48 @@
+import asyncio
+import logging
+from typing import Callable, Dict, List
+
+from database.chat_settings import ChatSettings
+from .detector import BotDetector
+
+logger = logging.getLogger(__name__)
+
+
+class DetectorRegistry:
+    """
+    Детекторы отслеживаемых чатов. Чаты с одинаковыми настройками
+    (ChatSettings.detector_key) делят один экземпляр; детектор создаётся при
+    первом сообщении чата, его модель грузится в фоне. Детектор по
+    умолчанию (общая модель, настройки из окружения) создаётся заранее.
+    """
+
+    def __init__(self, default: BotDetector, default_key: tuple, factory: Callable[[ChatSettings], BotDetector]):
+        self.default = default
+        self.factory = factory
+        self._detectors: Dict[tuple, BotDetector] = {default_key: default}
+
+    def get(self, settings: ChatSettings) -> BotDetector:
+        key = settings.detector_key
+        detector = self._detectors.get(key)
+        if detector is None:
+            detector = self._detectors[key] = self.factory(settings)
+            detector.start_background_load()
+            logger.info(f"Новый детектор для настроек {key} (чат {settings.chat_id})")
+        return detector
+
+    def all(self) -> List[BotDetector]:
+        return list(self._detectors.values())
+
+    async def reload_shared(self):
+        """После дообучения общей модели перечитывают её и остальные детекторы на ней"""
+        await asyncio.gather(*(
+            detector.reload_ml()
+            for detector in self._detectors.values()
+            if detector is not self.default and detector.ml_model_path == self.default.ml_model_path
+        ))
+
+    async def close(self):
+        await asyncio.gather(*(detector.close() for detector in self._detectors.values()))
+
+    def __len__(self) -> int:
+        return len(self._detectors)
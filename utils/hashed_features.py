@@ -0,0 +1,120 @@
+"""
+Хэшированные символьные n-граммы (char_wb) на NumPy.
+
+Вместо словаря n-грамм каждое окно текста хэшируется прямо в номер признака
+фиксированного пространства n_features, поэтому память не растёт вместе со
+словарём. Одна и та же функция используется при обучении
+(utils.hashed_vectorizer.HashedCharVectorizer) и при инференсе (HashedScorer),
+так что модели совместимы по построению.
+"""
+import re
+from typing import List, Tuple
+
+import numpy as np
+
+_WHITE_SPACES = re.compile(r"\s\s+")
+
+# Константы полиномиального хэша и финального перемешивания (splitmix64)
+_BASE = np.uint64(0x100000001B3)
+_MIX_1 = np.uint64(0xBF58476D1CE4E5B9)
+_MIX_2 = np.uint64(0x94D049BB133111EB)
+_SHIFT_1 = np.uint64(30)
+_SHIFT_2 = np.uint64(27)
+_SHIFT_3 = np.uint64(31)
+
+
+def _mix(h: np.ndarray, n: int) -> np.ndarray:
+    h = h ^ np.uint64(n * 0x9E3779B97F4A7C15 % 2**64)
+    h = (h ^ (h >> _SHIFT_1)) * _MIX_1
+    h = (h ^ (h >> _SHIFT_2)) * _MIX_2
+    return h ^ (h >> _SHIFT_3)
+
+
+def hash_char_wb(texts: List[str], n_features: int, ngram_range: Tuple[int, int] = (1, 3),
+                 lowercase: bool = True) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Хэширует char_wb n-граммы пачки текстов за один векторизованный проход.
+    Окна те же, что у TfidfVectorizer(analyzer='char_wb'): внутри каждого
+    слова, дополненного пробелами с двух сторон.
+
+    Returns:
+        (номер документа, номер признака) для каждой n-граммы
+    """
+    min_n, max_n = ngram_range
+    padded: List[str] = []
+    word_docs: List[int] = []
+    for doc, text in enumerate(texts):
+        if lowercase:
+            text = text.lower()
+        words = _WHITE_SPACES.sub(" ", text).split()
+        padded.extend(" " + w + " " for w in words)
+        word_docs.extend([doc] * len(words))
+
+    if not padded:
+        empty = np.zeros(0, dtype=np.intp)
+        return empty, empty
+
+    # Слова склеиваются через разделитель; границы окон считаются по длинам,
+    # поэтому сам символ-разделитель значения не имеет
+    codes = np.frombuffer("\x00".join(padded).encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    lengths = np.fromiter(map(len, padded), dtype=np.int64, count=len(padded))
+    stride = lengths + 1
+    starts = np.cumsum(stride) - stride
+    ends = np.repeat(starts + lengths, stride)[:codes.size]      # конец слова для каждой позиции
+    docs = np.repeat(np.asarray(word_docs, dtype=np.intp), stride)[:codes.size]
+    positions = np.arange(codes.size)
+
+    doc_parts: List[np.ndarray] = []
+    feature_parts: List[np.ndarray] = []
+    modulus = np.uint64(n_features)
+
+    h = np.zeros(codes.size, dtype=np.uint64)
+    for n in range(1, max_n + 1):
+        size = codes.size - n + 1
+        if size <= 0:
+            break
+        # h_n[i] = h_{n-1}[i] * BASE + codes[i + n - 1]
+        h = h[:size] * _BASE + codes[n - 1:]
+        if n < min_n:
+            continue
+        valid = positions[:size] + n <= ends[:size]
+        if n == min_n and min_n > 1:
+            # Слово короче min_n sklearn учитывает целиком один раз
+            short = lengths < min_n
+            if short.any():
+                for start, length in zip(starts[short], lengths[short]):
+                    hw = np.zeros(1, dtype=np.uint64)
+                    for c in codes[start:start + length]:
+                        hw = hw * _BASE + c
+                    feature_parts.append((_mix(hw, int(length)) % modulus).astype(np.intp))
+                    doc_parts.append(docs[start:start + 1])
+        doc_parts.append(docs[:size][valid])
+        feature_parts.append((_mix(h[valid], n) % modulus).astype(np.intp))
+
+    return np.concatenate(doc_parts), np.concatenate(feature_parts)
+
+
+def count_matrix(texts: List[str], n_features: int, ngram_range: Tuple[int, int] = (1, 3),
+                 lowercase: bool = True) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Разреженная матрица частот в координатном виде: (строки, признаки, tf),
+    повторы (документ, признак) уже сложены
+    """
+    docs, features = hash_char_wb(texts, n_features, ngram_range, lowercase)
+    if docs.size == 0:
+        return docs, features, np.zeros(0, dtype=np.float64)
+    keys, counts = np.unique(docs.astype(np.int64) * n_features + features, return_counts=True)
+    return (keys // n_features).astype(np.intp), (keys % n_features).astype(np.intp), counts.astype(np.float64)
+
+
+def linear_tfidf_scores(rows: np.ndarray, cols: np.ndarray, tf: np.ndarray, n_docs: int,
+                        idf: np.ndarray, coef: np.ndarray, intercept: float,
+                        sublinear_tf: bool = False) -> np.ndarray:
+    """decision_function линейной модели над TF-IDF с l2-нормировкой строк"""
+    if sublinear_tf:
+        tf = 1.0 + np.log(tf)
+    weights = tf * idf[cols]
+    norms = np.sqrt(np.bincount(rows, weights * weights, minlength=n_docs))
+    dots = np.bincount(rows, weights * coef[cols], minlength=n_docs)
+    scores = np.divide(dots, norms, out=np.zeros(n_docs), where=norms > 0)
+    return scores + intercept
@@ -0,0 +1,27 @@
+import numpy as np
+import scipy.sparse as sp
+from sklearn.base import BaseEstimator, TransformerMixin
+
+from .hashed_features import count_matrix
+
+
+class HashedCharVectorizer(TransformerMixin, BaseEstimator):
+    """
+    Обучающая сторона хэшированных char_wb n-грамм: аналог HashingVectorizer
+    (alternate_sign=False, norm=None), но с той же хэш-функцией, что и
+    HashedScorer на инференсе. Ставится в Pipeline перед TfidfTransformer.
+    """
+
+    def __init__(self, n_features: int = 2 ** 18, ngram_range=(1, 3), lowercase: bool = True):
+        self.n_features = n_features
+        self.ngram_range = ngram_range
+        self.lowercase = lowercase
+
+    def fit(self, X, y=None):
+        # Состояния нет: пространство признаков фиксировано
+        return self
+
+    def transform(self, X):
+        texts = list(X)
+        rows, cols, tf = count_matrix(texts, self.n_features, tuple(self.ngram_range), self.lowercase)
+        return sp.csr_matrix((tf, (rows, cols)), shape=(len(texts), self.n_features), dtype=np.float64)
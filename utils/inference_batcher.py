@@ -0,0 +1,127 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, List, Optional, Set, Tuple
+
+from .metrics import LatencyStat
+
+logger = logging.getLogger(__name__)
+
+Prediction = Tuple[int, float]
+
+
+class BatchingInference:
+    """
+    Асинхронная очередь ML-предсказаний с микробатчингом.
+
+    Параллельные вызовы predict() собираются в пачку (до max_batch текстов или
+    max_delay секунд ожидания), пачка целиком уходит в run_batch, и каждый
+    вызывающий получает свой результат. Одновременно обрабатывается не больше
+    max_inflight пачек (для пула процессов - по пачке на воркер).
+    """
+
+    def __init__(
+        self,
+        run_batch: Callable[[List[str]], Awaitable[List[Prediction]]],
+        max_batch: int = 64,
+        max_delay: float = 0.005,
+        max_inflight: int = 1,
+    ):
+        self.run_batch = run_batch
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.max_inflight = max_inflight
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._inflight: Set[asyncio.Task] = set()
+        self._waiting: Set[asyncio.Future] = set()  # результаты, которых ждут вызывающие
+        self._closed = False
+
+        self.batches = 0
+        self.items = 0
+        self.batch_latency = LatencyStat()
+
+    @property
+    def mean_batch_size(self) -> float:
+        return self.items / self.batches if self.batches else 0.0
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def _ensure_worker(self):
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+
+    async def predict(self, text: str) -> Prediction:
+        if self._closed:
+            raise RuntimeError("Очередь ML-предсказаний остановлена")
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        self._waiting.add(future)
+        future.add_done_callback(self._waiting.discard)
+        self._queue.put_nowait((text, future))
+        return await future
+
+    def _drain(self, batch: list):
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self._queue.get_nowait())
+            except asyncio.QueueEmpty:
+                break
+
+    async def _run(self):
+        slots = asyncio.Semaphore(self.max_inflight)
+        while True:
+            # Пока все слоты заняты, сообщения копятся в очереди и пачки растут
+            await slots.acquire()
+            batch = [await self._queue.get()]
+            self._drain(batch)
+            if len(batch) < self.max_batch and self.max_delay > 0:
+                # Даём соседним сообщениям шанс попасть в ту же пачку
+                await asyncio.sleep(self.max_delay)
+                self._drain(batch)
+
+            task = asyncio.create_task(self._process(batch, slots))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _process(self, batch: list, slots: asyncio.Semaphore):
+        texts = [text for text, _ in batch]
+        started = time.perf_counter()
+        try:
+            results = await self.run_batch(texts)
+        except Exception as e:
+            logger.error(f"Ошибка пакетного ML предсказания: {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self.batch_latency.since(started)
+            slots.release()
+
+        self.batches += 1
+        self.items += len(batch)
+        for (_, future), result in zip(batch, results):
+            if not future.done():  # вызывающий мог быть отменён
+                future.set_result(result)
+
+    async def close(self):
+        """Останавливает пачки; ждущие predict() получают ошибку, а не висят"""
+        self._closed = True
+        tasks = list(self._inflight)
+        if self._worker is not None:
+            tasks.append(self._worker)
+            self._worker = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        error = RuntimeError("Очередь ML-предсказаний остановлена")
+        for future in list(self._waiting):
+            if not future.done():
+                future.set_exception(error)
+        self._waiting.clear()
@@ -0,0 +1,183 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional, Tuple
+
+from .metrics import LatencyStat
+
+logger = logging.getLogger(__name__)
+
+Prediction = Tuple[int, float]
+
+# Как часто воркер проверяет, не обновился ли файл модели
+MODEL_CHECK_INTERVAL = 1.0
+
+
+# --- Код, выполняемый внутри процессов-воркеров ---
+
+_worker_classifier = None
+_worker_model_path: Optional[str] = None
+_worker_model_mtime: Optional[int] = None
+_worker_checked_at = 0.0
+
+
+def _model_mtime(path: str) -> Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _reload_if_changed():
+    """Перечитывает модель, если файл на диске сменился с момента загрузки"""
+    global _worker_classifier, _worker_model_mtime, _worker_checked_at
+    now = time.monotonic()
+    if _worker_classifier is not None and now - _worker_checked_at < MODEL_CHECK_INTERVAL:
+        return
+    _worker_checked_at = now
+
+    mtime = _model_mtime(_worker_model_path)
+    if _worker_classifier is not None and mtime == _worker_model_mtime:
+        return
+
+    from .ml_classifier import MLClassifier
+    # Только чтение: версии регистрирует и активирует основной процесс
+    classifier = MLClassifier(model_path=_worker_model_path, read_only=True)
+    if classifier.load():
+        _worker_classifier = classifier
+        _worker_model_mtime = mtime
+        logger.info(f"Воркер {os.getpid()}: модель загружена")
+
+
+def _init_worker(model_path: str):
+    global _worker_model_path
+    _worker_model_path = model_path
+    try:
+        # Воркеры инференса не должны отнимать CPU у event loop
+        os.nice(5)
+    except (AttributeError, OSError):
+        pass
+    _reload_if_changed()
+
+
+def _predict_in_worker(texts: List[str]) -> Tuple[int, float, Optional[int], List[Prediction]]:
+    _reload_if_changed()
+    started = time.perf_counter()
+    if _worker_classifier is None:
+        results = [(0, 0.0)] * len(texts)
+    else:
+        # Тексты приходят уже нормализованными (TextPreprocessor в основном процессе)
+        results = _worker_classifier.predict_normalized(texts)
+    return os.getpid(), time.perf_counter() - started, _worker_model_mtime, results
+
+
+# --- Сторона основного процесса ---
+
+class WorkerStats:
+    __slots__ = ('pid', 'items', 'latency', 'last_seen', 'model_mtime')
+
+    def __init__(self, pid: int):
+        self.pid = pid
+        self.items = 0
+        self.latency = LatencyStat()
+        self.last_seen = 0.0
+        self.model_mtime: Optional[int] = None
+
+
+class ProcessPoolInference:
+    """
+    Инференс в отдельных процессах, чтобы TF-IDF (чистый Python под GIL)
+    не останавливал event loop aiogram.
+
+    Каждый воркер один раз загружает модель и сам перечитывает её, когда файл
+    меняется. Число одновременно отправленных в пул пачек ограничено queue_depth:
+    сверх этого вызывающие ждут (backpressure), а не копят задачи в пуле.
+    """
+
+    def __init__(self, model_path: str, pool_size: int = 2, queue_depth: int = 8, start_method: str = "spawn"):
+        self.model_path = model_path
+        self.pool_size = pool_size
+        self.queue_depth = queue_depth
+        self.start_method = start_method
+
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self.workers: Dict[int, WorkerStats] = {}
+        self.restarts = 0
+        self.inflight = 0
+
+    def _ensure_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.pool_size,
+                mp_context=multiprocessing.get_context(self.start_method),
+                initializer=_init_worker,
+                initargs=(self.model_path,),
+            )
+        return self._executor
+
+    def _restart(self):
+        logger.error("Пул инференса сломан, пересоздаю")
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+        self.workers.clear()
+        self.restarts += 1
+
+    async def predict_batch(self, texts: List[str]) -> List[Prediction]:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.queue_depth)
+
+        async with self._slots:
+            loop = asyncio.get_running_loop()
+            self.inflight += 1
+            try:
+                pid, elapsed, model_mtime, results = await loop.run_in_executor(
+                    self._ensure_executor(), _predict_in_worker, texts
+                )
+            except BrokenProcessPool:
+                self._restart()
+                raise
+            finally:
+                self.inflight -= 1
+
+        stats = self.workers.get(pid)
+        if stats is None:
+            stats = self.workers[pid] = WorkerStats(pid)
+        stats.items += len(texts)
+        stats.latency.observe(elapsed)
+        stats.last_seen = time.monotonic()
+        stats.model_mtime = model_mtime
+        return results
+
+    def health(self) -> List[dict]:
+        """Состояние воркеров по последним ответам"""
+        now = time.monotonic()
+        return [
+            {
+                "pid": stats.pid,
+                "batches": stats.latency.count,
+                "items": stats.items,
+                "mean_ms": stats.latency.mean_ms,
+                "max_ms": stats.latency.max * 1000,
+                "idle_s": now - stats.last_seen,
+                "model_mtime": stats.model_mtime,
+            }
+            for stats in self.workers.values()
+        ]
+
+    async def warm_up(self):
+        """Поднимает воркеры заранее, чтобы первые сообщения не ждали загрузки модели"""
+        await asyncio.gather(
+            *(self.predict_batch([""]) for _ in range(self.pool_size)),
+            return_exceptions=True,
+        )
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,34 @@
+import time
+from typing import Dict
+
+
+class LatencyStat:
+    """Накопительная статистика задержек одной стадии"""
+    __slots__ = ('count', 'total', 'max')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def since(self, started: float):
+        """Записывает время, прошедшее с момента started (time.perf_counter())"""
+        self.observe(time.perf_counter() - started)
+
+    @property
+    def mean_ms(self) -> float:
+        return self.total / self.count * 1000 if self.count else 0.0
+
+    def summary(self) -> str:
+        return f"{self.count} шт., ср. {self.mean_ms:.2f} мс, макс. {self.max * 1000:.1f} мс"
+
+
+def format_stats(stats: Dict[str, LatencyStat]) -> str:
+    """Строки вида '• стадия: N шт., ср. X мс, макс. Y мс' для /mm_status"""
+    return "\n".join(f"• {name}: {stat.summary()}" for name, stat in stats.items())
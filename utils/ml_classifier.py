@@ -1,15 +1,18 @@
-import pickle
+import copy
 import logging
 import os
+import time
 from typing import List, Tuple, Optional
-import re
 from collections import Counter
 #skip some imports
 import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.linear_model import SGDClassifier
-from sklearn.pipeline import Pipeline
-from sklearn.model_selection import train_test_split
+
+from .model_store import ModelStore
+from .text_preprocessor import preprocessor as shared_preprocessor
+from .compact_model import export_compact, load_scorer, scorer_from_pipeline
+
+# sklearn импортируется лениво - только для обучения и загрузки .pkl:
+# инференс по компактной модели обходится NumPy
 
 logger = logging.getLogger(__name__)
 
@@ -19,16 +22,63 @@ class MLClassifier:
     Использует SGDClassifier (стохастический градиентный спуск) - очень быстрый и легкий
     """
     
-    def __init__(self, model_path: str = "models/bot_detector.pkl"):
+    FEATURES = ("vocab", "hashed")
+    EVALUATIONS = ("holdout", "kfold", "none")
+    
+    def __init__(self, model_path: str = "models/bot_detector.pkl", features: str = "vocab",
+                 n_features: int = 2 ** 18, evaluation: str = "holdout", eval_folds: int = 5,
+                 eval_jobs: int = -1, adopt_existing: bool = True, read_only: bool = False):
+        if features not in self.FEATURES:
+            raise ValueError(f"Неизвестный тип признаков: {features}")
+        if evaluation not in self.EVALUATIONS:
+            raise ValueError(f"Неизвестный способ оценки: {evaluation}")
         self.model_path = model_path
+        # Тип признаков влияет только на обучение новых моделей: инференс
+        # определяет его по сохранённому файлу
+        self.features = features
+        self.n_features = n_features
+        # Оценка качества при полном обучении: holdout 80/20, k-fold или без неё
+        self.evaluation = evaluation
+        self.eval_folds = eval_folds
+        self.eval_jobs = eval_jobs
+        self.preprocessor = shared_preprocessor
+        # Инференс читает self.pipeline один раз за вызов; обучение собирает
+        # новый объект и подменяет ссылку целиком, поэтому predict никогда не
+        # видит наполовину обновлённую модель
         self.pipeline = None
+        self.scorer = None  # лёгкий скорер для инференса (CompactScorer / HashedScorer)
         self.is_trained = False
+        self.version: Optional[str] = None
+        
+        # read_only - воркеры инференса: только читают модель, файлы не трогают
+        if not read_only:
+            # Создаем директорию для моделей, если её нет
+            os.makedirs(os.path.dirname(model_path), exist_ok=True)
+        self.store = ModelStore(model_path, adopt=adopt_existing, read_only=read_only)
         
-        # Создаем директорию для моделей, если её нет
-        os.makedirs(os.path.dirname(model_path), exist_ok=True)
+    def _create_classifier(self):
+        from sklearn.linear_model import SGDClassifier
         
-    def _create_pipeline(self) -> Pipeline:
+        return SGDClassifier(
+            loss='log_loss',  # Логистическая регрессия через SGD
+            penalty='l2',
+            alpha=1e-4,  # Сила регуляризации
+            max_iter=1000,
+            tol=1e-3,
+            learning_rate='optimal',
+            class_weight=None,
+            random_state=42,
+            n_jobs=-1  # Используем все ядра
+        )
+    
+    def _create_pipeline(self) -> "Pipeline":
         """Создает pipeline с TF-IDF и SGDClassifier"""
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        from sklearn.pipeline import Pipeline
+        
+        if self.features == "hashed":
+            return self._create_hashed_pipeline()
+        
         return Pipeline([
             ('tfidf', TfidfVectorizer(
                 max_features=5000,  # Ограничиваем количество признаков
@@ -38,101 +88,122 @@ class MLClassifier:
                 analyzer='char_wb',  # Анализируем символы внутри слов (лучше для русского)
                 token_pattern=r'(?u)\b\w+\b'
             )),
-            ('clf', SGDClassifier(
-                loss='log_loss',  # Логистическая регрессия через SGD
-                penalty='l2',
-                alpha=1e-4,  # Сила регуляризации
-                max_iter=1000,
-                tol=1e-3,
-                learning_rate='optimal',
-                class_weight=None,
-                random_state=42,
-                n_jobs=-1  # Используем все ядра
-            ))
+            ('clf', self._create_classifier())
+        ])
+    
+    def _create_hashed_pipeline(self) -> "Pipeline":
+        """
+        Хэшированные char_wb n-граммы вместо словаря: память модели фиксирована,
+        новые n-граммы из дообучения не теряются, инференс - HashedScorer
+        """
+        from sklearn.feature_extraction.text import TfidfTransformer
+        from sklearn.pipeline import Pipeline
+        from .hashed_vectorizer import HashedCharVectorizer
+        
+        return Pipeline([
+            ('hash', HashedCharVectorizer(n_features=self.n_features, ngram_range=(1, 3))),
+            ('tfidf', TfidfTransformer()),
+            ('clf', self._create_classifier())
         ])
     
     def _preprocess_text(self, texts: List[str]) -> List[str]:
-        """Предобработка текстов"""
-        processed = []
-        for text in texts:
-            if not text:
-                processed.append("")
-                continue
-                
-            # Приводим к нижнему регистру
-            text = text.lower()
-            
-            # Заменяем URL на специальный токен
-            text = re.sub(r'https?://\S+|t\.me/\S+|telegram\.me/\S+', ' [URL] ', text)
-            
-            # Заменяем упоминания пользователей
-            text = re.sub(r'@\w+', ' [USER] ', text)
-            
-            # Заменяем числа
-            text = re.sub(r'\d+', ' [NUM] ', text)
-            
-            # Убираем лишние пробелы
-            text = re.sub(r'\s+', ' ', text).strip()
-            
-            processed.append(text)
-            
-        return processed
+        """Предобработка текстов (общий для детектора и обучения TextPreprocessor)"""
+        return self.preprocessor.normalize_batch(texts)
     
     
     def train(self, texts: List[str], labels: List[int]) -> dict:
         """
-        Обучает модель на новых данных
+        Обучает модель на новых данных: текст векторизуется один раз, оценка
+        (holdout или k-fold, параллельно через joblib) идёт на готовой
+        матрице, итоговый классификатор обучается один раз на всех данных.
+        Векторизатор видит все тексты, включая проверочные - это влияет
+        только на словарь/IDF, метки в оценку не просачиваются.
         
         Args:
             texts: список текстов
             labels: список меток (0 - нормально, 1 - подозрительно)
             
         Returns:
-            dict с метриками обучения
+            dict с метриками обучения и временем этапов (timings, сек.)
         """
         if len(texts) < 10:
             raise ValueError("Слишком мало данных для обучения (минимум 10)")
-            
-        # Предобработка
-        processed_texts = self._preprocess_text(texts)
         
-        # Создаем pipeline
-        self.pipeline = self._create_pipeline()
+        timings = {}
+        y = np.asarray(labels, dtype=np.int64)
         
-        # Обучаем
-        self.pipeline.fit(processed_texts, labels)
-        self.is_trained = True
+        # Предобработка и векторизация - один раз на весь корпус
+        started = time.perf_counter()
+        processed_texts = self._preprocess_text(texts)
+        pipeline = self._create_pipeline()
+        X = pipeline[:-1].fit_transform(processed_texts, y)
+        timings['vectorize'] = time.perf_counter() - started
         
         # Оцениваем качество
-        if len(texts) >= 20:
-            X_train, X_test, y_train, y_test = train_test_split(
-                processed_texts, labels, test_size=0.2, random_state=42
-            )
-            self.pipeline.fit(X_train, y_train)
-            accuracy = self.pipeline.score(X_test, y_test)
-            
-            logger.info(f"Модель обучена. Точность на тесте: {accuracy:.3f}")
-            
-            # Сохраняем модель
-            self.save()
-            
-            return {
-                'accuracy': accuracy,
-                'train_size': len(X_train),
-                'test_size': len(X_test)
-            }
+        started = time.perf_counter()
+        evaluation = self._evaluate(pipeline.steps[-1][1], X, y)
+        timings['eval'] = time.perf_counter() - started
+        
+        # Итоговая модель - единственный fit на всех данных
+        started = time.perf_counter()
+        pipeline.steps[-1][1].fit(X, y)
+        timings['fit'] = time.perf_counter() - started
+        
+        if evaluation['accuracy'] is not None:
+            logger.info(f"Модель обучена. Точность ({self.evaluation}): {evaluation['accuracy']:.3f}")
+        logger.info(
+            "Этапы обучения: " + ", ".join(f"{name}={seconds * 1000:.0f} мс" for name, seconds in timings.items())
+        )
+        
+        # Сохраняем модель и подменяем активную
+        self._publish(pipeline)
+        
+        return {
+            **evaluation,
+            'train_size': len(texts),
+            'timings': timings,
+            'version': self.version
+        }
+    
+    def _evaluate(self, classifier, X, y: np.ndarray) -> dict:
+        """Оценка на уже векторизованной матрице; классификатор клонируется на каждый сплит"""
+        if self.evaluation == "none" or len(y) < 20:
+            return {'accuracy': None, 'test_size': 0}
+        
+        from joblib import Parallel, delayed
+        from sklearn.base import clone
+        from sklearn.model_selection import KFold, StratifiedKFold, train_test_split
+        
+        indices = np.arange(len(y))
+        if self.evaluation == "kfold":
+            # Стратификация возможна, только если каждого класса хватает на все фолды
+            folds = min(self.eval_folds, len(y))
+            stratify = np.bincount(y).min() >= folds
+            splitter = (StratifiedKFold if stratify else KFold)(n_splits=folds, shuffle=True, random_state=42)
+            splits = list(splitter.split(indices, y))
         else:
-            self.pipeline.fit(processed_texts, labels)
-            self.save()
-            return {
-                'accuracy': None,
-                'train_size': len(texts),
-                'test_size': 0
-            }
+            train_idx, test_idx = train_test_split(indices, test_size=0.2, random_state=42)
+            splits = [(train_idx, test_idx)]
+        
+        def fit_and_score(train_idx, test_idx):
+            model = clone(classifier).fit(X[train_idx], y[train_idx])
+            return model.score(X[test_idx], y[test_idx]), len(test_idx)
+        
+        # SGD отпускает GIL внутри fit - потоки не копируют матрицу
+        results = Parallel(n_jobs=self.eval_jobs, prefer="threads")(
+            delayed(fit_and_score)(train_idx, test_idx) for train_idx, test_idx in splits
+        )
+        scores = [score for score, _ in results]
+        return {
+            'accuracy': float(np.mean(scores)),
+            'fold_scores': scores if len(scores) > 1 else None,
+            'test_size': sum(size for _, size in results),
+        }
     
     def incremental_train(self, texts: List[str], labels: List[int]) -> dict:
-        if not self.is_trained or self.pipeline is None:
+        if not self.is_trained:
             return self.train(texts, labels)
+        self._ensure_pipeline()
 
         # Приводим метки к int, отбрасываем недопустимые
         clean_labels = []
@@ -154,9 +225,11 @@ class MLClassifier:
             return {'incremental': False, 'reason': 'no valid examples'}
 
         processed = self._preprocess_text(clean_texts)
+        # Дообучаем копию, текущая модель продолжает обслуживать predict
+        pipeline = copy.deepcopy(self.pipeline)
         try:
-            self.pipeline.named_steps['clf'].partial_fit(
-                self.pipeline.named_steps['tfidf'].transform(processed),
+            pipeline.named_steps['clf'].partial_fit(
+                pipeline[:-1].transform(processed),
                 clean_labels,
                 classes=np.array([0, 1])
             )
@@ -165,8 +238,8 @@ class MLClassifier:
             raise  # пробрасываем дальше, чтобы увидеть в логах
 
         logger.info(f"Модель дообучена на {len(clean_texts)} примерах")
-        self.save()
-        return {'incremental': True, 'new_samples': len(clean_texts)}
+        self._publish(pipeline)
+        return {'incremental': True, 'new_samples': len(clean_texts), 'version': self.version}
     
     def predict(self, text: str) -> Tuple[int, float]:
         """
@@ -175,36 +248,98 @@ class MLClassifier:
         Returns:
             (класс, уверенность)
         """
-        if not self.is_trained or self.pipeline is None:
-            return 0, 0.0
-            
-        processed = self._preprocess_text([text])
+        return self.predict_batch([text])[0]
+    
+    def predict_batch(self, texts: List[str]) -> List[Tuple[int, float]]:
+        """
+        Предсказывает классы для пачки текстов: одна TF-IDF матрица и один
+        вызов predict_proba, класс берётся как argmax вероятностей
         
-        # Получаем вероятности
-        probs = self.pipeline.predict_proba(processed)[0]
-        pred = self.pipeline.predict(processed)[0]
+        Returns:
+            [(класс, уверенность), ...] в порядке texts
+        """
+        return self.predict_normalized(self._preprocess_text(texts))
+    
+    def predict_normalized(self, processed: List[str]) -> List[Tuple[int, float]]:
+        """predict_batch для текстов, уже прошедших TextPreprocessor"""
+        scorer = self.scorer
+        if scorer is not None:
+            return scorer.predict_batch(processed)
+        
+        pipeline = self.pipeline
+        if pipeline is None:
+            return [(0, 0.0)] * len(processed)
         
-        confidence = probs[pred]
+        probs = pipeline.predict_proba(processed)
+        classes = pipeline.classes_
+        best = probs.argmax(axis=1)
         
-        return int(pred), float(confidence)
+        return [
+            (int(classes[i]), float(row[i]))
+            for row, i in zip(probs, best)
+        ]
+    
+    @staticmethod
+    def _scorer_for(pipeline):
+        try:
+            return scorer_from_pipeline(pipeline)
+        except Exception as e:
+            logger.warning(f"Компактный скорер недоступен, инференс через sklearn: {e}")
+            return None
+    
+    def _ensure_pipeline(self):
+        """Полный sklearn-пайплайн нужен только для дообучения - грузим по требованию"""
+        if self.pipeline is None:
+            self.pipeline = self.store.load()
+    
+    def _publish(self, pipeline: "Pipeline"):
+        """Атомарно сохраняет новую версию и переключает на неё инференс"""
+        version = self.store.save(pipeline, export_compact=export_compact)
+        self.pipeline = pipeline
+        self.scorer = self._scorer_for(pipeline)
+        self.version = version
+        self.is_trained = True
     
     def save(self):
-        """Сохраняет модель"""
+        """Сохраняет модель как новую версию"""
         if self.pipeline:
-            with open(self.model_path, 'wb') as f:
-                pickle.dump(self.pipeline, f)
+            self.version = self.store.save(self.pipeline, export_compact=export_compact)
             logger.info(f"Модель сохранена в {self.model_path}")
     
-    def load(self) -> bool:
-        """Загружает модель"""
+    def load(self, prefer_compact: bool = True) -> bool:
+        """
+        Загружает модель. По умолчанию - из компактного .npz без импорта
+        sklearn; .pkl читается, только если компактного файла нет или он устарел.
+        """
         try:
             if os.path.exists(self.model_path):
-                with open(self.model_path, 'rb') as f:
-                    self.pipeline = pickle.load(f)
+                if prefer_compact and self.store.compact_is_fresh():
+                    self.scorer = load_scorer(self.store.compact_path)
+                    self.pipeline = None
+                else:
+                    pipeline = self.store.load()
+                    self.scorer = self._scorer_for(pipeline) if prefer_compact else None
+                    self.pipeline = pipeline
+                    if self.scorer is not None and not self.store.read_only:
+                        self.store.ensure_compact(pipeline, export_compact)
+                self.version = self.store.active_version()
                 self.is_trained = True
                 logger.info(f"Модель загружена из {self.model_path}")
                 return True
         except Exception as e:
             logger.error(f"Ошибка загрузки модели: {e}")
             
-        return False
\ No newline at end of file
+        return False
+    
+    def list_versions(self) -> List[str]:
+        return self.store.list_versions()
+    
+    def rollback(self, version: str):
+        """Переключает инференс на сохранённую версию"""
+        pipeline = self.store.load(version)
+        scorer = self._scorer_for(pipeline)
+        self.store.activate(version)
+        self.pipeline = pipeline
+        self.scorer = scorer
+        self.version = version
+        self.is_trained = True
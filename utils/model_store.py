@@ -0,0 +1,225 @@
+import logging
+import os
+import pickle
+import shutil
+import tempfile
+from datetime import datetime
+from typing import Any, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ModelStore:
+    """
+    Версионированное хранилище артефактов модели.
+
+    Каждая сохранённая модель пишется во временный файл и атомарно
+    переименовывается в models/versions/<имя>-<время>.pkl. Активная модель
+    (model_path) - жёсткая ссылка на одну из версий (или копия, если ФС не
+    умеет ссылок), которая тоже подменяется атомарно через os.replace,
+    поэтому читатели никогда не видят недописанный файл. Имя активной
+    версии записывается в versions/<имя>.active.
+
+    Рядом с каждой версией может лежать компактный .npz (см. compact_model);
+    он активируется раньше .pkl, так что к моменту смены .pkl компактный
+    файл уже соответствует ему.
+
+    Модель, лежавшая в model_path до появления версий, при первом запуске
+    регистрируется как версия <имя>-0 - самая старая, на неё можно откатиться.
+    Регистрирует её только основной процесс (adopt); воркеры инференса
+    открывают хранилище read_only - только чтение, без записи файлов.
+    """
+
+    def __init__(self, model_path: str, max_versions: int = 10, adopt: bool = True, read_only: bool = False):
+        self.model_path = model_path
+        self.max_versions = max_versions
+        self.read_only = read_only
+        directory = os.path.dirname(model_path) or "."
+        self.versions_dir = os.path.join(directory, "versions")
+        self.stem = os.path.splitext(os.path.basename(model_path))[0]
+        self.compact_path = os.path.splitext(model_path)[0] + ".npz"
+        self.active_path = os.path.join(self.versions_dir, self.stem + ".active")
+        if read_only:
+            return
+        os.makedirs(self.versions_dir, exist_ok=True)
+        if adopt:
+            try:
+                self._adopt_existing()
+            except OSError as e:
+                logger.error(f"Не удалось зарегистрировать имеющуюся модель как версию: {e}")
+
+    def _check_writable(self):
+        if self.read_only:
+            raise RuntimeError("Хранилище модели открыто только для чтения")
+
+    def _check_version(self, version: str):
+        """Только имена из list_versions(): версия из команды не должна выводить за versions_dir"""
+        if version not in self.list_versions():
+            raise FileNotFoundError(f"Версия {version} не найдена")
+
+    def _version_path(self, version: str) -> str:
+        return os.path.join(self.versions_dir, version + ".pkl")
+
+    def _compact_version_path(self, version: str) -> str:
+        return os.path.join(self.versions_dir, version + ".npz")
+
+    @staticmethod
+    def _write_atomic(path: str, obj: Any):
+        directory = os.path.dirname(path) or "."
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(obj, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    @staticmethod
+    def _link_atomic(source: str, target: str):
+        """Атомарно подменяет target жёсткой ссылкой на source"""
+        directory = os.path.dirname(target) or "."
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        os.close(fd)
+        os.unlink(tmp_path)
+        try:
+            os.link(source, tmp_path)
+        except OSError:
+            # ФС без жёстких ссылок - копируем
+            shutil.copy2(source, tmp_path)
+        os.replace(tmp_path, target)
+
+    def _adopt_existing(self):
+        """Активная модель без версии (из репозитория или старого запуска) становится версией 0"""
+        if not os.path.exists(self.model_path) or self.active_version() is not None:
+            return
+        version = f"{self.stem}-0"
+        if os.path.exists(self._version_path(version)):
+            # Версия 0 уже есть, а активный файл заменён вручную - новая версия
+            version = f"{self.stem}-{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}"
+        if self.compact_is_fresh():
+            self._link_atomic(self.compact_path, self._compact_version_path(version))
+        self._link_atomic(self.model_path, self._version_path(version))
+        self._activate(version)
+        logger.info(f"Имеющаяся модель зарегистрирована как версия {version}")
+
+    def _activate(self, version: str):
+        """Атомарно делает версию активной моделью"""
+        self._check_writable()
+        compact = self._compact_version_path(version)
+        if os.path.exists(compact):
+            self._link_atomic(compact, self.compact_path)
+        elif os.path.exists(self.compact_path):
+            # У версии нет компактного файла - старый .npz больше не соответствует модели
+            os.unlink(self.compact_path)
+        self._link_atomic(self._version_path(version), self.model_path)
+        self._write_pointer(version)
+
+    def _write_pointer(self, version: str):
+        fd, tmp_path = tempfile.mkstemp(dir=self.versions_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(version)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.active_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def save(self, obj: Any, export_compact: Optional[Callable[[Any, str], None]] = None) -> str:
+        """
+        Сохраняет новую версию и делает её активной. Возвращает имя версии.
+        export_compact(obj, path) дополнительно пишет компактный файл версии.
+        """
+        self._check_writable()
+        version = f"{self.stem}-{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}"
+        self._write_atomic(self._version_path(version), obj)
+        if export_compact is not None:
+            try:
+                self._export_atomic(obj, self._compact_version_path(version), export_compact)
+            except Exception as e:
+                logger.error(f"Не удалось сохранить компактную модель: {e}")
+        self._activate(version)
+        self._prune()
+        logger.info(f"Модель сохранена как версия {version}")
+        return version
+
+    @staticmethod
+    def _export_atomic(obj: Any, path: str, export: Callable[[Any, str], None]):
+        directory = os.path.dirname(path) or "."
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        os.close(fd)
+        try:
+            export(obj, tmp_path)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def ensure_compact(self, obj: Any, export: Callable[[Any, str], None]):
+        """Создаёт недостающий компактный файл для активной модели"""
+        self._check_writable()
+        self._export_atomic(obj, self.compact_path, export)
+
+    def compact_is_fresh(self) -> bool:
+        """Компактный файл есть и записан не раньше активного .pkl"""
+        try:
+            return os.stat(self.compact_path).st_mtime_ns >= os.stat(self.model_path).st_mtime_ns
+        except OSError:
+            return False
+
+    def load(self, version: Optional[str] = None) -> Any:
+        """Загружает активную модель или указанную версию"""
+        if version is not None:
+            self._check_version(version)
+        path = self.model_path if version is None else self._version_path(version)
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+    def activate(self, version: str):
+        """Откат/переключение на существующую версию"""
+        self._check_version(version)
+        self._activate(version)
+        logger.info(f"Активная модель переключена на {version}")
+
+    def active_version(self) -> Optional[str]:
+        if not os.path.exists(self.model_path):
+            return None
+        try:
+            with open(self.active_path, encoding="utf-8") as f:
+                version = f.read().strip()
+            if os.path.exists(self._version_path(version)):
+                return version
+        except OSError:
+            pass
+        # Хранилище до появления указателя: активная версия - та же жёсткая ссылка
+        for version in self.list_versions():
+            if os.path.samefile(self._version_path(version), self.model_path):
+                return version
+        return None
+
+    def list_versions(self) -> List[str]:
+        """Имена версий, от новых к старым"""
+        if not os.path.isdir(self.versions_dir):
+            return []
+        names = [
+            name[:-len(".pkl")]
+            for name in os.listdir(self.versions_dir)
+            if name.startswith(self.stem + "-") and name.endswith(".pkl")
+        ]
+        return sorted(names, reverse=True)
+
+    def _prune(self):
+        active = self.active_version()
+        for version in self.list_versions()[self.max_versions:]:
+            if version != active:
+                os.unlink(self._version_path(version))
+                compact = self._compact_version_path(version)
+                if os.path.exists(compact):
+                    os.unlink(compact)
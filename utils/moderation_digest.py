@@ -0,0 +1,100 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class SuspectItem:
+    """Подозрительное сообщение, ожидающее отправки в дайджесте"""
+    __slots__ = ('message', 'ml_confidence', 'started')
+
+    def __init__(self, message: Any, ml_confidence: Optional[float], started: float):
+        self.message = message
+        self.ml_confidence = ml_confidence
+        self.started = started  # time.perf_counter() получения сообщения
+
+
+class ModerationDigest:
+    """
+    Режим дайджеста для рейдов.
+
+    Пока подозрительных сообщений меньше burst_threshold за window секунд,
+    каждое уходит модераторам отдельной карточкой. Выше порога они копятся
+    и отправляются одним сообщением: как только набралось max_items или
+    через flush_delay секунд после первого в пачке.
+    """
+
+    def __init__(self, flush: Callable[[List[SuspectItem]], Awaitable[None]],
+                 burst_threshold: int = 5, window: float = 10.0,
+                 max_items: int = 20, flush_delay: float = 3.0):
+        self.flush = flush
+        self.burst_threshold = burst_threshold
+        self.window = window
+        self.max_items = max_items
+        self.flush_delay = flush_delay
+
+        self._arrivals: Deque[float] = deque()
+        self._pending: List[SuspectItem] = []
+        self._timer: Optional[asyncio.Task] = None
+        self._flushing = set()
+
+        self.digests = 0
+        self.digested = 0
+
+    def register(self) -> bool:
+        """Отмечает новое подозрительное сообщение; True - идёт рейд, нужен дайджест"""
+        if not self.burst_threshold:
+            return False
+        now = time.monotonic()
+        arrivals = self._arrivals
+        arrivals.append(now)
+        while arrivals and now - arrivals[0] > self.window:
+            arrivals.popleft()
+        return len(arrivals) > self.burst_threshold
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def add(self, item: SuspectItem):
+        self._pending.append(item)
+        if len(self._pending) >= self.max_items:
+            self._flush_now()
+        elif self._timer is None or self._timer.done():
+            self._timer = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_delay)
+        self._timer = None
+        self._flush_now()
+
+    def _flush_now(self):
+        if self._timer is not None and self._timer is not asyncio.current_task():
+            self._timer.cancel()
+            self._timer = None
+        items, self._pending = self._pending, []
+        if not items:
+            return
+        self.digests += 1
+        self.digested += len(items)
+        task = asyncio.create_task(self._send(items))
+        self._flushing.add(task)
+        task.add_done_callback(self._flushing.discard)
+
+    async def _send(self, items: List[SuspectItem]):
+        try:
+            await self.flush(items)
+        except Exception as e:
+            logger.error(f"❌ Ошибка отправки дайджеста ({len(items)} шт.): {e}")
+
+    async def close(self):
+        """Отправляет накопленное и дожидается отправки"""
+        self._flush_now()
+        if self._flushing:
+            await asyncio.gather(*self._flushing)
+
+    def summary(self) -> str:
+        return f"дайджестов {self.digests} ({self.digested} сообщений), ждут отправки {self.pending}"
@@ -0,0 +1,166 @@
+import asyncio
+import itertools
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+import numpy as np
+
+_BASE = np.uint64(0x100000001B3)
+_SHIFT = np.uint64(32)
+
+
+class Cluster:
+    """Группа почти одинаковых сообщений (один шаблон спама) и её общий вердикт"""
+    __slots__ = ('id', 'signature', 'size', 'verdict', 'ml_confidence', 'source',
+                 'pending', 'members', 'card', 'card_size', 'last_seen')
+
+    def __init__(self, cluster_id: int, signature: np.ndarray):
+        self.id = cluster_id
+        self.signature = signature  # подпись первого сообщения - эталон для сверки
+        self.size = 0
+        self.verdict: Optional[bool] = None  # True - спам, False - чисто, None - ещё не решено
+        self.ml_confidence: Optional[float] = None
+        self.source: Optional[str] = None    # auto | moderator
+        self.pending: Optional[asyncio.Future] = None  # вердикт первого сообщения ещё считается
+        # Сообщения, ожидающие решения модератора по карточке кластера:
+        # (chat_id, message_id, user_id)
+        self.members: List[Tuple[int, int, int]] = []
+        # Карточка модератора: (chat_id, message_id, текст, клавиатура);
+        # message_id None - карточка ещё отправляется
+        self.card: Optional[tuple] = None
+        self.card_size = 0  # сколько похожих указано в карточке
+        self.last_seen = 0.0
+
+    def set_verdict(self, verdict: bool, ml_confidence: Optional[float], source: str = "auto"):
+        # Решение модератора не перезаписывается автоматическим
+        if self.source == "moderator" and source != "moderator":
+            return
+        self.verdict = verdict
+        self.ml_confidence = ml_confidence
+        self.source = source
+
+
+class NearDuplicateIndex:
+    """
+    Потоковый индекс почти-дубликатов: MinHash по символьным шинглам
+    нормализованного текста и LSH-корзины по bands полосам подписи.
+    Поиск кластера - bands обращений к словарю и одна сверка подписей,
+    независимо от размера индекса. Хранятся только последние window
+    сообщений не старше ttl секунд.
+    """
+
+    def __init__(self, num_perm: int = 64, bands: int = 16, shingle: int = 5,
+                 threshold: float = 0.6, window: int = 5000, ttl: float = 3600.0,
+                 max_members: int = 100, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm должно делиться на bands")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle = shingle
+        self.threshold = threshold
+        self.window = window
+        self.ttl = ttl
+        self.max_members = max_members
+
+        # Хэш-функции multiply-shift: (a*h + b) mod 2**64 >> 32 - без деления,
+        # переполнение uint64 здесь и есть взятие по модулю
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(0, 1 << 62, size=(num_perm, 1), dtype=np.int64).astype(np.uint64) * np.uint64(2) + np.uint64(1)
+        self._b = rng.randint(0, 1 << 62, size=(num_perm, 1), dtype=np.int64).astype(np.uint64)
+
+        # ключ полосы -> (кластер, номер последнего сообщения, записавшего ключ)
+        self._buckets: Dict[tuple, Tuple[Cluster, int]] = {}
+        self._entries: Deque[Tuple[float, int, List[tuple]]] = deque()
+        self._seq = itertools.count()
+        self._cluster_ids = itertools.count(1)
+
+        self.lookups = 0
+        self.matches = 0
+
+    def _shingle_hashes(self, text: str) -> np.ndarray:
+        """Полиномиальные хэши всех окон по shingle символов (весь текст - одно окно, если короче)"""
+        codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+        k = min(self.shingle, codes.size)
+        h = codes[:codes.size - k + 1].copy()
+        for n in range(1, k):
+            h = h * _BASE + codes[n:codes.size - k + 1 + n]
+        return h
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = self._shingle_hashes(text or " ")
+        return ((self._a * hashes + self._b) >> _SHIFT).min(axis=1)
+
+    def _band_keys(self, signature: np.ndarray) -> List[tuple]:
+        rows = self.rows
+        return [(band, signature[band * rows:(band + 1) * rows].tobytes()) for band in range(self.bands)]
+
+    def similarity(self, first: np.ndarray, second: np.ndarray) -> float:
+        """Оценка коэффициента Жаккара по доле совпавших позиций подписи"""
+        return float(np.count_nonzero(first == second)) / self.num_perm
+
+    def _evict(self, now: float):
+        entries = self._entries
+        while entries and (len(entries) > self.window or now - entries[0][0] > self.ttl):
+            _, seq, keys = entries.popleft()
+            for key in keys:
+                stored = self._buckets.get(key)
+                # Ключ, перезаписанный более свежим сообщением, остаётся
+                if stored is not None and stored[1] == seq:
+                    del self._buckets[key]
+
+    def _match(self, signature: np.ndarray, keys: List[tuple]) -> Optional[Cluster]:
+        checked = set()
+        for key in keys:
+            stored = self._buckets.get(key)
+            if stored is None:
+                continue
+            cluster = stored[0]
+            if cluster.id in checked:
+                continue
+            checked.add(cluster.id)
+            if self.similarity(signature, cluster.signature) >= self.threshold:
+                return cluster
+        return None
+
+    def find(self, text: str) -> Optional[Cluster]:
+        """Кластер текста без добавления его в индекс"""
+        signature = self.signature(text)
+        return self._match(signature, self._band_keys(signature))
+
+    def observe(self, text: str) -> Cluster:
+        """Добавляет текст в индекс и возвращает его кластер (новый, если похожих нет)"""
+        now = time.monotonic()
+        self._evict(now)
+        self.lookups += 1
+
+        signature = self.signature(text)
+        keys = self._band_keys(signature)
+        cluster = self._match(signature, keys)
+        if cluster is None:
+            cluster = Cluster(next(self._cluster_ids), signature)
+        else:
+            self.matches += 1
+
+        seq = next(self._seq)
+        for key in keys:
+            self._buckets[key] = (cluster, seq)
+        self._entries.append((now, seq, keys))
+        cluster.size += 1
+        cluster.last_seen = now
+        return cluster
+
+    def add_member(self, cluster: Cluster, chat_id: int, message_id: int, user_id: int) -> bool:
+        """Запоминает сообщение, ждущее решения по карточке; False - список полон"""
+        if len(cluster.members) >= self.max_members:
+            return False
+        cluster.members.append((chat_id, message_id, user_id))
+        return True
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def summary(self) -> str:
+        rate = self.matches / self.lookups * 100 if self.lookups else 0.0
+        return f"в окне {len(self)}, совпадений {self.matches}/{self.lookups} ({rate:.0f}%)"
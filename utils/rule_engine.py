@@ -0,0 +1,254 @@
+import re
+import logging
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Литералы, которые функции-паттерны BotDetector проверяют "по месту"
+_CONTEXT_LITERALS = [
+    'когда', 'где', 'спасибо', 'класс', '?', 'http', 't.me',
+    'подпишись', 'вступай', 'пожарная часть',
+]
+
+
+def _trie_regex(words: Iterable[str]) -> str:
+    """
+    Собирает из списка слов одно регулярное выражение в виде префиксного дерева.
+    В каждой позиции оно находит самое длинное слово, начинающееся там.
+    """
+    trie: Dict[str, dict] = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[''] = {}  # конец слова
+
+    def build(node: dict) -> str:
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        if '' in node:
+            return '(?:' + body + ')?'
+        return body
+
+    return build(trie)
+
+
+def _leading_group(pattern: str) -> str:
+    """Возвращает ведущую группу (?:...) паттерна или пустую строку"""
+    if not pattern.startswith('(?:'):
+        return ''
+    depth = 0
+    escaped = False
+    for i, ch in enumerate(pattern):
+        if escaped:
+            escaped = False
+        elif ch == '\\':
+            escaped = True
+        elif ch == '(':
+            depth += 1
+        elif ch == ')':
+            depth -= 1
+            if depth == 0:
+                return pattern[:i + 1]
+    return ''
+
+
+def _alternation(patterns: List[str]) -> Optional[re.Pattern]:
+    """Объединяет паттерны в одну альтернативу, вынося общую ведущую группу"""
+    if not patterns:
+        return None
+    prefix = _leading_group(patterns[0])
+    if prefix and all(p.startswith(prefix) for p in patterns):
+        patterns = [p[len(prefix):] for p in patterns]
+    else:
+        prefix = ''
+    return re.compile(prefix + '(?:' + '|'.join('(?:' + p + ')' for p in patterns) + ')')
+
+
+def _combine(patterns: List[str]) -> Tuple[Optional[re.Pattern], Optional[re.Pattern]]:
+    """
+    Делит паттерны на регистронезависимые (?i) и обычные и собирает каждую группу
+    в одно выражение. Регистронезависимая часть ищется по заранее приведённому
+    к нижнему регистру тексту без флага IGNORECASE - это заметно быстрее.
+    """
+    insensitive = [p[4:] for p in patterns if p.startswith('(?i)')]
+    sensitive = [p for p in patterns if not p.startswith('(?i)')]
+    return _alternation(insensitive), _alternation(sensitive)
+
+
+def _search(regex: Optional[re.Pattern], text: str) -> bool:
+    return regex is not None and regex.search(text) is not None
+
+
+class MessageFeatures:
+    """Признаки сообщения, вычисляемые один раз на сообщение"""
+    __slots__ = ('text', 'lower', 'words', 'word_count', 'hits')
+
+    def __init__(self, text: str, lower: str, hits: FrozenSet[str]):
+        self.text = text
+        self.lower = lower
+        split = lower.split()
+        self.words = set(split)
+        self.word_count = len(split)
+        self.hits = hits
+
+    def has_any(self, keywords: FrozenSet[str]) -> bool:
+        return not self.hits.isdisjoint(keywords)
+
+
+class RuleEngine:
+    """
+    Скомпилированный rule-based движок BotDetector.
+
+    Все regex исключений и подозрительных паттернов собраны в два выражения,
+    а ключевые слова всех функций-паттернов - в один автомат, который за один
+    проход по тексту находит все вхождения. Вердикты совпадают с последовательной
+    проверкой BotDetector.patterns.
+    """
+
+    def __init__(self, detector):
+        self.detector = detector
+
+        self.exclusion_lower, self.exclusion_exact = _combine(detector.exclusion_patterns)
+        self.suspicious_lower, self.suspicious_exact = _combine(detector.regex_patterns)
+
+        keywords = set(_CONTEXT_LITERALS)
+        for group in detector.gift_triggers.values():
+            keywords.update(group)
+        for group in (
+            detector.giveaway_keywords, detector.action_keywords, detector.free_keywords,
+            detector.spam_keywords, detector.call_to_action, detector.contest_keywords,
+            detector.scam_phrases,
+        ):
+            keywords.update(group)
+
+        # Вхождения могут перекрываться (подар/подарки, приз/призы), поэтому ищем
+        # через lookahead в каждой позиции самое длинное слово, а более короткие
+        # слова с тем же началом добавляем через замыкание по префиксам
+        self.keyword_regex = re.compile('(?=(' + _trie_regex(keywords) + '))')
+        self.prefix_closure: Dict[str, FrozenSet[str]] = {
+            word: frozenset(k for k in keywords if word.startswith(k)) for word in keywords
+        }
+
+        # Группы слов в виде frozenset: проверка группы - одно пересечение множеств
+        self.gift_primary = frozenset(detector.gift_triggers['primary'])
+        self.gift_secondary = frozenset(detector.gift_triggers['secondary'])
+        self.gift_context = frozenset(detector.gift_triggers['context'])
+        self.giveaway_keywords = frozenset(detector.giveaway_keywords)
+        self.action_keywords = frozenset(detector.action_keywords)
+        self.free_keywords = frozenset(detector.free_keywords)
+        self.spam_keywords = frozenset(detector.spam_keywords)
+        self.call_to_action = frozenset(detector.call_to_action)
+        self.contest_keywords = frozenset(detector.contest_keywords)
+        self.scam_phrases = frozenset(detector.scam_phrases)
+        self.links = frozenset(['http', 't.me'])
+        self.questions = frozenset(['когда', 'где'])
+        self.free_context = frozenset(['спасибо', 'класс', '?'])
+        self.join_calls = frozenset(['подпишись', 'вступай'])
+
+        self.rules = [
+            ('gift', self._gift),
+            ('giveaway', self._giveaway),
+            ('free_stuff', self._free_stuff),
+            ('emojis', self._emojis),
+            ('spam', self._spam),
+            ('contest', self._contest),
+            ('test', self._test),
+            ('url', self._url),
+            ('telegram', self._telegram),
+            ('scam', self._scam),
+        ]
+
+    def features(self, text: str, lower: Optional[str] = None) -> MessageFeatures:
+        if lower is None:
+            lower = text.lower()
+        hits = set()
+        closure = self.prefix_closure
+        for word in self.keyword_regex.findall(lower):
+            hits |= closure[word]
+        return MessageFeatures(text, lower, frozenset(hits))
+
+    def evaluate(self, text: str, lower: Optional[str] = None) -> Tuple[bool, Optional[str]]:
+        """
+        Returns:
+            (сработало ли исключение, имя сработавшего правила или None)
+        """
+        if lower is None:
+            lower = text.lower()
+
+        if _search(self.exclusion_lower, lower) or _search(self.exclusion_exact, text):
+            return True, None
+
+        if _search(self.suspicious_lower, lower) or _search(self.suspicious_exact, text):
+            return False, 'regex'
+
+        features = self.features(text, lower)
+        for name, rule in self.rules:
+            if rule(features):
+                return False, name
+        return False, None
+
+    # Правила повторяют функции-паттерны BotDetector на предвычисленных признаках
+
+    def _gift(self, f: MessageFeatures) -> bool:
+        if len(f.words) < 3:
+            return False
+        hits = f.hits
+        score = 0
+        if f.has_any(self.gift_primary):
+            score += 2
+        score += len(hits & self.gift_secondary)
+        score += len(hits & self.gift_context)
+        if f.has_any(self.links):
+            score += 2
+        if score >= 3:
+            common = self.detector.common_words
+            common_word_ratio = len([w for w in f.words if w in common]) / len(f.words)
+            return common_word_ratio <= 0.5
+        return False
+
+    def _giveaway(self, f: MessageFeatures) -> bool:
+        if f.has_any(self.giveaway_keywords) and f.has_any(self.action_keywords):
+            return not f.has_any(self.questions)
+        return False
+
+    def _free_stuff(self, f: MessageFeatures) -> bool:
+        return f.has_any(self.free_keywords) and not f.has_any(self.free_context)
+
+    def _emojis(self, f: MessageFeatures) -> bool:
+        length = len(f.text)
+        if length > self.detector.word_count_threshold:
+            return False
+        emoji_count = sum(len(e) for e in self.detector.emoji_regex.findall(f.text))
+        if not emoji_count:
+            return False
+        if emoji_count > 5 and length < 50:
+            return True
+        return emoji_count / length > 0.3 and length < 100
+
+    def _spam(self, f: MessageFeatures) -> bool:
+        if f.has_any(self.spam_keywords):
+            return True
+        return f.has_any(self.call_to_action) and f.has_any(self.links)
+
+    def _contest(self, f: MessageFeatures) -> bool:
+        return f.has_any(self.contest_keywords) and '?' not in f.hits
+
+    def _test(self, f: MessageFeatures) -> bool:
+        return 'пожарная часть' in f.hits
+
+    def _url(self, f: MessageFeatures) -> bool:
+        urls = self.detector.url_regex.findall(f.text)
+        if not urls:
+            return False
+        return len(urls) > 1 or f.word_count < 5
+
+    def _telegram(self, f: MessageFeatures) -> bool:
+        if f.has_any(self.join_calls):
+            return self.detector.mention_regex.search(f.text) is not None
+        return False
+
+    def _scam(self, f: MessageFeatures) -> bool:
+        return f.has_any(self.scam_phrases)
@@ -0,0 +1,255 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+
+logger = logging.getLogger(__name__)
+
+
+class Priority:
+    """Порядок обслуживания исходящих запросов (меньше - раньше)"""
+    URGENT = 0   # бан, удаление спама
+    NORMAL = 1   # пересылка, карточки модераторам, правка карточек
+    LOW = 2      # реакции и прочие информационные действия
+
+
+class TokenBucket:
+    """rate токенов в секунду, не больше capacity впрок"""
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def delay(self, now: float) -> float:
+        """Через сколько секунд будет доступен токен (0 - уже доступен)"""
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def consume(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+
+class _Job:
+    __slots__ = ('priority', 'seq', 'chat_id', 'call', 'future', 'attempts', 'not_before', 'deadline', 'send')
+
+    def __init__(self, priority: int, seq: int, chat_id, call, future, deadline: Optional[float], send: bool):
+        self.priority = priority
+        self.seq = seq
+        self.chat_id = chat_id
+        self.call = call
+        self.future = future
+        self.send = send
+        self.attempts = 0
+        self.not_before = 0.0
+        self.deadline = deadline
+
+    def __lt__(self, other: "_Job") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class TelegramScheduler:
+    """
+    Единая очередь исходящих запросов к Telegram Bot API.
+
+    Запрос уходит, когда есть токен в глобальном ведре, а отправка
+    сообщения (send=True) - ещё и в ведре её чата: лимит Telegram на чат
+    касается только новых сообщений, баны и удаления в рейд им не
+    тормозятся. Из готовых первым идёт запрос с более высоким приоритетом,
+    внутри приоритета - в порядке поступления. 429 RetryAfter блокирует чат
+    на указанное время, сетевые ошибки и 5xx повторяются с экспоненциальной
+    паузой - кроме отправок: сообщение могло уже дойти, и повтор дал бы
+    дубль. Остальные ошибки API возвращаются вызывающему сразу.
+    """
+
+    def __init__(self, global_rate: float = 25.0, global_burst: float = 25.0,
+                 chat_rate: float = 1.0, chat_burst: float = 3.0,
+                 max_retries: int = 5, max_inflight: int = 16):
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.max_inflight = max_inflight
+
+        self._chat_buckets: Dict[object, TokenBucket] = {}
+        self._blocked_until: Dict[object, float] = {}  # chat_id -> конец RetryAfter
+        self._queue: List[_Job] = []
+        self._seq = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._inflight: Set[asyncio.Task] = set()
+
+        self.sent = 0
+        self.retries = 0
+        self.flood_waits = 0
+        self.expired = 0
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._queue)
+
+    def _ensure_worker(self):
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+
+    async def call(self, chat_id, make_call: Callable[[], Awaitable], priority: int = Priority.NORMAL,
+                   ttl: Optional[float] = None, send: bool = False):
+        """
+        Выполняет запрос make_call() (фабрика корутины - её можно вызвать
+        повторно) с учётом лимитов чата chat_id.
+        ttl - сколько секунд запрос может ждать в очереди; устаревший
+        запрос отбрасывается, и call возвращает None.
+        send - новое сообщение в чат (send_message, forward): идёт по
+        лимиту чата и не повторяется после сетевых ошибок и 5xx.
+        """
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        deadline = time.monotonic() + ttl if ttl is not None else None
+        heapq.heappush(self._queue, _Job(priority, next(self._seq), chat_id, make_call, future, deadline, send))
+        self._wakeup.set()
+        return await future
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    def _ready_delay(self, job: _Job, now: float) -> float:
+        """0, если запрос можно отправлять сейчас, иначе сколько ждать"""
+        return max(
+            job.not_before - now,
+            self._blocked_until.get(job.chat_id, 0.0) - now,
+            self._chat_bucket(job.chat_id).delay(now) if job.send else 0.0,
+            0.0,
+        )
+
+    def _next_ready(self, now: float):
+        """(готовый запрос или None, через сколько проверить снова)"""
+        skipped: List[_Job] = []
+        ready = None
+        wait = None
+        while self._queue:
+            job = heapq.heappop(self._queue)
+            if job.deadline is not None and now > job.deadline:
+                self.expired += 1
+                if not job.future.done():
+                    job.future.set_result(None)
+                continue
+            delay = self._ready_delay(job, now)
+            if delay == 0:
+                ready = job
+                break
+            skipped.append(job)
+            wait = delay if wait is None else min(wait, delay)
+        for job in skipped:
+            heapq.heappush(self._queue, job)
+        return ready, wait
+
+    async def _run(self):
+        while True:
+            if len(self._inflight) >= self.max_inflight or not self._queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            now = time.monotonic()
+            global_delay = self.global_bucket.delay(now)
+            if global_delay > 0:
+                await asyncio.sleep(global_delay)
+                continue
+
+            job, wait = self._next_ready(now)
+            if job is None:
+                if wait is None:
+                    continue
+                # Ждём ближайший освободившийся чат или новый запрос
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            self.global_bucket.consume(now)
+            if job.send:
+                self._chat_bucket(job.chat_id).consume(now)
+            task = asyncio.create_task(self._execute(job))
+            self._inflight.add(task)
+            task.add_done_callback(self._on_done)
+
+    def _on_done(self, task: asyncio.Task):
+        self._inflight.discard(task)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _retry_or_fail(self, job: _Job, error: BaseException):
+        if job.future.done():
+            return
+        job.attempts += 1
+        if job.attempts > self.max_retries:
+            job.future.set_exception(error)
+            return
+        self.retries += 1
+        heapq.heappush(self._queue, job)
+        logger.warning(f"Повтор запроса к Telegram ({job.attempts}/{self.max_retries}): {error}")
+
+    async def _execute(self, job: _Job):
+        if job.future.done():  # вызывающий отменил ожидание
+            return
+        try:
+            result = await job.call()
+        except TelegramRetryAfter as e:
+            self.flood_waits += 1
+            self._blocked_until[job.chat_id] = time.monotonic() + e.retry_after
+            self._retry_or_fail(job, e)
+        except (TelegramNetworkError, TelegramServerError) as e:
+            if job.send:
+                # Неизвестно, дошло ли сообщение - повтор мог бы его задублировать
+                if not job.future.done():
+                    job.future.set_exception(e)
+                return
+            job.not_before = time.monotonic() + min(0.5 * 2 ** job.attempts, 30.0)
+            self._retry_or_fail(job, e)
+        except Exception as e:
+            if not job.future.done():
+                job.future.set_exception(e)
+        else:
+            self.sent += 1
+            if not job.future.done():
+                job.future.set_result(result)
+
+    async def close(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        for job in self._queue:
+            if not job.future.done():
+                job.future.cancel()
+        self._queue.clear()
+
+    def summary(self) -> str:
+        return (
+            f"отправлено {self.sent}, в очереди {self.queue_depth}, в работе {len(self._inflight)}, "
+            f"повторов {self.retries} (RetryAfter: {self.flood_waits}), просрочено {self.expired}"
+        )
@@ -0,0 +1,80 @@
+import re
+from functools import lru_cache
+from typing import List, Optional
+
+# Одна подстановка вместо четырёх re.sub. Порядок альтернатив и lookahead в
+# упоминании повторяют прежнюю последовательность (URL -> @user -> числа):
+# упоминание не съедает начало ссылки, а цифры внутри ссылок и ников
+# поглощаются вместе с ними
+_TOKENS = re.compile(
+    r'(?P<url>https?://\S+|t\.me/\S+|telegram\.me/\S+)'
+    r'|(?P<user>@(?:(?!https?://\S|t\.me/\S|telegram\.me/\S)\w)+)'
+    r'|(?P<num>\d+)'
+)
+_REPLACEMENTS = {'url': ' [URL] ', 'user': ' [USER] ', 'num': ' [NUM] '}
+
+
+def _replace(match: "re.Match") -> str:
+    return _REPLACEMENTS[match.lastgroup]
+
+
+def _normalize_lower(lower: str) -> str:
+    return ' '.join(_TOKENS.sub(_replace, lower).split())
+
+
+class TextPreprocessor:
+    """
+    Нормализация текста для ML: нижний регистр, токены [URL]/[USER]/[NUM],
+    схлопнутые пробелы. Общая для обучения, инференса и BotDetector.
+    Короткие тексты ("Спасибо", "+") повторяются постоянно - их результат
+    кэшируется.
+    """
+
+    def __init__(self, memo_max_length: int = 64, memo_size: int = 4096):
+        self.memo_max_length = memo_max_length
+        self._memo = lru_cache(maxsize=memo_size)(_normalize_lower)
+
+    def normalize_lower(self, lower: str) -> str:
+        """Нормализует текст, уже приведённый к нижнему регистру"""
+        if len(lower) <= self.memo_max_length:
+            return self._memo(lower)
+        return _normalize_lower(lower)
+
+    def normalize(self, text: str) -> str:
+        if not text:
+            return ""
+        return self.normalize_lower(text.lower())
+
+    def normalize_batch(self, texts: List[str]) -> List[str]:
+        normalize = self.normalize
+        return [normalize(text) for text in texts]
+
+    def prepare(self, text: str) -> "PreparedText":
+        return PreparedText(text, self)
+
+    def memo_info(self):
+        return self._memo.cache_info()
+
+
+class PreparedText:
+    """
+    Текст сообщения, подготовленный один раз на весь конвейер: правила берут
+    lower, ML - normalized (считается при первом обращении)
+    """
+    __slots__ = ('text', 'lower', '_normalized', '_preprocessor')
+
+    def __init__(self, text: str, preprocessor: TextPreprocessor):
+        self.text = text
+        self.lower = text.lower()
+        self._normalized: Optional[str] = None
+        self._preprocessor = preprocessor
+
+    @property
+    def normalized(self) -> str:
+        if self._normalized is None:
+            self._normalized = self._preprocessor.normalize_lower(self.lower)
+        return self._normalized
+
+
+# Общий экземпляр: кэш коротких текстов разделяют детектор и классификатор
+preprocessor = TextPreprocessor()
@@ -0,0 +1,96 @@
+import json
+import logging
+import os
+import tempfile
+from typing import Awaitable, Callable, List, Optional
+
+from database.supabase_db import Database
+
+logger = logging.getLogger(__name__)
+
+
+class TrainingState:
+    """
+    Примеры последней порции, вошедшей в опубликованную версию модели.
+
+    Пишется сразу после публикации версии и до пометки примеров в БД: если
+    пометка не прошла, следующий запуск помечает именно эти id без
+    повторного обучения (при условии, что активна та же версия).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.version: Optional[str] = None
+        self.ids: List[int] = []
+        if os.path.exists(path):
+            try:
+                with open(path, encoding='utf-8') as f:
+                    state = json.load(f)
+                self.version = state.get('version')
+                self.ids = [int(i) for i in state.get('ids') or []]
+            except (OSError, ValueError) as e:
+                logger.warning(f"Не удалось прочитать состояние обучения: {e}")
+
+    def save(self, version: str, ids: List[int]):
+        self.version = version
+        self.ids = ids
+        directory = os.path.dirname(self.path) or "."
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({'version': version, 'ids': ids}, f)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+
+async def learn_unprocessed(
+    detector,
+    chunk_size: int = 1000,
+    on_progress: Optional[Callable[[dict], Awaitable[None]]] = None,
+    train: Optional[Callable[[List[str], List[int]], Awaitable[dict]]] = None,
+) -> dict:
+    """
+    Дообучает модель на необработанных примерах порциями по chunk_size.
+
+    Порции читаются keyset-пагинацией по id; каждая проходит partial_fit,
+    публикуется новой версией модели и только после этого помечается
+    обработанной. В памяти не больше одной порции; сбой на середине
+    оставляет уже применённые порции применёнными, а остальные - в очереди.
+
+    train - как обучать порцию (по умолчанию detector.train_ml в потоке);
+    к концу вызова детектор должен работать на опубликованной версии.
+    """
+    if train is None:
+        async def train(texts: List[str], labels: List[int]) -> dict:
+            return await detector.train_ml(texts, labels, incremental=True)
+
+    state = TrainingState(os.path.join(os.path.dirname(detector.ml_model_path) or ".", "training_state.json"))
+    summary = {'chunks': 0, 'examples': 0, 'recovered': 0, 'version': None}
+
+    classifier = detector.ml_classifier
+    if state.ids and classifier is not None and state.version == classifier.version:
+        # Прошлый запуск опубликовал версию, но не успел пометить примеры
+        summary['recovered'] = await Database.mark_trained_examples_processed(state.ids)
+
+    async for page in Database.iter_unprocessed_training_examples(chunk_size):
+        texts = [ex['text'] for ex in page]
+        labels = [ex['label'] for ex in page]
+        result = await train(texts, labels)
+        if 'error' in result:
+            summary['error'] = result['error']
+            break
+
+        ids = [ex['id'] for ex in page]
+        state.save(result.get('version'), ids)
+        await Database.mark_trained_examples_processed(ids)
+
+        summary['chunks'] += 1
+        summary['examples'] += len(page)
+        summary['version'] = result.get('version')
+        if on_progress is not None:
+            await on_progress(summary)
+
+    return summary
@@ -1,56 +1,234 @@
+import asyncio
 import csv
+import hashlib
+import json
 import logging
+import os
+import tempfile
+import time
 from io import StringIO
-from typing import List, Tuple
+from typing import Awaitable, Callable, Iterable, Iterator, List, Optional, Set, Tuple
 from database.supabase_db import Database
 
 logger = logging.getLogger(__name__)
 
+# Повторы одной пачки при сетевой ошибке до того, как загрузка остановится
+INSERT_RETRIES = 3
+
+
+class LoadProgress:
+    """Состояние загрузки CSV (передаётся в колбэк прогресса и возвращается в конце)"""
+    __slots__ = ('rows', 'inserted', 'good', 'bad', 'invalid', 'duplicates',
+                 'resumed', 'batches', 'started', 'finished')
+
+    def __init__(self):
+        self.rows = 0          # прочитано строк данных
+        self.inserted = 0      # вставлено в этом запуске
+        self.good = 0
+        self.bad = 0
+        self.invalid = 0
+        self.duplicates = 0
+        self.resumed = 0       # пропущено строк, уже вставленных прошлым запуском
+        self.batches = 0
+        self.started = time.monotonic()
+        self.finished = False
+
+    @property
+    def rate(self) -> float:
+        elapsed = time.monotonic() - self.started
+        return self.inserted / elapsed if elapsed > 0 else 0.0
+
+
+class IngestCheckpoint:
+    """
+    Какие пачки файла уже записаны в БД. Пачки пишутся параллельно и
+    завершаются не по порядку, поэтому хранится непрерывный префикс
+    (watermark) и отдельные номера за ним.
+    """
+
+    def __init__(self, path: Optional[str], batch_size: int):
+        self.path = path
+        self.batch_size = batch_size
+        self.watermark = 0
+        self.done: Set[int] = set()
+        if path and os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                state = json.load(f)
+            if state.get('batch_size') == batch_size:
+                self.watermark = state['watermark']
+                self.done = set(state['done'])
+            else:
+                logger.warning("Чекпоинт записан с другим размером пачки, загрузка начнётся заново")
+
+    def is_done(self, batch: int) -> bool:
+        return batch < self.watermark or batch in self.done
+
+    def commit(self, batch: int):
+        self.done.add(batch)
+        while self.watermark in self.done:
+            self.done.discard(self.watermark)
+            self.watermark += 1
+        self._save()
+
+    def _save(self):
+        if not self.path:
+            return
+        state = {'batch_size': self.batch_size, 'watermark': self.watermark, 'done': sorted(self.done)}
+        directory = os.path.dirname(self.path) or "."
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(state, f)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def clear(self):
+        if self.path and os.path.exists(self.path):
+            os.unlink(self.path)
+
+
 class TrainingDataLoader:
     @staticmethod
-    async def load_from_csv(csv_content: str, moderated_by: int = 0) -> Tuple[int, int]:
+    def iter_examples(lines: Iterable[str], progress: LoadProgress) -> Iterator[dict]:
         """
-        Загружает обучающие данные из CSV строки
-        Формат: text,label (0 - хороший, 1 - плохой)
+        Построчно разбирает CSV (text,label), отбрасывая некорректные строки
+        и повторы текста. Для дедупликации хранится 8-байтовый хэш текста,
+        а не сам текст.
         """
-        try:
-            csv_file = StringIO(csv_content)
-            reader = csv.reader(csv_file)
-            
-            # Пропускаем заголовок
-            next(reader, None)
+        reader = csv.reader(lines)
+        
+        # Пропускаем заголовок
+        next(reader, None)
+        
+        seen: Set[bytes] = set()
+        for row in reader:
+            progress.rows += 1
+            if len(row) < 2:
+                progress.invalid += 1
+                continue
             
-            good_count = 0
-            bad_count = 0
+            text = row[0].strip()
+            try:
+                label = int(row[1].strip())
+            except ValueError:
+                progress.invalid += 1
+                continue
             
-            for row in reader:
-                if len(row) < 2:
-                    continue
-                    
-                text = row[0].strip()
-                try:
-                    label = int(row[1].strip())
-                except ValueError:
-                    continue
-                
-                if not text or label not in [0, 1]:
-                    continue
-                
-                # Добавляем пример в БД
-                await Database.add_training_example(
-                    text=text,
-                    label=label,
-                    moderated_by=moderated_by
-                )
-                
-                if label == 0:
-                    good_count += 1
-                else:
-                    bad_count += 1
-            
-            logger.info(f"Загружено примеров: хороших={good_count}, плохих={bad_count}")
-            return good_count, bad_count
+            if not text or label not in [0, 1]:
+                progress.invalid += 1
+                continue
             
+            key = hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest()
+            if key in seen:
+                progress.duplicates += 1
+                continue
+            seen.add(key)
+            yield {"text": text, "label": label}
+
+    @staticmethod
+    def iter_batches(examples: Iterator[dict], batch_size: int) -> Iterator[List[dict]]:
+        batch: List[dict] = []
+        for example in examples:
+            batch.append(example)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    @staticmethod
+    async def _insert_batch(rows: List[dict], moderated_by: int):
+        for attempt in range(1, INSERT_RETRIES + 1):
+            try:
+                return await Database.add_training_examples_bulk(rows, moderated_by)
+            except Exception as e:
+                if attempt == INSERT_RETRIES:
+                    raise
+                logger.warning(f"Ошибка вставки пачки ({attempt}/{INSERT_RETRIES}): {e}")
+                await asyncio.sleep(2 ** attempt)
+
+    @staticmethod
+    async def load_stream(
+        lines: Iterable[str],
+        moderated_by: int = 0,
+        batch_size: int = 500,
+        concurrency: int = 4,
+        checkpoint_path: Optional[str] = None,
+        on_progress: Optional[Callable[[LoadProgress], Awaitable[None]]] = None,
+    ) -> LoadProgress:
+        """
+        Потоковая загрузка: разбор CSV, пачки по batch_size строк, не больше
+        concurrency одновременных INSERT. Записанные пачки отмечаются в
+        чекпоинте - повторный запуск на том же файле продолжит с места сбоя.
+        """
+        progress = LoadProgress()
+        checkpoint = IngestCheckpoint(checkpoint_path, batch_size)
+        semaphore = asyncio.Semaphore(concurrency)
+        pending: Set[asyncio.Task] = set()
+        failure: List[BaseException] = []
+
+        async def insert(number: int, rows: List[dict]):
+            try:
+                await TrainingDataLoader._insert_batch(rows, moderated_by)
+            except Exception as e:
+                failure.append(e)
+                return
+            finally:
+                semaphore.release()
+            checkpoint.commit(number)
+            progress.inserted += len(rows)
+            progress.batches += 1
+            bad = sum(row["label"] for row in rows)
+            progress.bad += bad
+            progress.good += len(rows) - bad
+            if on_progress is not None:
+                await on_progress(progress)
+
+        examples = TrainingDataLoader.iter_examples(lines, progress)
+        for number, rows in enumerate(TrainingDataLoader.iter_batches(examples, batch_size)):
+            if checkpoint.is_done(number):
+                progress.resumed += len(rows)
+                continue
+            await semaphore.acquire()
+            if failure:
+                semaphore.release()
+                break
+            task = asyncio.create_task(insert(number, rows))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+
+        if pending:
+            await asyncio.gather(*pending)
+        if failure:
+            logger.error(f"Загрузка остановлена: вставлено {progress.inserted}, чекпоинт сохранён")
+            raise failure[0]
+
+        checkpoint.clear()
+        progress.finished = True
+        logger.info(
+            f"Загружено примеров: хороших={progress.good}, плохих={progress.bad}, "
+            f"повторов={progress.duplicates}, некорректных={progress.invalid}, пропущено={progress.resumed}"
+        )
+        return progress
+
+    @staticmethod
+    async def load_from_file(path: str, moderated_by: int = 0, **kwargs) -> LoadProgress:
+        """Загружает CSV с диска, не читая его в память целиком"""
+        with open(path, 'r', encoding='utf-8', newline='') as f:
+            return await TrainingDataLoader.load_stream(f, moderated_by, **kwargs)
+
+    @staticmethod
+    async def load_from_csv(csv_content: str, moderated_by: int = 0, **kwargs) -> Tuple[int, int]:
+        """
+        Загружает обучающие данные из CSV строки
+        Формат: text,label (0 - хороший, 1 - плохой)
+        """
+        try:
+            progress = await TrainingDataLoader.load_stream(StringIO(csv_content), moderated_by, **kwargs)
+            return progress.good, progress.bad
         except Exception as e:
             logger.error(f"Ошибка загрузки CSV: {e}")
             raise
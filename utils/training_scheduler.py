@@ -0,0 +1,214 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Awaitable, Callable, List, Optional
+
+from .metrics import LatencyStat
+from .training_job import learn_unprocessed
+
+logger = logging.getLogger(__name__)
+
+
+# --- Код, выполняемый в процессе обучения ---
+
+def _init_trainer():
+    try:
+        # Обучение не должно отнимать CPU у бота и воркеров инференса
+        os.nice(10)
+    except (AttributeError, OSError):
+        pass
+
+
+def _train_in_worker(model_path: str, classifier_kwargs: dict, texts: List[str], labels: List[int]) -> dict:
+    """Дообучает модель с диска и публикует новую версию (в ModelStore)"""
+    from .ml_classifier import MLClassifier
+    try:
+        # Имеющуюся модель как версию регистрирует основной процесс, обучение только публикует новую
+        classifier = MLClassifier(model_path=model_path, adopt_existing=False, **classifier_kwargs)
+        # Для partial_fit нужен полный sklearn-пайплайн, а не компактный скорер
+        classifier.load(prefer_compact=False)
+        if classifier.is_trained:
+            return classifier.incremental_train(texts, labels)
+        return classifier.train(texts, labels)
+    except Exception as e:
+        logger.error(f"Ошибка обучения в фоновом процессе: {e}")
+        return {'error': str(e)}
+
+
+# --- Сторона основного процесса ---
+
+class TrainingScheduler:
+    """
+    Фоновое дообучение модели.
+
+    Запуск - когда с последнего обучения накопилось threshold новых
+    размеченных примеров (notify из модерации) или по таймеру interval.
+    Обучение идёт в отдельном процессе с пониженным приоритетом, готовая
+    версия подхватывается детектором через reload_ml. Повторные триггеры
+    во время обучения склеиваются в один следующий запуск.
+    """
+
+    def __init__(self, detector, threshold: int = 50, interval: float = 3600.0, chunk_size: int = 1000,
+                 on_model_updated: Optional[Callable[[], Awaitable[None]]] = None):
+        self.detector = detector
+        self.on_model_updated = on_model_updated  # после подмены модели (другие детекторы на ней же)
+        self.threshold = threshold
+        self.interval = interval
+        self.chunk_size = chunk_size
+
+        self.pending_examples = 0   # размечено с последнего запуска
+        self.runs = 0
+        self.last_summary: Optional[dict] = None
+        self.last_run_at: Optional[float] = None
+        self.run_latency = LatencyStat()
+
+        self._wakeup: Optional[asyncio.Event] = None
+        self._next_run: Optional[asyncio.Future] = None  # результат ближайшего запуска
+        self._next_listeners: List[Callable[[dict], Awaitable[None]]] = []
+        self._running = False
+        self._task: Optional[asyncio.Task] = None
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def notify(self, count: int = 1):
+        """Модератор разметил count примеров"""
+        self.pending_examples += count
+        if self.threshold and self.pending_examples >= self.threshold:
+            self.trigger()
+
+    def trigger(self, on_progress: Optional[Callable[[dict], Awaitable[None]]] = None) -> asyncio.Future:
+        """
+        Просит выполнить обучение. Возвращает future с итогом запуска, который
+        учтёт этот запрос: если обучение уже идёт - следующего.
+        on_progress вызывается после каждой применённой порции этого запуска.
+        """
+        if self._next_run is None or self._next_run.done():
+            self._next_run = asyncio.get_running_loop().create_future()
+        if on_progress is not None:
+            self._next_listeners.append(on_progress)
+        future = self._next_run
+        if self._wakeup is not None:
+            self._wakeup.set()
+        else:
+            logger.warning("Планировщик обучения не запущен, запрос будет выполнен после start()")
+        return future
+
+    async def _loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            future = self._next_run
+            listeners, self._next_listeners = self._next_listeners, []
+            self._next_run = None
+            try:
+                summary = await self._run_once(self._progress_callback(listeners))
+            except asyncio.CancelledError:
+                if future is not None and not future.done():
+                    future.cancel()
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка фонового обучения: {e}")
+                summary = {'error': str(e), 'chunks': 0, 'examples': 0}
+            if future is not None and not future.done():
+                future.set_result(summary)
+
+    @staticmethod
+    def _progress_callback(listeners) -> Optional[Callable[[dict], Awaitable[None]]]:
+        if not listeners:
+            return None
+
+        async def notify_all(summary: dict):
+            for listener in listeners:
+                try:
+                    await listener(summary)
+                except Exception as e:
+                    logger.debug(f"Ошибка колбэка прогресса обучения: {e}")
+        return notify_all
+
+    def _ensure_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=1,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_trainer,
+            )
+        return self._executor
+
+    async def _train_chunk(self, texts: List[str], labels: List[int]) -> dict:
+        detector = self.detector
+        if not detector.use_ml:
+            return {'error': 'ML отключен'}
+        classifier_kwargs = {
+            'features': detector.ml_features,
+            'n_features': detector.ml_hash_features,
+            'evaluation': detector.ml_evaluation,
+            'eval_folds': detector.ml_eval_folds,
+        }
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(
+            self._ensure_executor(), _train_in_worker,
+            detector.ml_model_path, classifier_kwargs, texts, labels,
+        )
+        if 'error' not in result:
+            # Горячая подмена: детектор перечитывает опубликованную версию
+            await detector.reload_ml()
+            if self.on_model_updated is not None:
+                await self.on_model_updated()
+        return result
+
+    async def _run_once(self, on_progress: Optional[Callable[[dict], Awaitable[None]]] = None) -> dict:
+        self._running = True
+        started = time.perf_counter()
+        self.pending_examples = 0
+        try:
+            summary = await learn_unprocessed(
+                self.detector, chunk_size=self.chunk_size, on_progress=on_progress, train=self._train_chunk
+            )
+        finally:
+            self._running = False
+            self.run_latency.since(started)
+        self.runs += 1
+        self.last_run_at = time.time()
+        self.last_summary = summary
+        if summary['examples']:
+            logger.info(f"Фоновое обучение: {summary['examples']} примеров, версия {summary['version']}")
+        return summary
+
+    def status(self) -> str:
+        if self.running:
+            state = "обучается"
+        elif self.last_run_at is None:
+            state = "ещё не запускался"
+        else:
+            state = f"последний запуск {time.strftime('%H:%M:%S', time.localtime(self.last_run_at))}"
+        return (
+            f"{state}, новых примеров: {self.pending_examples}/{self.threshold}, "
+            f"запусков: {self.runs}, время: {self.run_latency.summary()}"
+        )
@@ -0,0 +1,243 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple, Union
+
+from aiogram import Bot, Dispatcher
+from aiogram.methods import TelegramMethod
+from aiogram.types import Update
+
+from .metrics import LatencyStat
+
+logger = logging.getLogger(__name__)
+
+# Поля апдейта, из которых берётся чат для разбиения очереди
+_CHAT_EVENTS = (
+    "message", "edited_message", "channel_post", "edited_channel_post", "callback_query",
+    "my_chat_member", "chat_member", "chat_join_request", "message_reaction",
+)
+
+
+def partition_key(update: Union[Dict[str, Any], Update]) -> int:
+    """Чат апдейта (сырого или Update); 0 - апдейты без чата"""
+    raw = isinstance(update, dict)
+    for name in _CHAT_EVENTS:
+        event = update.get(name) if raw else getattr(update, name, None)
+        if event is None:
+            continue
+        if name == "callback_query":
+            # Нажатия кнопок - по чату сообщения с кнопками (ban-list чату)
+            event = event.get("message") if raw else event.message
+            if event is None:
+                return 0
+        chat = event.get("chat") if raw else event.chat
+        return (chat.get("id") if raw else chat.id) or 0
+    return 0
+
+
+class UpdateQueue:
+    """
+    Ограниченная очередь входящих апдейтов, разбитая по чатам, и
+    фиксированный пул обработчиков.
+
+    У каждого чата своя очередь; обработчики обходят чаты по кругу и берут
+    из чата не больше per_chat апдейтов одновременно, поэтому рейд в одном
+    чате не задерживает остальные (и нажатия модераторов в ban-list чате).
+
+    Приём (put) только кладёт апдейт в очередь, поэтому вебхук отвечает
+    Telegram сразу. Если очередь чата (или общая) полна дольше put_timeout,
+    put возвращает False - вебхук отвечает 503, и Telegram повторит
+    доставку позже: апдейт не теряется, а нагрузка не растёт без ограничений.
+    """
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, workers: int = 16, maxsize: int = 1000,
+                 put_timeout: float = 2.0, per_chat: Optional[int] = None, chat_maxsize: Optional[int] = None):
+        self.dispatcher = dispatcher
+        self.bot = bot
+        self.workers = workers
+        self.maxsize = maxsize
+        self.put_timeout = put_timeout
+        # По умолчанию один чат занимает не больше четверти обработчиков и половины очереди
+        self.per_chat = per_chat or max(1, workers // 4)
+        self.chat_maxsize = chat_maxsize or max(1, maxsize // 2)
+
+        self._partitions: Dict[int, Deque[Tuple[float, Any]]] = {}
+        self._ready: Deque[int] = deque()  # чаты с непустой очередью, в порядке обхода
+        self._active: Dict[int, int] = {}  # чат -> апдейтов в обработке
+        self._size = 0
+        self._unfinished = 0  # в очереди + в обработке
+        self._changed: Optional[asyncio.Condition] = None
+        self._tasks: List[asyncio.Task] = []
+        self._accepting = False
+
+        self.received = 0
+        self.processed = 0
+        self.rejected = 0
+        self.errors = 0
+        # От приёма апдейта до конца его обработки
+        self.latency = LatencyStat()
+
+    @property
+    def depth(self) -> int:
+        return self._size
+
+    @property
+    def chats(self) -> int:
+        return len(self._partitions)
+
+    def start(self):
+        if self._tasks:
+            return
+        self._changed = asyncio.Condition()
+        self._accepting = True
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        logger.info(
+            f"Очередь апдейтов: {self.workers} обработчиков (до {self.per_chat} на чат), "
+            f"до {self.maxsize} в очереди (до {self.chat_maxsize} на чат)"
+        )
+
+    def _has_room(self, key: int, limit_chat: bool) -> bool:
+        if self._size >= self.maxsize:
+            return False
+        if limit_chat:
+            partition = self._partitions.get(key)
+            return partition is None or len(partition) < self.chat_maxsize
+        return True
+
+    async def put(self, update: Union[Dict[str, Any], Update], limit_chat: bool = True,
+                  timeout: Optional[float] = -1) -> bool:
+        """
+        Ставит апдейт (сырой dict вебхука или Update) в очередь его чата.
+        False - очередь переполнена дольше timeout (по умолчанию put_timeout;
+        None - ждать без ограничения) или закрыта. limit_chat=False снимает
+        лимит на чат - для polling, где апдейт некуда вернуть
+        """
+        if not self._accepting:
+            self.rejected += 1
+            return False
+        if timeout == -1:
+            timeout = self.put_timeout
+        key = partition_key(update)
+        async with self._changed:
+            if not self._has_room(key, limit_chat):
+                try:
+                    await asyncio.wait_for(
+                        self._changed.wait_for(lambda: self._has_room(key, limit_chat)), timeout=timeout
+                    )
+                except asyncio.TimeoutError:
+                    self.rejected += 1
+                    return False
+            partition = self._partitions.get(key)
+            if partition is None:
+                partition = self._partitions[key] = deque()
+                self._ready.append(key)
+            partition.append((time.perf_counter(), update))
+            self._size += 1
+            self._unfinished += 1
+            self.received += 1
+            self._changed.notify_all()
+        return True
+
+    def _take(self) -> Optional[Tuple[int, float, Any]]:
+        """Следующий апдейт по кругу чатов, пропуская чаты, занявшие per_chat обработчиков"""
+        for _ in range(len(self._ready)):
+            key = self._ready.popleft()
+            if self._active.get(key, 0) >= self.per_chat:
+                self._ready.append(key)
+                continue
+            partition = self._partitions[key]
+            started, update = partition.popleft()
+            if partition:
+                self._ready.append(key)
+            else:
+                del self._partitions[key]
+            self._active[key] = self._active.get(key, 0) + 1
+            self._size -= 1
+            return key, started, update
+        return None
+
+    async def _worker(self):
+        changed = self._changed
+        while True:
+            async with changed:
+                item = self._take()
+                while item is None:
+                    await changed.wait()
+                    item = self._take()
+                changed.notify_all()  # освободилось место в очереди
+            key, started, update = item
+            try:
+                if isinstance(update, Update):
+                    result = await self.dispatcher.feed_update(self.bot, update)
+                else:
+                    result = await self.dispatcher.feed_raw_update(bot=self.bot, update=update)
+                if isinstance(result, TelegramMethod):
+                    await self.dispatcher.silent_call_request(bot=self.bot, result=result)
+                self.processed += 1
+            except Exception as e:
+                self.errors += 1
+                update_id = update.update_id if isinstance(update, Update) else update.get('update_id')
+                logger.error(f"❌ Ошибка обработки апдейта {update_id}: {e}", exc_info=True)
+            finally:
+                self.latency.since(started)
+                async with changed:
+                    active = self._active[key] - 1
+                    if active:
+                        self._active[key] = active
+                    else:
+                        del self._active[key]
+                    self._unfinished -= 1
+                    changed.notify_all()  # чат снова может взять апдейт
+
+    async def poll(self, polling_timeout: int = 10, allowed_updates: Optional[List[str]] = None,
+                   backoff: float = 1.0, max_backoff: float = 30.0):
+        """
+        Long polling, который не обрабатывает апдейты сам, а ставит их в
+        очередь - по чатам, как вебхук. Апдейт некуда вернуть, поэтому лимит
+        на чат снят, а при полной общей очереди getUpdates ждёт места.
+        Работает до отмены задачи
+        """
+        offset = None
+        delay = backoff
+        while True:
+            try:
+                batch = await self.bot.get_updates(
+                    offset=offset, timeout=polling_timeout, allowed_updates=allowed_updates,
+                    request_timeout=polling_timeout + 10,
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Ошибка getUpdates, повтор через {delay:.0f} с: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, max_backoff)
+                continue
+            delay = backoff
+            for update in batch:
+                if not await self.put(update, limit_chat=False, timeout=None):
+                    return  # очередь закрыта - апдейт получит следующий запуск
+                offset = update.update_id + 1
+
+    async def close(self, drain_timeout: Optional[float] = 20.0):
+        """Перестаёт принимать апдейты и дорабатывает принятые (не дольше drain_timeout)"""
+        self._accepting = False
+        if self._tasks and self._unfinished:
+            logger.info(f"Дорабатываем очередь апдейтов: {self._unfinished}")
+            try:
+                async with self._changed:
+                    await asyncio.wait_for(
+                        self._changed.wait_for(lambda: self._unfinished == 0), timeout=drain_timeout
+                    )
+            except asyncio.TimeoutError:
+                logger.warning(f"Не обработано при остановке: {self._unfinished} апдейтов")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def summary(self) -> str:
+        return (
+            f"в очереди {self.depth} ({self.chats} чатов), принято {self.received}, обработано {self.processed}, "
+            f"отклонено {self.rejected}, ошибок {self.errors}"
+        )
@@ -0,0 +1,230 @@
+import asyncio
+import logging
+import math
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class UserRecord:
+    """История одного автора; joined_at, rate, repeats и last_text_hash живут только в памяти"""
+    __slots__ = ('user_id', 'first_seen', 'last_seen', 'messages', 'clean', 'flags', 'last_flag',
+                 'joined_at', 'rate', 'repeats', 'last_text_hash', 'dirty')
+
+    def __init__(self, user_id: int, first_seen: float):
+        self.user_id = user_id
+        self.first_seen = first_seen  # первое появление (вход или сообщение), time.time()
+        self.last_seen = first_seen
+        self.messages = 0
+        self.clean = 0       # сообщений, признанных чистыми
+        self.flags = 0       # подозрительных сообщений
+        self.last_flag = 0.0
+        self.joined_at = 0.0  # вход в чат, увиденный ботом (0 - не видели)
+        self.rate = 0.0      # сообщений за последние ~RATE_WINDOW секунд (экспоненциальное затухание)
+        self.repeats = 0     # повторов подряд одного и того же текста (другой текст - сброс)
+        self.last_text_hash: Optional[int] = None
+        self.dirty = True    # есть изменения, не сохранённые в хранилище
+
+    def to_row(self) -> Dict[str, Any]:
+        return {
+            "user_id": self.user_id,
+            "first_seen": self.first_seen,
+            "last_seen": self.last_seen,
+            "messages": self.messages,
+            "clean": self.clean,
+            "flags": self.flags,
+            "last_flag": self.last_flag,
+        }
+
+    @classmethod
+    def from_row(cls, row: Dict[str, Any]) -> "UserRecord":
+        record = cls(int(row["user_id"]), float(row["first_seen"]))
+        record.last_seen = float(row.get("last_seen") or record.first_seen)
+        record.messages = int(row.get("messages") or 0)
+        record.clean = int(row.get("clean") or 0)
+        record.flags = int(row.get("flags") or 0)
+        record.last_flag = float(row.get("last_flag") or 0.0)
+        record.dirty = False
+        return record
+
+
+class Prefilter:
+    """Решение предфильтра репутации до правил и ML"""
+    NONE = None
+    FAST_TRACK = "fast_track"  # подозрительно без проверки
+    SKIP_ML = "skip_ml"        # давний чистый автор - только правила
+
+
+class ReputationStore:
+    """
+    Репутация авторов в памяти процесса: темп сообщений, время первого
+    появления, недавние срабатывания и повторы своего сообщения подряд.
+
+    Хранится не больше maxsize авторов (LRU). Предфильтр по этим признакам:
+    подозрительны сразу новичок, вошедший в чат не больше new_user_window
+    секунд назад и выложивший ссылку в одном из первых new_user_messages
+    сообщений (участники, чей вход бот не видел, новичками не считаются), и
+    флуд одним и тем же текстом (flood_repeats повторов подряд) быстрее
+    flood_rate сообщений в минуту. Автор с
+    veteran_messages чистыми сообщениями, известный дольше veteran_age
+    секунд и без срабатываний за flag_ttl, проверяется без ML.
+
+    Изменённые записи сохраняются в хранилище каждые interval секунд (start)
+    и при остановке; при старте загружаются последние активные авторы.
+    """
+
+    RATE_WINDOW = 60.0
+
+    def __init__(self, maxsize: int = 100_000, new_user_window: float = 60.0, new_user_messages: int = 3,
+                 flood_rate: float = 10.0, flood_repeats: int = 3, veteran_messages: int = 20,
+                 veteran_age: float = 7 * 86400.0, flag_ttl: float = 30 * 86400.0):
+        self.maxsize = maxsize
+        self.new_user_window = new_user_window
+        self.new_user_messages = new_user_messages
+        self.flood_rate = flood_rate
+        self.flood_repeats = flood_repeats
+        self.veteran_messages = veteran_messages
+        self.veteran_age = veteran_age
+        self.flag_ttl = flag_ttl
+
+        self._records: "OrderedDict[int, UserRecord]" = OrderedDict()
+        # Вытесненные из LRU несохранённые записи - уйдут со следующим сохранением
+        self._evicted: List[UserRecord] = []
+        self._task: Optional[asyncio.Task] = None
+        self._save: Optional[Callable[[List[Dict[str, Any]]], Awaitable[None]]] = None
+
+        self.fast_tracked = 0
+        self.ml_skipped = 0
+        self.saved = 0
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def _get(self, user_id: int, now: float) -> UserRecord:
+        record = self._records.get(user_id)
+        if record is not None:
+            self._records.move_to_end(user_id)
+            return record
+        record = self._records[user_id] = UserRecord(user_id, now)
+        if len(self._records) > self.maxsize:
+            _, evicted = self._records.popitem(last=False)
+            if evicted.dirty:
+                self._evicted.append(evicted)
+        return record
+
+    def joined(self, user_id: int, now: Optional[float] = None):
+        """Вход в чат: "новичком" считается только автор, чей вход бот видел"""
+        now = time.time() if now is None else now
+        self._get(user_id, now).joined_at = now
+
+    def observe(self, user_id: int, text_hash: int, now: Optional[float] = None) -> UserRecord:
+        """Новое сообщение автора: темп и повторы"""
+        now = time.time() if now is None else now
+        record = self._get(user_id, now)
+        if record.messages:
+            record.rate *= math.exp(-max(0.0, now - record.last_seen) / self.RATE_WINDOW)
+        record.rate += 1.0
+        record.repeats = record.repeats + 1 if text_hash == record.last_text_hash else 0
+        record.last_text_hash = text_hash
+        record.messages += 1
+        record.last_seen = now
+        record.dirty = True
+        return record
+
+    def prefilter(self, record: UserRecord, has_link: bool, now: Optional[float] = None) -> Optional[str]:
+        now = time.time() if now is None else now
+        if (has_link and record.joined_at and now - record.joined_at <= self.new_user_window
+                and record.messages <= self.new_user_messages and record.clean == 0 and record.flags == 0):
+            self.fast_tracked += 1
+            return Prefilter.FAST_TRACK
+        if record.rate >= self.flood_rate and record.repeats >= self.flood_repeats:
+            self.fast_tracked += 1
+            return Prefilter.FAST_TRACK
+        if (record.clean >= self.veteran_messages and now - record.first_seen >= self.veteran_age
+                and (record.flags == 0 or now - record.last_flag >= self.flag_ttl)):
+            self.ml_skipped += 1
+            return Prefilter.SKIP_ML
+        return Prefilter.NONE
+
+    def record(self, record: UserRecord, suspicious: bool, now: Optional[float] = None):
+        """Итог проверки сообщения автора"""
+        if suspicious:
+            record.flags += 1
+            record.last_flag = time.time() if now is None else now
+        else:
+            record.clean += 1
+        record.dirty = True
+
+    def moderated(self, user_id: int, banned: bool):
+        """Решение модератора: пропуск снимает последнее срабатывание, бан - засчитывается"""
+        record = self._records.get(user_id)
+        if record is None:
+            return
+        if banned:
+            record.flags += 1
+            record.last_flag = time.time()
+        elif record.flags:
+            record.flags -= 1
+            record.clean += 1
+        record.dirty = True
+
+    def load(self, rows: Iterable[Dict[str, Any]]):
+        """Записи из хранилища; уже известные в памяти авторы не перезаписываются"""
+        for row in rows:
+            user_id = int(row["user_id"])
+            if user_id in self._records or len(self._records) >= self.maxsize:
+                continue
+            self._records[user_id] = UserRecord.from_row(row)
+            self._records.move_to_end(user_id, last=False)  # загруженные - старше живых
+
+    def _take_dirty(self) -> List[UserRecord]:
+        """Изменённые записи; отметка снимается до сохранения"""
+        records = self._evicted + [record for record in self._records.values() if record.dirty]
+        self._evicted = []
+        for record in records:
+            record.dirty = False
+        return records
+
+    async def flush(self):
+        if self._save is None:
+            return
+        records = self._take_dirty()
+        if not records:
+            return
+        try:
+            await self._save([record.to_row() for record in records])
+            self.saved += len(records)
+        except Exception as e:
+            logger.error(f"❌ Не удалось сохранить репутацию ({len(records)} авторов): {e}")
+            for record in records:
+                record.dirty = True
+                if self._records.get(record.user_id) is not record:
+                    self._evicted.append(record)
+
+    def start(self, save: Callable[[List[Dict[str, Any]]], Awaitable[None]], interval: float = 60.0):
+        self._save = save
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._loop(interval))
+
+    async def _loop(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            await self.flush()
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def summary(self) -> str:
+        return (
+            f"авторов {len(self)}, сразу подозрительны {self.fast_tracked}, без ML {self.ml_skipped}, "
+            f"сохранено {self.saved}"
+        )
@@ -0,0 +1,82 @@
+import asyncio
+import logging
+import signal
+from typing import Awaitable, Callable
+
+from aiohttp import web
+from aiogram import Bot
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler
+
+from bot import bot, dp, updates
+from config import (
+    RENDER_EXTERNAL_URL, WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_PORT, WEBHOOK_MAX_CONNECTIONS, UPDATE_DRAIN_TIMEOUT,
+)
+from utils.update_queue import UpdateQueue
+
+logger = logging.getLogger(__name__)
+
+
+class QueuedRequestHandler(SimpleRequestHandler):
+    """Вебхук aiogram, который не обрабатывает апдейт сам, а ставит его в UpdateQueue"""
+
+    def __init__(self, queue: UpdateQueue, **kwargs):
+        super().__init__(handle_in_background=True, **kwargs)
+        self.queue = queue
+
+    async def _handle_request_background(self, bot: Bot, request: web.Request) -> web.Response:
+        update = await request.json(loads=bot.session.json_loads)
+        if not await self.queue.put(update):
+            # Telegram повторит доставку позже - апдейт не теряется
+            return web.Response(status=503, text="Update queue is full")
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+    async def close(self):
+        # Сессию бота закрывает on_shutdown, здесь только доработка очереди
+        await self.queue.close(drain_timeout=UPDATE_DRAIN_TIMEOUT)
+
+
+async def health(request: web.Request) -> web.Response:
+    return web.Response(text=f"ok: {updates.summary()}")
+
+
+async def run_webhook(on_startup: Callable[[], Awaitable], on_shutdown: Callable[[], Awaitable]):
+    """
+    HTTP-сервер вебхука до SIGTERM/SIGINT. Вебхук при остановке не
+    снимается: апдейты, пришедшие во время деплоя, Telegram копит у себя и
+    доставляет новому экземпляру, а не отбрасывает
+    """
+    app = web.Application()
+    QueuedRequestHandler(updates, dispatcher=dp, bot=bot, secret_token=WEBHOOK_SECRET).register(app, path=WEBHOOK_PATH)
+    app.router.add_get("/", health)
+
+    await on_startup()
+    updates.start()
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "0.0.0.0", WEBHOOK_PORT).start()
+    logger.info(f"🌐 Вебхук слушает порт {WEBHOOK_PORT}, путь {WEBHOOK_PATH}")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+
+    try:
+        if RENDER_EXTERNAL_URL:
+            await bot.set_webhook(
+                url=RENDER_EXTERNAL_URL.rstrip("/") + WEBHOOK_PATH,
+                secret_token=WEBHOOK_SECRET,
+                max_connections=WEBHOOK_MAX_CONNECTIONS,
+                allowed_updates=dp.resolve_used_update_types(),
+                drop_pending_updates=False,  # накопленное за время простоя обрабатываем
+            )
+            info = await bot.get_webhook_info()
+            logger.info(f"✅ Вебхук установлен, ожидают доставки: {info.pending_update_count}")
+        else:
+            logger.warning("RENDER_EXTERNAL_URL не задан - вебхук в Telegram не регистрируется (локальный режим)")
+        await stop.wait()
+    finally:
+        # Сначала перестаём принимать запросы и дорабатываем очередь, потом останавливаем остальное
+        await runner.cleanup()
+        await on_shutdown()